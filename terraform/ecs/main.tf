@@ -66,6 +66,81 @@ resource "aws_iam_role_policy" "s3_read_policy" {
           var.s3_bucket_arn,
           "${var.s3_bucket_arn}/*"
         ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject"
+        ]
+        Resource = [
+          "${var.s3_bucket_arn}/_ingestion_status/*"
+        ]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "page_images_policy" {
+  name = "ecs-task-page-images"
+  role = aws_iam_role.ecs_task_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:GetObject"
+        ]
+        Resource = [
+          "${var.page_images_bucket_arn}/*"
+        ]
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "sqs_consume_policy" {
+  name = "ecs-task-sqs-consume"
+  role = aws_iam_role.ecs_task_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:ChangeMessageVisibility",
+          "sqs:GetQueueAttributes"
+        ]
+        Resource = var.job_queue_arn
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy" "efs_mount_policy" {
+  name = "ecs-task-efs-embedding-cache"
+  role = aws_iam_role.ecs_task_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "elasticfilesystem:ClientMount",
+          "elasticfilesystem:ClientWrite"
+        ]
+        Resource = var.efs_file_system_arn
+        Condition = {
+          StringEquals = {
+            "elasticfilesystem:AccessPointArn" = var.efs_access_point_arn
+          }
+        }
       }
     ]
   })
@@ -86,8 +161,57 @@ resource "aws_cloudwatch_log_group" "ecs_logs" {
 }
 
 ##########################
-# ECS Task definition
+# ECS Task definitions
 ##########################
+locals {
+  # One container definition for both entry points; only PIPELINE_MODE differs
+  container_definition = {
+    name      = var.container_name
+    image     = var.container_image
+    essential = true
+    portMappings = [
+      {
+        containerPort = 8080
+        hostPort      = 8080
+      }
+    ],
+    environment = [
+      {
+        name  = "S3_BUCKET"
+        value = "" # will be overridden at runtime by Lambda
+      },
+      {
+        name  = "S3_KEY"
+        value = "" # will be overridden too
+      },
+      {
+        name  = "JOB_QUEUE_URL"
+        value = var.job_queue_url
+      },
+      {
+        name  = "PAGE_IMAGE_BUCKET"
+        value = var.page_images_bucket_name
+      }
+    ],
+    mountPoints = [
+      {
+        sourceVolume  = "embedding-cache"
+        containerPath = "/mnt/embedding-cache" # embedding_cache.path in config.yaml
+        readOnly      = false
+      }
+    ],
+    logConfiguration = {
+      logDriver = "awslogs",
+      options = {
+        awslogs-group         = "/ecs/colpali-pipeline"
+        awslogs-region        = var.region
+        awslogs-stream-prefix = "ecs"
+      }
+    }
+  }
+}
+
+# One task per upload, launched by the Lambda (dispatch_mode = "ecs")
 resource "aws_ecs_task_definition" "colpali_pipeline" {
   family                   = "terraform_colpali_pipeline"
   requires_compatibilities = ["FARGATE"]
@@ -98,38 +222,219 @@ resource "aws_ecs_task_definition" "colpali_pipeline" {
   task_role_arn            = aws_iam_role.ecs_task_role.arn
 
   container_definitions = jsonencode([
-    {
-      name      = var.container_name
-      image     = var.container_image
-      essential = true
-      portMappings = [
-        {
-          containerPort = 8080
-          hostPort      = 8080
-        }
-      ],
-      environment = [
-        {
-          name  = "S3_BUCKET"
-          value = "" # will be overridden at runtime by Lambda
-        },
+    merge(local.container_definition, {
+      environment = concat(local.container_definition.environment, [
         {
-          name  = "S3_KEY"
-          value = "" # will be overridden too
-        }
-      ],
-      logConfiguration = {
-        logDriver = "awslogs",
-        options = {
-          awslogs-group         = "/ecs/colpali-pipeline"
-          awslogs-region        = var.region
-          awslogs-stream-prefix = "ecs"
+          name  = "PIPELINE_MODE"
+          value = "single"
         }
+      ])
+    })
+  ])
+
+  ephemeral_storage {
+    size_in_gib = 50
+  }
+
+  volume {
+    name = "embedding-cache"
+
+    efs_volume_configuration {
+      file_system_id     = var.efs_file_system_id
+      transit_encryption = "ENABLED"
+
+      authorization_config {
+        access_point_id = var.efs_access_point_id
+        iam             = "ENABLED"
       }
     }
+  }
+}
+
+# Long-running workers consuming the job queue (dispatch_mode = "sqs")
+resource "aws_ecs_task_definition" "colpali_worker" {
+  count = var.worker_enabled ? 1 : 0
+
+  family                   = "terraform_colpali_worker"
+  requires_compatibilities = ["FARGATE"]
+  network_mode             = "awsvpc"
+  cpu                      = "4096"
+  memory                   = "16384"
+  execution_role_arn       = aws_iam_role.ecs_task_execution_role.arn
+  task_role_arn            = aws_iam_role.ecs_task_role.arn
+
+  container_definitions = jsonencode([
+    merge(local.container_definition, {
+      environment = concat(local.container_definition.environment, [
+        {
+          name  = "PIPELINE_MODE"
+          value = "worker"
+        }
+      ])
+      # Time to finish the documents in flight after SIGTERM on scale-in
+      stopTimeout = 120
+    })
   ])
 
   ephemeral_storage {
     size_in_gib = 50
   }
+
+  volume {
+    name = "embedding-cache"
+
+    efs_volume_configuration {
+      file_system_id     = var.efs_file_system_id
+      transit_encryption = "ENABLED"
+
+      authorization_config {
+        access_point_id = var.efs_access_point_id
+        iam             = "ENABLED"
+      }
+    }
+  }
+}
+
+##########################
+# Worker service, scaled on queue depth
+##########################
+resource "aws_ecs_service" "colpali_worker" {
+  count = var.worker_enabled ? 1 : 0
+
+  name            = "colpali-ingestion-worker"
+  cluster         = aws_ecs_cluster.ecs_cluster.id
+  task_definition = aws_ecs_task_definition.colpali_worker[0].arn
+  launch_type     = "FARGATE"
+  desired_count   = 0
+
+  network_configuration {
+    subnets          = [var.private_subnet_id]
+    security_groups  = [var.security_group_id]
+    assign_public_ip = false
+  }
+
+  # Autoscaling owns the task count
+  lifecycle {
+    ignore_changes = [desired_count]
+  }
+}
+
+resource "aws_appautoscaling_target" "colpali_worker" {
+  count = var.worker_enabled ? 1 : 0
+
+  service_namespace  = "ecs"
+  resource_id        = "service/${aws_ecs_cluster.ecs_cluster.name}/${aws_ecs_service.colpali_worker[0].name}"
+  scalable_dimension = "ecs:service:DesiredCount"
+  min_capacity       = 0
+  max_capacity       = var.worker_max_count
+}
+
+# Add workers while jobs are waiting
+resource "aws_appautoscaling_policy" "worker_scale_out" {
+  count = var.worker_enabled ? 1 : 0
+
+  name               = "colpali-worker-scale-out"
+  service_namespace  = aws_appautoscaling_target.colpali_worker[0].service_namespace
+  resource_id        = aws_appautoscaling_target.colpali_worker[0].resource_id
+  scalable_dimension = aws_appautoscaling_target.colpali_worker[0].scalable_dimension
+  policy_type        = "StepScaling"
+
+  step_scaling_policy_configuration {
+    adjustment_type         = "ChangeInCapacity"
+    cooldown                = 120
+    metric_aggregation_type = "Maximum"
+
+    step_adjustment {
+      metric_interval_lower_bound = 0
+      metric_interval_upper_bound = 10
+      scaling_adjustment          = 1
+    }
+
+    step_adjustment {
+      metric_interval_lower_bound = 10
+      metric_interval_upper_bound = 50
+      scaling_adjustment          = 2
+    }
+
+    step_adjustment {
+      metric_interval_lower_bound = 50
+      scaling_adjustment          = 4
+    }
+  }
+}
+
+resource "aws_cloudwatch_metric_alarm" "queue_backlog" {
+  count = var.worker_enabled ? 1 : 0
+
+  alarm_name          = "colpali-ingestion-queue-backlog"
+  namespace           = "AWS/SQS"
+  metric_name         = "ApproximateNumberOfMessagesVisible"
+  dimensions          = { QueueName = var.job_queue_name }
+  statistic           = "Maximum"
+  period              = 60
+  evaluation_periods  = 1
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  threshold           = 1
+  alarm_actions       = [aws_appautoscaling_policy.worker_scale_out[0].arn]
+}
+
+# Stop every worker once nothing has been waiting or in flight for a while
+resource "aws_appautoscaling_policy" "worker_scale_in" {
+  count = var.worker_enabled ? 1 : 0
+
+  name               = "colpali-worker-scale-in"
+  service_namespace  = aws_appautoscaling_target.colpali_worker[0].service_namespace
+  resource_id        = aws_appautoscaling_target.colpali_worker[0].resource_id
+  scalable_dimension = aws_appautoscaling_target.colpali_worker[0].scalable_dimension
+  policy_type        = "StepScaling"
+
+  step_scaling_policy_configuration {
+    adjustment_type         = "ExactCapacity"
+    cooldown                = 300
+    metric_aggregation_type = "Maximum"
+
+    step_adjustment {
+      metric_interval_upper_bound = 0
+      scaling_adjustment          = 0
+    }
+  }
+}
+
+resource "aws_cloudwatch_metric_alarm" "queue_idle" {
+  count = var.worker_enabled ? 1 : 0
+
+  alarm_name          = "colpali-ingestion-queue-idle"
+  evaluation_periods  = 15
+  comparison_operator = "LessThanOrEqualToThreshold"
+  threshold           = 0
+  alarm_actions       = [aws_appautoscaling_policy.worker_scale_in[0].arn]
+
+  metric_query {
+    id          = "jobs"
+    expression  = "visible + in_flight"
+    label       = "Jobs waiting or in flight"
+    return_data = true
+  }
+
+  metric_query {
+    id = "visible"
+    metric {
+      namespace   = "AWS/SQS"
+      metric_name = "ApproximateNumberOfMessagesVisible"
+      dimensions  = { QueueName = var.job_queue_name }
+      stat        = "Maximum"
+      period      = 60
+    }
+  }
+
+  metric_query {
+    id = "in_flight"
+    metric {
+      namespace   = "AWS/SQS"
+      metric_name = "ApproximateNumberOfMessagesNotVisible"
+      dimensions  = { QueueName = var.job_queue_name }
+      stat        = "Maximum"
+      period      = 60
+    }
+  }
 }
@@ -9,3 +9,7 @@ output "ecs_task_definition_arn" {
 output "ecs_container_name" {
   value = var.container_name
 }
+
+output "ecs_worker_service_name" {
+  value = var.worker_enabled ? aws_ecs_service.colpali_worker[0].name : null
+}
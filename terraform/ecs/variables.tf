@@ -21,4 +21,71 @@ variable "s3_bucket_name" {
 variable "s3_bucket_arn" {
   type        = string
   description = "The ARN of the S3 bucket"
-}
\ No newline at end of file
+}
+
+variable "job_queue_url" {
+  type        = string
+  description = "URL of the ingestion job queue consumed in worker mode"
+}
+
+variable "job_queue_arn" {
+  type        = string
+  description = "ARN of the ingestion job queue consumed in worker mode"
+}
+
+variable "page_images_bucket_name" {
+  type        = string
+  description = "Bucket the page image store writes full page images to"
+}
+
+variable "page_images_bucket_arn" {
+  type        = string
+  description = "ARN of the page image bucket"
+}
+
+variable "job_queue_name" {
+  type        = string
+  description = "Name of the ingestion job queue, whose depth scales the workers"
+}
+
+variable "private_subnet_id" {
+  type        = string
+  description = "Subnet the worker service runs in"
+}
+
+variable "security_group_id" {
+  type        = string
+  description = "Security group of the worker tasks"
+}
+
+variable "worker_enabled" {
+  type        = bool
+  description = "Deploy the queue-consuming worker service (needed when the Lambda dispatches to SQS)"
+  default     = false
+}
+
+variable "worker_max_count" {
+  type        = number
+  description = "Upper bound of worker tasks the queue depth can scale to"
+  default     = 4
+}
+
+variable "efs_file_system_id" {
+  type        = string
+  description = "EFS file system holding the embedding cache shared by all tasks"
+}
+
+variable "efs_file_system_arn" {
+  type        = string
+  description = "ARN of the embedding cache file system"
+}
+
+variable "efs_access_point_id" {
+  type        = string
+  description = "Access point the tasks mount the embedding cache through"
+}
+
+variable "efs_access_point_arn" {
+  type        = string
+  description = "ARN of the embedding cache access point"
+}
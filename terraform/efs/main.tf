@@ -0,0 +1,56 @@
+##########################
+# Embedding cache file system
+##########################
+resource "aws_efs_file_system" "embedding_cache" {
+  creation_token   = "gen-ai-colpali-embedding-cache"
+  encrypted        = true
+  performance_mode = "generalPurpose"
+  throughput_mode  = "elastic"
+
+  lifecycle_policy {
+    transition_to_ia = "AFTER_30_DAYS"
+  }
+
+  tags = {
+    Name = "terraform-embedding-cache"
+  }
+}
+
+resource "aws_efs_access_point" "embedding_cache" {
+  file_system_id = aws_efs_file_system.embedding_cache.id
+
+  root_directory {
+    path = "/embedding-cache"
+    creation_info {
+      owner_uid   = 0
+      owner_gid   = 0
+      permissions = "0755"
+    }
+  }
+}
+
+##########################
+# Mount target reachable from the ECS tasks
+##########################
+resource "aws_security_group" "efs_sg" {
+  name        = "efs-sg"
+  description = "Allow NFS from ECS tasks"
+  vpc_id      = var.vpc_id
+
+  ingress {
+    from_port       = 2049
+    to_port         = 2049
+    protocol        = "tcp"
+    security_groups = [var.ecs_security_group_id]
+  }
+
+  tags = {
+    Name = "terraform-efs-sg"
+  }
+}
+
+resource "aws_efs_mount_target" "private" {
+  file_system_id  = aws_efs_file_system.embedding_cache.id
+  subnet_id       = var.private_subnet_id
+  security_groups = [aws_security_group.efs_sg.id]
+}
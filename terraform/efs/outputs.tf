@@ -0,0 +1,15 @@
+output "file_system_id" {
+  value = aws_efs_file_system.embedding_cache.id
+}
+
+output "file_system_arn" {
+  value = aws_efs_file_system.embedding_cache.arn
+}
+
+output "access_point_id" {
+  value = aws_efs_access_point.embedding_cache.id
+}
+
+output "access_point_arn" {
+  value = aws_efs_access_point.embedding_cache.arn
+}
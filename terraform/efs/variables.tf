@@ -0,0 +1,14 @@
+variable "vpc_id" {
+  type        = string
+  description = "VPC of the ECS tasks"
+}
+
+variable "private_subnet_id" {
+  type        = string
+  description = "Subnet the ECS tasks run in"
+}
+
+variable "ecs_security_group_id" {
+  type        = string
+  description = "Security group of the ECS tasks allowed to mount the file system"
+}
@@ -1,7 +1,220 @@
 import os
+import re
 import json
+import zlib
 import boto3
 
+STATUS_PREFIX = os.environ.get("STATUS_PREFIX", "_ingestion_status")
+
+# Page-tree nodes: << /Type /Pages ... /Count N >>; only the root has no /Parent
+PAGES_TYPE_PATTERN = re.compile(rb"/Type\s*/Pages\b")
+COUNT_PATTERN = re.compile(rb"/Count\s+(\d+)")
+PARENT_PATTERN = re.compile(rb"/Parent\b")
+# Linearized files announce the page count in their first object: << /Linearized 1 ... /N 2000 >>
+LINEARIZED_PATTERN = re.compile(rb"/Linearized\s[^>]*?/N\s+(\d+)")
+# Compressed object streams, where PDF 1.5+ files usually keep the page tree
+OBJECT_STREAM_PATTERN = re.compile(rb"<<[^>]*?/Type\s*/ObjStm[^>]*>>\s*stream\r?\n(.*?)endstream", re.S)
+
+HEAD_BYTES = 64 * 1024
+TAIL_BYTES = 1024 * 1024
+SCAN_CHUNK_BYTES = 8 * 1024 * 1024
+SCAN_OVERLAP_BYTES = 64 * 1024
+MAX_SCAN_BYTES = 64 * 1024 * 1024
+
+
+def _read_range(s3, bucket, key, start, end):
+    return s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")["Body"].read()
+
+
+def _top_level_entries(data, position, limit=64 * 1024):
+    """
+    Top-level entries of the << ... >> dictionary around position, with nested dictionaries
+    left out, or None when the dictionary is cut off by the bytes that were read.
+    """
+    start, depth = position, 0
+    while True:
+        start -= 1
+        if start < 0 or position - start > limit:
+            return None
+        token = data[start:start + 2]
+        if token == b">>":
+            depth += 1
+            start -= 1
+        elif token == b"<<":
+            if depth == 0:
+                break
+            depth -= 1
+            start -= 1
+
+    entries, depth, index = bytearray(), 0, start
+    while index < len(data) and index - start <= limit:
+        token = data[index:index + 2]
+        if token == b"<<":
+            depth += 1
+            index += 2
+        elif token == b">>":
+            depth -= 1
+            index += 2
+            if depth == 0:
+                return bytes(entries)
+        else:
+            if depth == 1:
+                entries.append(data[index])
+            index += 1
+    return None
+
+
+def _root_page_counts(data):
+    counts = []
+    for match in PAGES_TYPE_PATTERN.finditer(data):
+        entries = _top_level_entries(data, match.start())
+        # Intermediate nodes only count their own subtree; skip them rather than guess low
+        if entries is None or PARENT_PATTERN.search(entries):
+            continue
+        count = COUNT_PATTERN.search(entries)
+        if count:
+            counts.append(int(count.group(1)))
+    return counts
+
+
+def _find_page_count(data):
+    """/Count of the page-tree root in data (or its object streams), or None when the root is not in it."""
+    counts = _root_page_counts(data)
+    for stream in OBJECT_STREAM_PATTERN.findall(data):
+        try:
+            inflated = zlib.decompress(stream)
+        except zlib.error:
+            continue
+        counts += _root_page_counts(inflated)
+    # Incremental updates append newer versions of the root after the old ones
+    return counts[-1] if counts else None
+
+
+def get_page_count(s3, bucket, key):
+    """Read the page count with ranged GETs instead of downloading the whole PDF."""
+    size = s3.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+    head = _read_range(s3, bucket, key, 0, min(HEAD_BYTES, size) - 1)
+    match = LINEARIZED_PATTERN.search(head)
+    if match:
+        return int(match.group(1))
+
+    tail = _read_range(s3, bucket, key, max(size - TAIL_BYTES, 0), size - 1)
+    page_count = _find_page_count(tail)
+    if page_count:
+        return page_count
+
+    # Fall back to scanning the file front to back, chunk by chunk
+    start = 0
+    while start < min(size, MAX_SCAN_BYTES):
+        end = min(start + SCAN_CHUNK_BYTES, size) - 1
+        page_count = _find_page_count(_read_range(s3, bucket, key, start, end))
+        if page_count:
+            return page_count
+        start = end + 1 - SCAN_OVERLAP_BYTES
+
+    return None
+
+
+def plan_shards(page_count):
+    """Split the document into page ranges, or return None when it is small enough for one task."""
+    threshold = int(os.environ.get("SHARD_PAGE_THRESHOLD", "300"))
+    pages_per_shard = int(os.environ.get("PAGES_PER_SHARD", "100"))
+
+    if not page_count or page_count <= threshold:
+        return None
+
+    return [
+        (start, min(start + pages_per_shard - 1, page_count))
+        for start in range(1, page_count + 1, pages_per_shard)
+    ]
+
+
+def write_manifest(s3, bucket, key, page_count, shards):
+    """Record the expected shards so the last one to finish can mark the document complete."""
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{STATUS_PREFIX}/{key}/manifest.json",
+        Body=json.dumps({
+            "page_count": page_count,
+            "shards": [{"page_start": start, "page_end": end} for start, end in shards],
+        }),
+        ContentType="application/json"
+    )
+
+
+def enqueue_job(bucket_name, object_key, page_range=None):
+    message = {"bucket": bucket_name, "key": object_key}
+    if page_range:
+        message["page_start"], message["page_end"] = page_range
+
+    response = boto3.client("sqs").send_message(
+        QueueUrl=os.environ["JOB_QUEUE_URL"],
+        MessageBody=json.dumps(message)
+    )
+    print("Ingestion job enqueued:", response.get("MessageId"), message)
+
+
+def run_ecs_task(ecs, bucket_name, object_key, page_range=None):
+    # Create unique identifier for this ECS task
+    started_by = f"{bucket_name}/{object_key}"
+    environment = [
+        {"name": "S3_BUCKET", "value": bucket_name},
+        {"name": "S3_KEY", "value": object_key}
+    ]
+    if page_range:
+        started_by = f"{started_by}#{page_range[0]}-{page_range[1]}"
+        environment += [
+            {"name": "PAGE_START", "value": str(page_range[0])},
+            {"name": "PAGE_END", "value": str(page_range[1])}
+        ]
+
+    # List tasks started with this identifier (no other filters!)
+    existing_task_arns = ecs.list_tasks(
+        cluster=os.environ["ECS_CLUSTER"],
+        startedBy=started_by
+    ).get("taskArns", [])
+
+    if existing_task_arns:
+        # Describe tasks to check if any are RUNNING
+        tasks = ecs.describe_tasks(
+            cluster=os.environ["ECS_CLUSTER"],
+            tasks=existing_task_arns
+        ).get("tasks", [])
+
+        running_tasks = [t for t in tasks if t.get("lastStatus") == "RUNNING"]
+
+        if running_tasks:
+            print(f"ECS task already running for {started_by}. Skipping new launch.")
+            return False
+
+    # Launch a new ECS task
+    response = ecs.run_task(
+        cluster=os.environ["ECS_CLUSTER"],
+        launchType="FARGATE",
+        taskDefinition=os.environ["ECS_TASK_DEFINITION"],
+        startedBy=started_by,
+        networkConfiguration={
+            "awsvpcConfiguration": {
+                "subnets": json.loads(os.environ["SUBNET_IDS"]),
+                "securityGroups": json.loads(os.environ["SECURITY_GROUP_IDS"]),
+                "assignPublicIp": "DISABLED"
+            }
+        },
+        overrides={
+            "containerOverrides": [
+                {
+                    "name": os.environ["ECS_CONTAINER_NAME"],
+                    "environment": environment
+                }
+            ]
+        }
+    )
+
+    print("ECS task started:", response)
+    return True
+
+
 def lambda_handler(event, context):
     print("Received event:", json.dumps(event))
 
@@ -10,64 +223,50 @@ def lambda_handler(event, context):
         bucket_name = event["detail"]["bucket"]["name"]
         object_key = event["detail"]["object"]["key"]
 
-        # Create unique identifier for this ECS task
-        started_by = f"{bucket_name}/{object_key}"
+        # Shard status markers live in the same bucket; they are not documents
+        if object_key.startswith(f"{STATUS_PREFIX}/"):
+            print(f"Ignoring status object {object_key}.")
+            return {
+                "statusCode": 200,
+                "body": "Status object ignored"
+            }
 
-        ecs = boto3.client("ecs")
+        # Split very large documents into page ranges processed in parallel
+        s3 = boto3.client("s3")
+        shards = None
+        try:
+            page_count = get_page_count(s3, bucket_name, object_key)
+            print(f"Page count for {object_key}: {page_count}")
+            shards = plan_shards(page_count)
+        except Exception as e:
+            print(f"Could not determine page count, processing as a single document: {e}")
 
-        # List tasks started with this identifier (no other filters!)
-        existing_task_arns = ecs.list_tasks(
-            cluster=os.environ["ECS_CLUSTER"],
-            startedBy=started_by
-        ).get("taskArns", [])
-
-        if existing_task_arns:
-            # Describe tasks to check if any are RUNNING
-            tasks = ecs.describe_tasks(
-                cluster=os.environ["ECS_CLUSTER"],
-                tasks=existing_task_arns
-            ).get("tasks", [])
-
-            running_tasks = [t for t in tasks if t.get("lastStatus") == "RUNNING"]
-
-            if running_tasks:
-                print(f"ECS task already running for {started_by}. Skipping new launch.")
-                return {
-                    "statusCode": 200,
-                    "body": "Duplicate event detected. ECS task already running."
-                }
+        if shards:
+            write_manifest(s3, bucket_name, object_key, page_count, shards)
+            print(f"Fanning out {object_key} into {len(shards)} shards.")
 
-        # Launch a new ECS task
-        response = ecs.run_task(
-            cluster=os.environ["ECS_CLUSTER"],
-            launchType="FARGATE",
-            taskDefinition=os.environ["ECS_TASK_DEFINITION"],
-            startedBy=started_by,
-            networkConfiguration={
-                "awsvpcConfiguration": {
-                    "subnets": json.loads(os.environ["SUBNET_IDS"]),
-                    "securityGroups": json.loads(os.environ["SECURITY_GROUP_IDS"]),
-                    "assignPublicIp": "DISABLED"
-                }
-            },
-            overrides={
-                "containerOverrides": [
-                    {
-                        "name": os.environ["ECS_CONTAINER_NAME"],
-                        "environment": [
-                            {"name": "S3_BUCKET", "value": bucket_name},
-                            {"name": "S3_KEY", "value": object_key}
-                        ]
-                    }
-                ]
+        # Hand the document to the long-running ingestion workers instead of starting a task
+        if os.environ.get("DISPATCH_MODE", "ecs") == "sqs":
+            for page_range in shards or [None]:
+                enqueue_job(bucket_name, object_key, page_range)
+
+            return {
+                "statusCode": 200,
+                "body": f"{len(shards or [None])} ingestion job(s) enqueued"
             }
-        )
 
-        print("ECS task started:", response)
+        ecs = boto3.client("ecs")
+        launched = sum(run_ecs_task(ecs, bucket_name, object_key, page_range) for page_range in shards or [None])
+
+        if not launched:
+            return {
+                "statusCode": 200,
+                "body": "Duplicate event detected. ECS task already running."
+            }
 
         return {
             "statusCode": 200,
-            "body": "ECS task launched"
+            "body": f"{launched} ECS task(s) launched"
         }
 
     except Exception as e:
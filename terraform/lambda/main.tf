@@ -54,6 +54,53 @@ resource "aws_iam_role_policy_attachment" "ecs_policy_attach" {
   policy_arn = aws_iam_policy.ecs_run_task.arn
 }
 
+# Enqueue ingestion jobs
+resource "aws_iam_policy" "sqs_send_message" {
+  name = "LambdaSqsSendMessagePolicy"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect   = "Allow",
+        Action   = ["sqs:SendMessage"],
+        Resource = var.job_queue_arn
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "sqs_policy_attach" {
+  role       = aws_iam_role.lambda_exec.name
+  policy_arn = aws_iam_policy.sqs_send_message.arn
+}
+
+# Count pages with ranged reads and record the shard manifest
+resource "aws_iam_policy" "s3_shard_planning" {
+  name = "LambdaS3ShardPlanningPolicy"
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect   = "Allow",
+        Action   = ["s3:GetObject"],
+        Resource = "${var.s3_bucket_arn}/*"
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["s3:PutObject"],
+        Resource = "${var.s3_bucket_arn}/_ingestion_status/*"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "s3_shard_planning_attach" {
+  role       = aws_iam_role.lambda_exec.name
+  policy_arn = aws_iam_policy.s3_shard_planning.arn
+}
+
 # Lambda logging (to send logs to CloudWatch)
 resource "aws_iam_policy" "lambda_logging" {
   name = "lambda-logging"
@@ -100,14 +147,22 @@ resource "aws_lambda_function" "trigger_ecs" {
   filename         = data.archive_file.lambda_zip.output_path
   source_code_hash = data.archive_file.lambda_zip.output_base64sha256
   # source_code_hash = filebase64sha256("lambda_function.zip")
+  # Counting pages reads the PDF's trailer and page tree from S3 before dispatching shards
+  timeout     = var.timeout
+  memory_size = var.memory_size
 
   environment {
     variables = {
-      SUBNET_IDS          = jsonencode([var.private_subnet_id])
-      SECURITY_GROUP_IDS  = jsonencode([var.security_group_id])
-      ECS_CLUSTER         = var.ecs_cluster
-      ECS_TASK_DEFINITION = var.ecs_task_definition
-      ECS_CONTAINER_NAME  = var.ecs_container_name
+      SUBNET_IDS           = jsonencode([var.private_subnet_id])
+      SECURITY_GROUP_IDS   = jsonencode([var.security_group_id])
+      ECS_CLUSTER          = var.ecs_cluster
+      ECS_TASK_DEFINITION  = var.ecs_task_definition
+      ECS_CONTAINER_NAME   = var.ecs_container_name
+      DISPATCH_MODE        = var.dispatch_mode
+      JOB_QUEUE_URL        = var.job_queue_url
+      SHARD_PAGE_THRESHOLD = tostring(var.shard_page_threshold)
+      PAGES_PER_SHARD      = tostring(var.pages_per_shard)
+      STATUS_PREFIX        = "_ingestion_status"
     }
   }
 }
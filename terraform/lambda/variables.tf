@@ -27,3 +27,48 @@ variable "ecs_container_name" {
   type        = string
   description = "Docker name to use for ECS task"
 }
+
+variable "dispatch_mode" {
+  type        = string
+  description = "ecs to launch one task per upload, sqs to enqueue a job for the ingestion workers"
+  default     = "ecs"
+}
+
+variable "job_queue_url" {
+  type        = string
+  description = "URL of the ingestion job queue"
+}
+
+variable "job_queue_arn" {
+  type        = string
+  description = "ARN of the ingestion job queue"
+}
+
+variable "s3_bucket_arn" {
+  type        = string
+  description = "ARN of the upload bucket, read to count pages and written for shard status"
+}
+
+variable "shard_page_threshold" {
+  type        = number
+  description = "Documents with more pages than this are split into page-range shards"
+  default     = 300
+}
+
+variable "pages_per_shard" {
+  type        = number
+  description = "Pages processed by each shard"
+  default     = 100
+}
+
+variable "timeout" {
+  type        = number
+  description = "Seconds the trigger may run: page counting and shard dispatch of large PDFs outlast the 3 s default"
+  default     = 90
+}
+
+variable "memory_size" {
+  type        = number
+  description = "Memory of the trigger in MB (CPU and network bandwidth scale with it)"
+  default     = 512
+}
@@ -47,12 +47,36 @@ module "ecr" {
   source = "./ecr"
 }
 
+module "sqs" {
+  source = "./sqs"
+}
+
+module "efs" {
+  source                = "./efs"
+  vpc_id                = module.network.vpc_id
+  private_subnet_id     = module.network.private_subnet_id
+  ecs_security_group_id = module.network.ecs_security_group_id
+}
+
 module "ecs" {
-  source          = "./ecs"
-  container_name  = "your-container-name"
-  container_image = "${module.ecr.repository_url}:latest"
-  s3_bucket_name  = module.s3.gen_ai_colpali_bucket_name
-  s3_bucket_arn   = module.s3.gen_ai_colpali_bucket_arn
+  source                  = "./ecs"
+  container_name          = "your-container-name"
+  container_image         = "${module.ecr.repository_url}:latest"
+  s3_bucket_name          = module.s3.gen_ai_colpali_bucket_name
+  s3_bucket_arn           = module.s3.gen_ai_colpali_bucket_arn
+  page_images_bucket_name = module.s3.page_images_bucket_name
+  page_images_bucket_arn  = module.s3.page_images_bucket_arn
+  job_queue_url           = module.sqs.queue_url
+  job_queue_arn           = module.sqs.queue_arn
+  job_queue_name          = module.sqs.queue_name
+  private_subnet_id       = module.network.private_subnet_id
+  security_group_id       = module.network.ecs_security_group_id
+  efs_file_system_id      = module.efs.file_system_id
+  efs_file_system_arn     = module.efs.file_system_arn
+  efs_access_point_id     = module.efs.access_point_id
+  efs_access_point_arn    = module.efs.access_point_arn
+  worker_enabled          = var.dispatch_mode == "sqs"
+  worker_max_count        = var.worker_max_count
 }
 
 module "eventbridge" {
@@ -70,4 +94,8 @@ module "lambda" {
   ecs_cluster         = module.ecs.ecs_cluster_name
   ecs_task_definition = module.ecs.ecs_task_definition_arn
   ecs_container_name  = module.ecs.ecs_container_name
+  dispatch_mode       = var.dispatch_mode
+  s3_bucket_arn       = module.s3.gen_ai_colpali_bucket_arn
+  job_queue_url       = module.sqs.queue_url
+  job_queue_arn       = module.sqs.queue_arn
 }
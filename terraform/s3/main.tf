@@ -14,6 +14,23 @@ resource "aws_s3_bucket_public_access_block" "block_public_access" {
   restrict_public_buckets = true
 }
 
+# Full-resolution page images referenced from Weaviate; a separate bucket so they never trigger ingestion
+resource "aws_s3_bucket" "page_images_bucket" {
+  bucket = "name-of-your-page-image-bucket"
+
+  tags = {
+    Name = "terraform-page-images-bucket"
+  }
+}
+
+resource "aws_s3_bucket_public_access_block" "page_images_block_public_access" {
+  bucket                  = aws_s3_bucket.page_images_bucket.id
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
 resource "aws_s3_bucket_notification" "eventbridge" {
   bucket = aws_s3_bucket.gen_ai_colpali_bucket.id
 
@@ -4,4 +4,12 @@ output "gen_ai_colpali_bucket_name" {
 
 output "gen_ai_colpali_bucket_arn" {
   value = aws_s3_bucket.gen_ai_colpali_bucket.arn
-}
\ No newline at end of file
+}
+
+output "page_images_bucket_name" {
+  value = aws_s3_bucket.page_images_bucket.id
+}
+
+output "page_images_bucket_arn" {
+  value = aws_s3_bucket.page_images_bucket.arn
+}
@@ -0,0 +1,19 @@
+resource "aws_sqs_queue" "ingestion_jobs_dlq" {
+  name                      = "gen-ai-colpali-ingestion-jobs-dlq"
+  message_retention_seconds = 1209600 # 14 days
+}
+
+resource "aws_sqs_queue" "ingestion_jobs" {
+  name                       = "gen-ai-colpali-ingestion-jobs"
+  visibility_timeout_seconds = var.visibility_timeout
+  receive_wait_time_seconds  = 20
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.ingestion_jobs_dlq.arn
+    maxReceiveCount     = var.max_receive_count
+  })
+
+  tags = {
+    Name = "terraform-ingestion-jobs"
+  }
+}
@@ -0,0 +1,11 @@
+output "queue_url" {
+  value = aws_sqs_queue.ingestion_jobs.url
+}
+
+output "queue_arn" {
+  value = aws_sqs_queue.ingestion_jobs.arn
+}
+
+output "queue_name" {
+  value = aws_sqs_queue.ingestion_jobs.name
+}
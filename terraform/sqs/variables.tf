@@ -0,0 +1,11 @@
+variable "visibility_timeout" {
+  type        = number
+  description = "Seconds a received job stays hidden; workers extend it while a document is processed"
+  default     = 900
+}
+
+variable "max_receive_count" {
+  type        = number
+  description = "Deliveries before a failing job is moved to the dead-letter queue"
+  default     = 3
+}
@@ -14,3 +14,16 @@ variable "instance_type" {
   type        = string
   default     = "t2.micro"
 }
+
+
+variable "dispatch_mode" {
+  description = "How the Lambda hands uploads to the pipeline: ecs (one task per upload) or sqs (enqueue for workers)"
+  type        = string
+  default     = "ecs"
+}
+
+variable "worker_max_count" {
+  description = "Maximum number of ingestion worker tasks when dispatch_mode is sqs"
+  type        = number
+  default     = 4
+}
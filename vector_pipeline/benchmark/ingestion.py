@@ -0,0 +1,296 @@
+"""
+Offline ingestion benchmark.
+
+Generates synthetic PDFs and runs them through the real ingestion code (PDFImageConverter,
+DocumentIngestor, IngestionWorker, WeaviateCollectionManager and its batch writer) with
+stand-ins for the expensive or remote parts: a stub model of tunable latency (or a real,
+ideally tiny, checkpoint), a directory-backed S3 and an in-memory Weaviate (or a local
+Weaviate container). Every scenario runs in a fresh process so peak RSS is per scenario.
+
+Run from the vector_pipeline directory:
+    python -m benchmark.ingestion --pages 40 --documents 2 --workers 1,2,4
+    python -m benchmark.ingestion --baseline benchmark/baselines/ingestion.json --update-baseline
+    python -m benchmark.ingestion --baseline benchmark/baselines/ingestion.json  # exits 1 on regression
+"""
+import argparse
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+import boto3
+from util.logging_config import setup_logging
+from util.load_config import load_config
+from util.metrics import metrics
+from benchmark.synthetic_pdf import generate_pdf
+from benchmark.stubs import StubColqwen, LocalS3Client, InMemoryWeaviateClient
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "benchmark"
+STAGES = [
+    "download_seconds",
+    "download_wait_seconds",
+    "title_extraction_seconds",
+    "fingerprint_seconds",
+    "render_page_seconds",
+    "encode_page_seconds",
+    "image_store_write_seconds",
+    "embed_page_seconds",
+    "compress_page_seconds",
+    "weaviate_flush_seconds",
+    "page_seconds",
+    "document_seconds",
+]
+
+
+def build_config(base_config: dict, args, workers: int, work_dir: str) -> dict:
+    """Point the pipeline config at the benchmark's stand-ins."""
+    config = copy.deepcopy(base_config)
+    parser_config = config["pdf_parser"]
+    parser_config.setdefault("rasterization", {})["workers"] = workers
+    parser_config.setdefault("embedding_cache", {})["enabled"] = False
+    if args.model_name:
+        parser_config["model_specs"]["model_name"] = args.model_name
+
+    config["incremental"] = {"enabled": args.incremental}
+    # Every scenario downloads the documents again
+    config.setdefault("download", {})["cache"] = {"enabled": False}
+    config["image_store"] = {"type": "local", "path": os.path.join(work_dir, "page-images"), "thumbnail_size": 256}
+    config["metrics"] = {"exporter": "none"}
+    config["worker"] = {
+        "queue": "memory",
+        "concurrency": args.concurrency,
+        "poll_wait_seconds": 1,
+        "exit_when_idle": True,
+    }
+    # Never write benchmark pages into the production collection
+    config["weaviate"]["collection"]["name"] = "BenchmarkPages"
+    if args.weaviate == "memory":
+        # The in-memory stand-in has no tenants
+        config["weaviate"]["collection"]["multi_tenancy"] = {"enabled": False}
+    return config
+
+
+def _s3_client(args, work_dir: str):
+    if args.s3 == "local":
+        return LocalS3Client(os.path.join(work_dir, "s3"), latency=args.s3_latency)
+    # Any S3-compatible endpoint, e.g. MinIO via AWS_ENDPOINT_URL_S3
+    return boto3.client("s3")
+
+
+def prepare_documents(args, work_dir: str) -> List[str]:
+    s3 = _s3_client(args, work_dir)
+    keys = []
+    for index in range(args.documents):
+        key = f"synthetic/doc-{index}-{args.pages}p.pdf"
+        local_path = generate_pdf(
+            os.path.join(work_dir, "pdfs", os.path.basename(key)),
+            pages=args.pages,
+            density=args.density,
+            seed=args.seed + index,
+        )
+        s3.upload_file(local_path, BUCKET, key)
+        keys.append(key)
+    return keys
+
+
+def run_scenario(config: dict, args, keys: List[str], work_dir: str) -> Dict:
+    """Ingest every document through the worker loop and summarise the metrics of the run."""
+    from ingestion.jobs import DocumentJob, InMemoryJobQueue
+    from ingestion.runner import DocumentIngestor
+    from ingestion.worker import IngestionWorker
+    from vector_store.weaviate import WeaviateCollectionManager
+
+    metrics.reset()
+    manager = WeaviateCollectionManager(config=config)
+    if args.weaviate == "memory":
+        manager.client = InMemoryWeaviateClient(latency_per_object=args.weaviate_latency)
+    else:
+        manager.connect(connection_type="local")
+
+    model = None
+    if args.model == "stub":
+        model = StubColqwen(latency_per_page=args.model_latency, latency_per_batch=args.batch_latency)
+
+    ingestor = DocumentIngestor(config, manager=manager, model=model, s3_client=_s3_client(args, work_dir))
+    try:
+        job_queue = InMemoryJobQueue([DocumentJob(BUCKET, key) for key in keys])
+        start = time.perf_counter()
+        IngestionWorker(ingestor=ingestor, job_queue=job_queue, config=config).run()
+        elapsed = time.perf_counter() - start
+    finally:
+        if args.weaviate != "memory":
+            manager.client.collections.delete(config["weaviate"]["collection"]["name"])
+        ingestor.close()
+
+    summary = metrics.summary()
+    counters = summary["counters"]
+    pages = counters.get("pages_inserted", 0)
+    model_load = summary["histograms"].get("model_load_seconds", {}).get("sum", 0.0)
+    stages = {}
+    for name in STAGES:
+        histogram = summary["histograms"].get(name)
+        if not histogram or not histogram["count"]:
+            continue
+        stages[name] = {
+            "count": histogram["count"],
+            "per_second": histogram["count"] / histogram["sum"] if histogram["sum"] else None,
+            "p50_ms": histogram["p50"] * 1000,
+            "p95_ms": histogram["p95"] * 1000,
+        }
+
+    return {
+        "pages": pages,
+        "seconds": elapsed,
+        "model_load_seconds": model_load,
+        # Throughput excludes the one-off model load so stub and real runs compare
+        "pages_per_second": pages / max(elapsed - model_load, 1e-9),
+        "peak_rss_mb": summary["peak_rss_bytes"]["self"] / 1e6,
+        "peak_rss_children_mb": summary["peak_rss_bytes"]["children"] / 1e6,
+        "bytes_downloaded": counters.get("bytes_downloaded", 0),
+        "weaviate_bytes_written": counters.get("weaviate_bytes_written", 0),
+        "image_store_bytes_written": counters.get("image_store_bytes_written", 0),
+        "stages": stages,
+    }
+
+
+def _scenario_process(result_queue, config, args, keys, work_dir):
+    setup_logging(level=getattr(logging, args.log_level))
+    try:
+        result_queue.put(run_scenario(config, args, keys, work_dir))
+    except BaseException as e:
+        logger.exception("Benchmark scenario failed.")
+        result_queue.put({"error": repr(e)})
+
+
+def run_isolated(config: dict, args, keys: List[str], work_dir: str) -> Dict:
+    """Run one scenario in a fresh interpreter so RSS and warm caches do not leak between scenarios."""
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(target=_scenario_process, args=(result_queue, config, args, keys, work_dir))
+    process.start()
+    result = result_queue.get()
+    process.join()
+    if "error" in result:
+        raise RuntimeError(f"Scenario failed: {result['error']}")
+    return result
+
+
+def scenario_name(args, workers: int) -> str:
+    return (
+        f"pages={args.pages},documents={args.documents},density={args.density},"
+        f"workers={workers},concurrency={args.concurrency},model={args.model},weaviate={args.weaviate}"
+    )
+
+
+def check_regressions(results: Dict[str, Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """Compare throughput and memory against the stored baseline; return one message per regression."""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get("scenarios", {}).get(name)
+        if expected is None:
+            logger.warning(f"No baseline for scenario {name}.")
+            continue
+        if result["pages_per_second"] < expected["pages_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['pages_per_second']:.2f} pages/s, baseline {expected['pages_per_second']:.2f}"
+            )
+        if result["peak_rss_mb"] > expected["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak RSS {result['peak_rss_mb']:.0f} MB, baseline {expected['peak_rss_mb']:.0f} MB"
+            )
+    return regressions
+
+
+def log_report(results: Dict[str, Dict]):
+    for name, result in results.items():
+        logger.info(
+            f"{name}: {result['pages']} pages in {result['seconds']:.1f}s, "
+            f"{result['pages_per_second']:.2f} pages/s, peak RSS {result['peak_rss_mb']:.0f} MB "
+            f"(+{result['peak_rss_children_mb']:.0f} MB in children)"
+        )
+        for stage, stats in result["stages"].items():
+            per_second = f"{stats['per_second']:.2f}/s" if stats["per_second"] else "n/a"
+            logger.info(
+                f"    {stage:<28} n={stats['count']:<6} {per_second:>12}  "
+                f"p50 {stats['p50_ms']:.1f} ms  p95 {stats['p95_ms']:.1f} ms"
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ingestion benchmark.")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic document")
+    parser.add_argument("--documents", type=int, default=2)
+    parser.add_argument("--density", type=float, default=0.5, help="content density per page, 0..1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated rasterization worker counts to sweep")
+    parser.add_argument("--concurrency", type=int, default=1, help="documents in flight per worker")
+    parser.add_argument("--model", choices=["stub", "real"], default="stub")
+    parser.add_argument("--model-name", help="checkpoint for --model real, e.g. a tiny ColQwen2")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="stub seconds per page")
+    parser.add_argument("--batch-latency", type=float, default=0.0, help="stub seconds per batch")
+    parser.add_argument("--weaviate", choices=["memory", "local"], default="memory")
+    parser.add_argument("--weaviate-latency", type=float, default=0.0, help="in-memory seconds per object")
+    parser.add_argument("--s3", choices=["local", "boto3"], default="local")
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="local S3 seconds per request")
+    parser.add_argument("--incremental", action="store_true", help="keep incremental ingestion enabled")
+    parser.add_argument("--output", help="write the full JSON report here")
+    parser.add_argument("--baseline", help="baseline JSON to compare against (or write with --update-baseline)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    setup_logging()
+    base_config = load_config(args.config)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="ingestion-benchmark-") as work_dir:
+        keys = prepare_documents(args, work_dir)
+        for workers in [int(w) for w in args.workers.split(",")]:
+            name = scenario_name(args, workers)
+            logger.info(f"Running {name}")
+            config = build_config(base_config, args, workers, work_dir)
+            results[name] = run_isolated(config, args, keys, work_dir)
+
+    log_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+
+    if args.baseline and args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+        scenarios = baseline.setdefault("scenarios", {})
+        for name, result in results.items():
+            scenarios[name] = {"pages_per_second": result["pages_per_second"], "peak_rss_mb": result["peak_rss_mb"]}
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        logger.info(f"Baseline updated at {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = check_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            return 1
+        logger.info("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+Retrieval latency/recall benchmark.
+
+Loads a fixed corpus of page multi-vectors into one collection per index configuration
+(created through WeaviateCollectionManager._create_collection_if_not_exists), replays a
+query set at the given concurrency and reports p50/p95/p99 latency, QPS and recall@k
+against exact MaxSim ground truth, for plain near_vector search and for two-stage
+retrieval at each candidate limit. Ground truth is computed over the corpus as loaded,
+before any per-configuration compression, so it is only as exact as the corpus vectors
+(an export of a collection ingested with pool_factor > 1 is already pooled).
+
+Run from the vector_pipeline directory against a local Weaviate (see ../weaviate):
+    python -m benchmark.retrieval --pages 5000 --queries 200 --concurrency 1,8
+    python -m benchmark.retrieval --export-from Pages --corpus corpus.npz   # snapshot real embeddings
+    python -m benchmark.retrieval --corpus corpus.npz --output report.json
+"""
+import argparse
+import copy
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import numpy as np
+import torch
+from weaviate.util import generate_uuid5
+from util.logging_config import setup_logging
+from util.load_config import load_config
+from util.metrics import Histogram
+from parser.compression import EmbeddingCompressor
+from retriever.reranker import MaxSimReranker
+from retriever.search import TwoStageRetriever
+from vector_store.weaviate import WeaviateCollectionManager
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_ID = "retrieval-benchmark"
+
+
+def synthetic_corpus(pages: int, tokens: int, dim: int, topics: int, seed: int) -> List[np.ndarray]:
+    """
+    Unit-norm page multi-vectors drawn around a few topic centroids, so that near neighbours
+    exist and recall is informative.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((topics, dim)).astype(np.float32)
+    corpus = []
+    for _ in range(pages):
+        page_topics = rng.choice(topics, size=3, replace=False)
+        anchors = centroids[rng.choice(page_topics, size=tokens)]
+        vectors = anchors + 0.8 * rng.standard_normal((tokens, dim)).astype(np.float32)
+        corpus.append(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    return corpus
+
+
+def synthetic_queries(corpus: List[np.ndarray], count: int, tokens: int, seed: int) -> List[np.ndarray]:
+    """Queries made of noisy token subsets of random pages, like a short question about that page."""
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for page_index in rng.choice(len(corpus), size=count):
+        page = corpus[page_index]
+        vectors = page[rng.choice(page.shape[0], size=min(tokens, page.shape[0]), replace=False)]
+        vectors = vectors + 0.3 * rng.standard_normal(vectors.shape).astype(np.float32)
+        queries.append(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    return queries
+
+
+def load_arrays(path: str, name: str) -> List[np.ndarray]:
+    with np.load(path, allow_pickle=True) as data:
+        return [np.asarray(array, dtype=np.float32) for array in data[name]]
+
+
+def save_arrays(path: str, name: str, arrays: List[np.ndarray]):
+    ragged = np.empty(len(arrays), dtype=object)
+    ragged[:] = arrays
+    np.savez(path, **{name: ragged})
+
+
+def export_corpus(manager: WeaviateCollectionManager, collection_name: str, path: str, limit: int) -> int:
+    """Snapshot stored page multi-vectors of an existing collection into a corpus file."""
+    vector_name = manager.config["weaviate"]["collection"]["vectorizer"]["name"]
+    collection = manager.get_collection(collection_name)
+    corpus = []
+    for obj in collection.iterator(include_vector=True):
+        corpus.append(np.asarray(obj.vector[vector_name], dtype=np.float32))
+        if len(corpus) >= limit:
+            break
+    save_arrays(path, "pages", corpus)
+    logger.info(f"Exported {len(corpus)} page embeddings from '{collection_name}' to {path}")
+    return len(corpus)
+
+
+def exact_top_k(corpus: List[np.ndarray], queries: List[np.ndarray], k: int, chunk_size: int) -> List[List[int]]:
+    """Ground truth: the k best pages per query by exact MaxSim over the full, uncompressed corpus."""
+    reranker = MaxSimReranker(device="cuda" if torch.cuda.is_available() else "cpu", chunk_size=chunk_size)
+    top = []
+    for start in range(0, len(queries), 64):
+        scores = reranker.score(queries[start : start + 64], corpus)
+        top.extend(torch.topk(scores, k=min(k, len(corpus)), dim=1).indices.tolist())
+    return top
+
+
+def build_config(base_config: dict, index_config: Dict, collection_name: str) -> dict:
+    config = copy.deepcopy(base_config)
+    collection = config["weaviate"]["collection"]
+    collection["name"] = collection_name
+    base_vectorizer = collection.get("vectorizer", {})
+    collection["vectorizer"] = {
+        "name": base_vectorizer.get("name", "colqwen_vector"),
+        "type": "none",
+        "multi_vector": True,
+        **index_config.get("vectorizer", {}),
+    }
+    # Recall is measured over the whole corpus, which lives in one tenant-less collection
+    collection["multi_tenancy"] = {"enabled": False}
+    return config
+
+
+def load_collection(manager: WeaviateCollectionManager, corpus: List[np.ndarray], compression: Dict) -> float:
+    """Insert the (optionally compressed) corpus; page_number carries the corpus index."""
+    compressor = EmbeddingCompressor(
+        pool_factor=compression.get("pool_factor", 1), dtype=compression.get("dtype", "float32")
+    )
+    start = time.perf_counter()
+    with manager.batch_writer() as writer:
+        for index, page in enumerate(corpus):
+            writer.add(
+                properties={"document_id": DOCUMENT_ID, "page_number": index},
+                embedding=compressor.compress(torch.from_numpy(page)),
+                uuid=generate_uuid5(f"{DOCUMENT_ID}/{index}"),
+            )
+    if writer.failed_objects:
+        raise RuntimeError(f"{len(writer.failed_objects)} corpus objects failed to insert.")
+    return time.perf_counter() - start
+
+
+def replay(search, queries: List[np.ndarray], concurrency: int, warmup: int) -> Dict:
+    """Run every query through search(query) -> [corpus indices] and time each call."""
+    for query in queries[:warmup]:
+        search(query)
+
+    latencies = Histogram(max_samples=len(queries))
+
+    def timed(query):
+        start = time.perf_counter()
+        result = search(query)
+        return result, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, queries))
+    wall = time.perf_counter() - start
+
+    for _, latency in outcomes:
+        latencies.observe(latency)
+    return {
+        "results": [result for result, _ in outcomes],
+        "qps": len(queries) / wall if wall else 0.0,
+        "p50_ms": latencies.percentile(0.50) * 1000,
+        "p95_ms": latencies.percentile(0.95) * 1000,
+        "p99_ms": latencies.percentile(0.99) * 1000,
+    }
+
+
+def recall_at_k(results: List[List[int]], ground_truth: List[List[int]], k: int) -> float:
+    hits = sum(len(set(result[:k]) & set(truth[:k])) for result, truth in zip(results, ground_truth))
+    return hits / (k * len(ground_truth)) if ground_truth else 0.0
+
+
+def benchmark_index(manager, config: dict, queries, ground_truth, args, candidate_limits: List[int]) -> List[Dict]:
+    collection = manager.get_collection(config["weaviate"]["collection"]["name"])
+    vector_name = config["weaviate"]["collection"]["vectorizer"]["name"]
+    rows = []
+
+    def ann_search(query):
+        response = collection.query.near_vector(
+            near_vector=query, target_vector=vector_name, limit=args.k, return_properties=["page_number"]
+        )
+        return [obj.properties["page_number"] for obj in response.objects]
+
+    modes = [("ann", None, ann_search)]
+    for candidate_limit in candidate_limits:
+        retriever = TwoStageRetriever(
+            collection, {**config, "retrieval": {**config.get("retrieval", {}), "candidate_limit": candidate_limit}}
+        )
+
+        def rerank_search(query, retriever=retriever):
+            ranked = retriever.search(query, limit=args.k, return_properties=["page_number"])
+            return [obj.properties["page_number"] for obj, _ in ranked]
+
+        modes.append(("rerank", candidate_limit, rerank_search))
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        for mode, candidate_limit, search in modes:
+            outcome = replay(search, queries, concurrency, args.warmup)
+            rows.append({
+                "mode": mode,
+                "candidate_limit": candidate_limit,
+                "concurrency": concurrency,
+                f"recall@{args.k}": recall_at_k(outcome["results"], ground_truth, args.k),
+                "qps": outcome["qps"],
+                "p50_ms": outcome["p50_ms"],
+                "p95_ms": outcome["p95_ms"],
+                "p99_ms": outcome["p99_ms"],
+            })
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Retrieval latency/recall benchmark.")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--index-configs", default="benchmark/retrieval_configs.yaml")
+    parser.add_argument("--only", help="comma-separated index config names to run")
+    parser.add_argument("--connection", default="local", help="connection type passed to the manager")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--corpus", help="npz corpus file (pages); synthetic when omitted")
+    parser.add_argument("--query-file", help="npz query file (queries); drawn from the corpus when omitted")
+    parser.add_argument("--export-from", help="write the embeddings of this collection to --corpus and exit")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--page-tokens", type=int, default=128)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--query-tokens", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--k", type=int, default=10, help="recall@k and result limit")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated client concurrency levels")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--keep-collections", action="store_true")
+    parser.add_argument("--output", help="write the JSON report here")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    setup_logging()
+    base_config = load_config(args.config)
+    sweep = load_config(args.index_configs)
+
+    if args.export_from:
+        manager = WeaviateCollectionManager(config=base_config)
+        manager.connect(connection_type=args.connection, host=args.host)
+        try:
+            export_corpus(manager, args.export_from, args.corpus or "corpus.npz", limit=args.pages)
+        finally:
+            manager.close()
+        return 0
+
+    if args.corpus:
+        corpus = load_arrays(args.corpus, "pages")
+    else:
+        corpus = synthetic_corpus(args.pages, args.page_tokens, args.dim, args.topics, args.seed)
+    if args.query_file:
+        queries = load_arrays(args.query_file, "queries")
+    else:
+        queries = synthetic_queries(corpus, args.queries, args.query_tokens, args.seed)
+    logger.info(f"Corpus of {len(corpus)} pages, {len(queries)} queries.")
+
+    start = time.perf_counter()
+    ground_truth = exact_top_k(corpus, queries, args.k, chunk_size=base_config.get("retrieval", {}).get("rerank_chunk_size", 64))
+    logger.info(f"Exact MaxSim ground truth computed in {time.perf_counter() - start:.1f}s.")
+
+    only = set(args.only.split(",")) if args.only else None
+    report = []
+    for index, index_config in enumerate(sweep["index_configs"]):
+        if only and index_config["name"] not in only:
+            continue
+        collection_name = f"RetrievalBenchmark{index}"
+        config = build_config(base_config, index_config, collection_name)
+        manager = WeaviateCollectionManager(config=config)
+        manager.connect(connection_type=args.connection, host=args.host)
+        try:
+            if manager.client.collections.exists(collection_name):
+                manager.client.collections.delete(collection_name)
+            manager._create_collection_if_not_exists()
+            load_seconds = load_collection(manager, corpus, index_config.get("compression", {}))
+            logger.info(f"{index_config['name']}: loaded {len(corpus)} pages in {load_seconds:.1f}s.")
+
+            for row in benchmark_index(manager, config, queries, ground_truth, args, sweep.get("candidate_limits", [50])):
+                row = {"index_config": index_config["name"], "load_seconds": load_seconds, **row}
+                report.append(row)
+                logger.info(
+                    f"{row['index_config']:<24} {row['mode']:<6} candidates={str(row['candidate_limit']):<5} "
+                    f"concurrency={row['concurrency']:<3} recall@{args.k}={row[f'recall@{args.k}']:.3f} "
+                    f"qps={row['qps']:.1f} p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms p99={row['p99_ms']:.1f}ms"
+                )
+        finally:
+            if not args.keep_collections and manager.client is not None:
+                manager.client.collections.delete(collection_name)
+            manager.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"pages": len(corpus), "queries": len(queries), "k": args.k, "results": report}, f, indent=2)
+        logger.info(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import hashlib
+import io
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+from typing import Dict, List
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+class StubColqwen:
+    def __init__(self, latency_per_page: float = 0.05, latency_per_batch: float = 0.0, dim: int = 128, max_tokens: int = 768):
+        """
+        Stand-in for Colqwen with the same embedding interface.
+        Returns deterministic unit-norm multi-vectors (seeded by the page pixels) after sleeping
+        latency_per_batch + latency_per_page * pages, so the rest of the pipeline sees a model
+        of known speed. The token count follows the page size like the real processor.
+        """
+        self.latency_per_page = latency_per_page
+        self.latency_per_batch = latency_per_batch
+        self.dim = dim
+        self.max_tokens = max_tokens
+        self.cache = None
+        logger.info(
+            f"Initialized stub model: {latency_per_page * 1000:.0f} ms per page, "
+            f"{latency_per_batch * 1000:.0f} ms per batch, dim {dim}."
+        )
+
+    def _vectors(self, seed: int, tokens: int) -> torch.Tensor:
+        rng = np.random.default_rng(seed)
+        vectors = rng.standard_normal((tokens, self.dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return torch.from_numpy(vectors)
+
+    def multi_vectorize_images(self, pages: List) -> List[torch.Tensor]:
+        time.sleep(self.latency_per_batch + self.latency_per_page * len(pages))
+        embeddings = []
+        for page in pages:
+            width, height = page.size
+            tokens = max(1, min(self.max_tokens, (width * height) // (28 * 28)))
+            embeddings.append(self._vectors(zlib.crc32(page.tobytes()), tokens))
+        return embeddings
+
+    def multi_vectorize_texts(self, queries: List[str]) -> List[torch.Tensor]:
+        time.sleep(self.latency_per_batch)
+        return [self._vectors(zlib.crc32(query.encode("utf-8")), max(len(query.split()), 1) + 8) for query in queries]
+
+    def multi_vectorize_text(self, query: str) -> torch.Tensor:
+        return self.multi_vectorize_texts([query])[0]
+
+
+class LocalS3Client:
+    def __init__(self, root_dir: str, latency: float = 0.0):
+        """
+        Directory-backed stand-in for the boto3 S3 client; objects live at <root_dir>/<bucket>/<key>.
+        For a real S3 API locally, run MinIO and point boto3 at it with AWS_ENDPOINT_URL_S3 instead.
+        """
+        self.root_dir = root_dir
+        self.latency = latency
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root_dir, bucket, key)
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, **kwargs):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(Filename, path)
+
+    def download_file(self, Bucket: str, Key: str, Filename: str, **kwargs):
+        time.sleep(self.latency)
+        shutil.copyfile(self._path(Bucket, Key), Filename)
+
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict:
+        time.sleep(self.latency)
+        path = self._path(Bucket, Key)
+        # S3 ETags of single-part uploads are the MD5 of the content
+        with open(path, "rb") as f:
+            etag = hashlib.md5(f.read()).hexdigest()
+        return {"ContentLength": os.path.getsize(path), "ETag": f'"{etag}"'}
+
+    def get_object(self, Bucket: str, Key: str, Range: str = None, **kwargs) -> Dict:
+        time.sleep(self.latency)
+        with open(self._path(Bucket, Key), "rb") as f:
+            if Range:
+                start, end = Range.replace("bytes=", "").split("-")
+                f.seek(int(start))
+                data = f.read(int(end) - int(start) + 1)
+            else:
+                data = f.read()
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+
+class _Object:
+    def __init__(self, uuid, properties, vector):
+        self.uuid = uuid
+        self.properties = properties
+        self.vector = vector
+
+
+class _Response:
+    def __init__(self, objects):
+        self.objects = objects
+
+
+class _DeleteResult:
+    def __init__(self, successful):
+        self.successful = successful
+
+
+class InMemoryBatch:
+    def __init__(self, collection: "InMemoryCollection"):
+        self.collection = collection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add_object(self, properties: dict, uuid=None, vector=None):
+        if self.collection.latency_per_object:
+            time.sleep(self.collection.latency_per_object)
+        with self.collection.lock:
+            self.collection.objects[str(uuid)] = _Object(uuid, dict(properties), vector)
+
+
+class _BatchNamespace:
+    def __init__(self, collection: "InMemoryCollection"):
+        self.collection = collection
+        self.failed_objects = []
+
+    def fixed_size(self, batch_size: int = 100, concurrent_requests: int = 2):
+        return InMemoryBatch(self.collection)
+
+    def dynamic(self):
+        return InMemoryBatch(self.collection)
+
+
+class _QueryNamespace:
+    def __init__(self, collection: "InMemoryCollection"):
+        self.collection = collection
+
+    def fetch_objects(self, filters=None, return_properties=None, limit: int = 10000, **kwargs) -> _Response:
+        with self.collection.lock:
+            objects = list(self.collection.objects.values())
+        if filters is not None:
+            # Only the equality filters the pipeline issues (e.g. document_id == x)
+            target = getattr(filters, "target", None)
+            objects = [obj for obj in objects if obj.properties.get(target) == filters.value]
+        return _Response(objects[:limit])
+
+
+class _DataNamespace:
+    def __init__(self, collection: "InMemoryCollection"):
+        self.collection = collection
+
+    def delete_many(self, where=None) -> _DeleteResult:
+        uuids = {str(uuid) for uuid in where.value}
+        with self.collection.lock:
+            deleted = [uuid for uuid in list(self.collection.objects) if uuid in uuids]
+            for uuid in deleted:
+                del self.collection.objects[uuid]
+        return _DeleteResult(len(deleted))
+
+
+class InMemoryCollection:
+    def __init__(self, name: str, latency_per_object: float = 0.0):
+        self.name = name
+        self.latency_per_object = latency_per_object
+        self.objects: Dict[str, _Object] = {}
+        self.lock = threading.Lock()
+        self.batch = _BatchNamespace(self)
+        self.query = _QueryNamespace(self)
+        self.data = _DataNamespace(self)
+
+
+class _CollectionsNamespace:
+    def __init__(self, latency_per_object: float):
+        self.latency_per_object = latency_per_object
+        self._collections: Dict[str, InMemoryCollection] = {}
+
+    def list_all(self) -> Dict[str, InMemoryCollection]:
+        return dict(self._collections)
+
+    def exists(self, name: str) -> bool:
+        return name.capitalize() in self._collections
+
+    def create(self, name: str, **kwargs) -> InMemoryCollection:
+        collection = InMemoryCollection(name.capitalize(), latency_per_object=self.latency_per_object)
+        self._collections[collection.name] = collection
+        return collection
+
+    def get(self, name: str) -> InMemoryCollection:
+        return self._collections[name.capitalize()]
+
+
+class InMemoryWeaviateClient:
+    def __init__(self, latency_per_object: float = 0.0):
+        """
+        Minimal in-process fake of the Weaviate v4 client covering the calls
+        WeaviateCollectionManager makes during ingestion (collections, batching,
+        fetch_objects by document_id, delete_many by id). Attach it as manager.client.
+        """
+        self.collections = _CollectionsNamespace(latency_per_object)
+
+    def close(self):
+        pass
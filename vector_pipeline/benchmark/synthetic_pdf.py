@@ -0,0 +1,53 @@
+import logging
+import os
+import random
+import fitz
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "revenue margin quarter pipeline embedding vector retrieval latency throughput invoice "
+    "contract clause schedule appendix figure table total balance forecast region segment"
+).split()
+
+
+def generate_pdf(path: str, pages: int, density: float = 0.5, seed: int = 0, page_size=(612, 792)) -> str:
+    """
+    Write a synthetic PDF of the given page count.
+    density (0..1) scales the amount of text, vector shapes and embedded raster images per page,
+    which drives both rendering cost and how many visual tokens a page is worth.
+    """
+    if not 0.0 <= density <= 1.0:
+        raise ValueError("density must be between 0 and 1.")
+
+    rng = random.Random(seed)
+    width, height = page_size
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        page = doc.new_page(width=width, height=height)
+        page.insert_text((50, 50), f"Synthetic page {page_number}", fontsize=16)
+
+        # Body text
+        for line in range(int(density * 45)):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12)))
+            page.insert_text((50, 80 + line * 14), text, fontsize=9)
+
+        # Vector figures
+        for _ in range(int(density * 6)):
+            x, y = rng.uniform(40, width - 160), rng.uniform(80, height - 120)
+            rect = fitz.Rect(x, y, x + rng.uniform(40, 120), y + rng.uniform(20, 80))
+            page.draw_rect(rect, color=(0, 0, 0), fill=(rng.random(), rng.random(), rng.random()), width=0.5)
+
+        # Noisy raster images are the expensive part of real scans
+        for _ in range(int(density * 2)):
+            side = rng.randint(64, 192)
+            samples = bytes(rng.getrandbits(8) for _ in range(side * side * 3))
+            pixmap = fitz.Pixmap(fitz.csRGB, side, side, samples, 0)
+            x, y = rng.uniform(40, width - 240), rng.uniform(80, height - 240)
+            page.insert_image(fitz.Rect(x, y, x + 200, y + 200), pixmap=pixmap)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    logger.info(f"Generated {path} with {pages} pages (density {density}).")
+    return path
@@ -0,0 +1,117 @@
+import base64
+import hashlib
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from io import BytesIO
+import boto3
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+class PageImageStore(ABC):
+    """
+    Content-addressed storage for page images, kept outside the vector index.
+    Pages are stored as rendered for embedding, i.e. at the rasterization pixel budget.
+    """
+
+    def put(self, data: bytes, extension: str = "png") -> str:
+        """Store the encoded image and return its reference (the content hash plus extension)."""
+        ref = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        self._write(ref, data)
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        return self._read(ref)
+
+    def get_base64(self, ref: str) -> str:
+        return base64.b64encode(self.get(ref)).decode("utf-8")
+
+    def get_image(self, ref: str) -> Image.Image:
+        return Image.open(BytesIO(self.get(ref))).convert("RGB")
+
+    @abstractmethod
+    def _write(self, ref: str, data: bytes):
+        ...
+
+    @abstractmethod
+    def _read(self, ref: str) -> bytes:
+        ...
+
+
+class LocalPageImageStore(PageImageStore):
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        logger.info(f"Using local page image store at {root_dir}")
+
+    def _path(self, ref: str) -> str:
+        # Fan out into subdirectories so a single folder never holds millions of files
+        return os.path.join(self.root_dir, ref[:2], ref[2:4], ref)
+
+    def _write(self, ref: str, data: bytes):
+        path = self._path(ref)
+        if os.path.exists(path):
+            logger.debug(f"Page image {ref} already stored.")
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            logger.exception(f"Failed to write page image {ref}.")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _read(self, ref: str) -> bytes:
+        with open(self._path(ref), "rb") as f:
+            return f.read()
+
+
+class S3PageImageStore(PageImageStore):
+    def __init__(self, bucket: str, prefix: str = "page-images", endpoint_url: str = None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.s3 = boto3.client("s3", endpoint_url=endpoint_url)
+        logger.info(f"Using S3 page image store at s3://{bucket}/{self.prefix}")
+
+    def _key(self, ref: str) -> str:
+        return f"{self.prefix}/{ref}" if self.prefix else ref
+
+    def _write(self, ref: str, data: bytes):
+        try:
+            self.s3.put_object(Bucket=self.bucket, Key=self._key(ref), Body=data)
+        except Exception:
+            logger.exception(f"Failed to upload page image {ref}.")
+            raise
+
+    def _read(self, ref: str) -> bytes:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(ref))
+            return response["Body"].read()
+        except Exception:
+            logger.exception(f"Failed to fetch page image {ref}.")
+            raise
+
+
+def create_page_image_store(config: dict) -> PageImageStore:
+    """Build the page image store described by the image_store section of the config, or None."""
+    store_config = config.get("image_store")
+    if not store_config:
+        return None
+
+    store_type = store_config.get("type", "local")
+    if store_type == "local":
+        return LocalPageImageStore(root_dir=store_config["path"])
+    if store_type == "s3":
+        return S3PageImageStore(
+            bucket=os.environ.get("PAGE_IMAGE_BUCKET") or store_config["bucket"],
+            prefix=store_config.get("prefix", "page-images"),
+            endpoint_url=store_config.get("endpoint_url"),
+        )
+    raise ValueError(f"Unsupported image store type '{store_type}'.")
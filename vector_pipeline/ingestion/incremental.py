@@ -0,0 +1,85 @@
+import logging
+from typing import Dict, Iterable, List
+from weaviate.util import generate_uuid5
+from util.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class IncrementalIngestionPlanner:
+    def __init__(self, converter, manager, config: dict):
+        """
+        Work out which pages of a document still need to be embedded.
+        Page UUIDs are derived from the document id, page number, page fingerprint, model and pooling,
+        so an unchanged page always maps to the same object and can be skipped before it is rendered.
+        """
+        self.converter = converter
+        self.manager = manager
+        self.config = config
+        self.max_pages_per_document = config.get("incremental", {}).get("max_pages_per_document", 10000)
+
+        self.document_fingerprint = None
+        self.page_uuids: Dict[int, str] = {}
+        self.page_metadata: Dict[int, Dict] = {}
+        self.pages_to_ingest: List[int] = []
+        self.stale_uuids: List[str] = []
+
+    def plan(self, page_numbers: Iterable[int] = None):
+        """
+        Plan ingestion of the whole document, or only of page_numbers when processing a shard.
+        A shard only deletes stale objects within its own page range (the last shard also
+        removes pages beyond the current page count).
+        """
+        document_id = self.converter.document_id
+        model_specs = self.config["pdf_parser"]["model_specs"]
+        model_name = model_specs["model_name"]
+        pool_factor = self.config["pdf_parser"].get("compression", {}).get("pool_factor", 1)
+        # int8 quantization and the dtype change the vectors, so such pages are re-embedded
+        cpu_config = model_specs.get("cpu") or {}
+        quantize_int8 = bool(cpu_config.get("enabled", False) and cpu_config.get("quantize_int8", False))
+        torch_dtype = "float32" if quantize_int8 else model_specs.get("torch_dtype", "bfloat16")
+
+        page_count = self.converter.get_page_count()
+        scope = set(page_numbers) if page_numbers is not None else set(range(1, page_count + 1))
+
+        with metrics.timer("fingerprint_seconds"):
+            self.document_fingerprint = self.converter.compute_document_fingerprint()
+            page_fingerprints = self.converter.compute_page_fingerprints(sorted(scope))
+
+        for page_number, page_fingerprint in page_fingerprints.items():
+            uuid = generate_uuid5({
+                "document_id": document_id,
+                "page_number": page_number,
+                "page_fingerprint": page_fingerprint,
+                "model_name": model_name,
+                "pool_factor": pool_factor,
+                "torch_dtype": torch_dtype,
+                "quantize_int8": quantize_int8,
+            })
+            self.page_uuids[page_number] = uuid
+            self.page_metadata[page_number] = {"uuid": uuid, "page_fingerprint": page_fingerprint}
+
+        existing_pages = self.manager.fetch_document_pages(document_id, limit=self.max_pages_per_document)
+        expected_uuids = set(self.page_uuids.values())
+        covers_last_page = page_count in scope
+
+        self.pages_to_ingest = [
+            page_number for page_number, uuid in self.page_uuids.items() if uuid not in existing_pages
+        ]
+        # Objects of a replaced document version: removed pages and pages whose content changed
+        self.stale_uuids = sorted(
+            uuid for uuid, page_number in existing_pages.items()
+            if uuid not in expected_uuids
+            and (page_number in scope or page_number is None or (covers_last_page and page_number > page_count))
+        )
+
+        metrics.increment("pages_skipped", len(page_fingerprints) - len(self.pages_to_ingest))
+        logger.info(
+            f"Document '{document_id}' ({self.document_fingerprint[:12]}): "
+            f"{len(page_fingerprints)} pages in scope, {len(self.pages_to_ingest)} to ingest, "
+            f"{len(self.stale_uuids)} stale objects to delete."
+        )
+        return self
+
+    def delete_stale(self) -> int:
+        tenant = self.manager.tenant_for(self.converter.document_id)
+        return self.manager.delete_objects(self.stale_uuids, tenant=tenant)
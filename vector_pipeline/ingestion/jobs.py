@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import queue
+from abc import ABC, abstractmethod
+from typing import List
+import boto3
+
+logger = logging.getLogger(__name__)
+
+class DocumentJob:
+    def __init__(self, bucket: str, key: str, handle=None, page_start: int = None, page_end: int = None):
+        """
+        A request to ingest one S3 object, optionally only a page range of it.
+        handle identifies the message in its queue.
+        """
+        self.bucket = bucket
+        self.key = key
+        self.handle = handle
+        self.page_start = page_start
+        self.page_end = page_end
+        self.attempts = 0
+
+    @classmethod
+    def from_message(cls, body: str, handle=None) -> "DocumentJob":
+        payload = json.loads(body)
+        return cls(
+            bucket=payload["bucket"],
+            key=payload["key"],
+            handle=handle,
+            page_start=payload.get("page_start"),
+            page_end=payload.get("page_end"),
+        )
+
+    def to_message(self) -> str:
+        payload = {"bucket": self.bucket, "key": self.key}
+        if self.page_start:
+            payload.update(page_start=self.page_start, page_end=self.page_end)
+        return json.dumps(payload)
+
+    def __repr__(self):
+        page_range = f" pages {self.page_start}-{self.page_end}" if self.page_start else ""
+        return f"DocumentJob(s3://{self.bucket}/{self.key}{page_range})"
+
+
+class JobQueue(ABC):
+    """Source of document jobs. Jobs that are not acknowledged are delivered again."""
+
+    @abstractmethod
+    def receive(self, max_jobs: int = 1, wait_seconds: int = 20) -> List[DocumentJob]:
+        ...
+
+    @abstractmethod
+    def ack(self, job: DocumentJob):
+        """Remove a finished job from the queue."""
+
+    @abstractmethod
+    def nack(self, job: DocumentJob):
+        """Make a failed job visible again so it can be retried."""
+
+    def extend_visibility(self, job: DocumentJob, seconds: int):
+        """Keep an in-flight job hidden from other consumers for a while longer."""
+
+
+class InMemoryJobQueue(JobQueue):
+    def __init__(self, jobs: List[DocumentJob] = None, max_attempts: int = 3):
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue()
+        for job in jobs or []:
+            self.put(job)
+
+    def put(self, job: DocumentJob):
+        self._queue.put(job)
+
+    def receive(self, max_jobs: int = 1, wait_seconds: int = 20) -> List[DocumentJob]:
+        jobs = []
+        try:
+            jobs.append(self._queue.get(timeout=wait_seconds))
+            while len(jobs) < max_jobs:
+                jobs.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return jobs
+
+    def ack(self, job: DocumentJob):
+        """Nothing to do: receive() already took the job off the queue."""
+
+    def nack(self, job: DocumentJob):
+        job.attempts += 1
+        if job.attempts >= self.max_attempts:
+            logger.error(f"Giving up on {job} after {job.attempts} attempts.")
+            return
+        self._queue.put(job)
+
+
+class FileJobQueue(InMemoryJobQueue):
+    def __init__(self, path: str):
+        """Load jobs from a JSON-lines file of {"bucket": ..., "key": ...} objects, for local runs."""
+        super().__init__()
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Job file '{path}' not found.")
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    self.put(DocumentJob.from_message(line))
+        logger.info(f"Loaded {self._queue.qsize()} jobs from {path}")
+
+
+class SQSJobQueue(JobQueue):
+    def __init__(self, queue_url: str, visibility_timeout: int = 900):
+        self.queue_url = queue_url
+        self.visibility_timeout = visibility_timeout
+        self.sqs = boto3.client("sqs")
+        logger.info(f"Consuming jobs from SQS queue {queue_url}")
+
+    def receive(self, max_jobs: int = 1, wait_seconds: int = 20) -> List[DocumentJob]:
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_jobs, 10),
+            WaitTimeSeconds=wait_seconds,
+            VisibilityTimeout=self.visibility_timeout,
+        )
+
+        jobs = []
+        for message in response.get("Messages", []):
+            try:
+                jobs.append(DocumentJob.from_message(message["Body"], handle=message["ReceiptHandle"]))
+            except (ValueError, KeyError):
+                # Malformed messages would be redelivered forever; drop them
+                logger.exception(f"Discarding malformed job message: {message.get('Body')}")
+                self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message["ReceiptHandle"])
+        return jobs
+
+    def ack(self, job: DocumentJob):
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=job.handle)
+
+    def nack(self, job: DocumentJob):
+        self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=job.handle, VisibilityTimeout=0)
+
+    def extend_visibility(self, job: DocumentJob, seconds: int):
+        self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=job.handle, VisibilityTimeout=seconds)
+
+
+def create_job_queue(config: dict) -> JobQueue:
+    """Build the job queue described by the worker section of the config."""
+    worker_config = config.get("worker", {})
+    queue_type = worker_config.get("queue", "sqs")
+
+    if queue_type == "sqs":
+        return SQSJobQueue(
+            queue_url=os.environ.get("JOB_QUEUE_URL") or worker_config["queue_url"],
+            visibility_timeout=worker_config.get("visibility_timeout", 900),
+        )
+    if queue_type == "file":
+        return FileJobQueue(path=worker_config["job_file"])
+    if queue_type == "memory":
+        return InMemoryJobQueue()
+    raise ValueError(f"Unsupported job queue '{queue_type}'.")
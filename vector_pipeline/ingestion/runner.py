@@ -0,0 +1,159 @@
+import logging
+import threading
+from util.download_pdf import DownloadedPDF, S3Downloader
+from util.pdf_util import PDFImageConverter, PageRasterizer
+from parser.colqwen import Colqwen
+from parser.compression import EmbeddingCompressor
+from vector_store.weaviate import WeaviateCollectionManager
+from image_store.page_image_store import create_page_image_store
+from ingestion.incremental import IncrementalIngestionPlanner
+from ingestion.streaming import StreamingIngestionPipeline
+from ingestion.shards import ShardTracker
+from ingestion.triage import PageTriage
+from util.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class DocumentIngestor:
+    def __init__(self, config: dict, manager: WeaviateCollectionManager = None, model=None, s3_client=None):
+        """
+        Ingest PDFs from S3 into Weaviate.
+        The Weaviate connection is opened once and the model is loaded on first use,
+        so a long-running worker pays for both only once across many documents.
+        A connected manager, a model and an S3 client can be passed in instead (benchmarks use stand-ins).
+        """
+        self.config = config
+        self.model = model
+        self._model_lock = threading.Lock()
+        # One client and transfer pool for every document
+        self.downloader = S3Downloader.from_config(config, s3=s3_client)
+
+        if manager is None:
+            manager = WeaviateCollectionManager(config=config)
+            manager.connect(
+                connection_type=config["weaviate"]["connection"]["type"],
+                host=config["weaviate"]["connection"]["host"],
+            )
+        self.manager = manager
+        self.manager._create_collection_if_not_exists()
+
+        self.image_store = create_page_image_store(config)
+        # Shared so the rendering processes are started once, not per document
+        self.rasterizer = PageRasterizer.from_config(config)
+        self.status_prefix = config.get("sharding", {}).get("status_prefix", "_ingestion_status")
+
+        compression = config["pdf_parser"].get("compression", {})
+        self.compressor = EmbeddingCompressor(
+            pool_factor=compression.get("pool_factor", 1),
+            dtype=compression.get("dtype", "float32"),
+        )
+
+    def _get_model(self) -> Colqwen:
+        with self._model_lock:
+            if self.model is None:
+                self.model = Colqwen.from_config(self.config, embedding_cache=True)
+        return self.model
+
+    def ingest(self, bucket: str, key: str, page_start: int = None, page_end: int = None) -> int:
+        """
+        Download, render, embed and insert one document, or only pages page_start..page_end
+        when the document was split into shards.
+        Raises RuntimeError when some pages were not inserted; the shard is then not marked done.
+        Returns:
+            Number of pages inserted into Weaviate.
+        """
+        page_range = f" pages {page_start}-{page_end}" if page_start else ""
+        logger.info(f"Ingesting s3://{bucket}/{key}{page_range}")
+        document_id = f"{key}#{page_start}-{page_end}" if page_start else key
+        tracker = ShardTracker(bucket, key, status_prefix=self.status_prefix) if page_start else None
+        # The dispatcher planned shards from its own page count; the last one takes every remaining page
+        last_shard = tracker is not None and tracker.is_last_shard(page_end)
+        with metrics.document(document_id):
+            download = self.downloader.download(bucket, key)
+            try:
+                inserted = self._ingest_file(download, key, page_start, page_end, last_shard=last_shard)
+            finally:
+                # Long-running workers would otherwise fill the task's ephemeral storage
+                download.cleanup()
+
+        if tracker is not None:
+            tracker.mark_done(page_start, page_end, inserted)
+        return inserted
+
+    def _ingest_file(
+        self, download: DownloadedPDF, key: str, page_start: int = None, page_end: int = None, last_shard: bool = False
+    ) -> int:
+        converter = PDFImageConverter(
+            download.path,
+            self.config,
+            image_store=self.image_store,
+            document_id=key,
+            rasterizer=self.rasterizer,
+            download=download,
+        )
+
+        page_numbers = None
+        if page_start:
+            page_count = converter.get_page_count()
+            if last_shard and page_count > page_end:
+                logger.warning(
+                    f"Document has {page_count} pages, more than the {page_end} planned; "
+                    f"the last shard ingests them all."
+                )
+            last_page = page_count if last_shard else min(page_end, page_count)
+            page_numbers = list(range(page_start, last_page + 1))
+
+        # Only render and embed pages that are not in Weaviate yet
+        planner = None
+        if self.config.get("incremental", {}).get("enabled", False):
+            planner = IncrementalIngestionPlanner(
+                converter=converter, manager=self.manager, config=self.config
+            ).plan(page_numbers=page_numbers)
+            page_numbers = planner.pages_to_ingest
+
+        inserted = 0
+        if page_numbers == []:
+            logger.info("Document is already ingested, nothing to embed.")
+        else:
+            with metrics.timer("model_load_seconds"):
+                model = self._get_model()
+
+            # Render, embed and insert pages as overlapping stages
+            pages = converter.iter_pages(
+                chunk_size=self.config.get("pipeline", {}).get("render_chunk_size", 4),
+                page_numbers=page_numbers,
+                page_metadata=planner.page_metadata if planner else None,
+            )
+            # Spend less (or no) embedding compute on blank, duplicate and sparse pages
+            if self.config.get("triage", {}).get("enabled", False):
+                pages = PageTriage(self.config).run(pages)
+            pipeline = StreamingIngestionPipeline(
+                model=model,
+                manager=self.manager,
+                config=self.config,
+                compressor=self.compressor,
+                tenant=self.manager.tenant_for(key),
+            )
+            inserted = pipeline.run(pages)
+
+            logger.info(f"Processed {inserted} pages from PDF.")
+            if model.cache is not None:
+                model.cache.log_stats()
+
+            planned = len(page_numbers) if page_numbers is not None else converter.get_page_count()
+            if pipeline.failed or inserted < planned:
+                # Keep the previous version's pages and leave the shard open so a retry can finish the job
+                raise RuntimeError(
+                    f"Inserted {inserted} of {planned} pages of {key} ({pipeline.failed} failed); "
+                    f"skipping stale page deletion."
+                )
+
+        # Drop pages that belong to a previous version of the document
+        if planner is not None:
+            planner.delete_stale()
+
+        return inserted
+
+    def close(self):
+        self.rasterizer.close()
+        self.manager.close()
@@ -0,0 +1,74 @@
+import json
+import logging
+import boto3
+
+logger = logging.getLogger(__name__)
+
+class ShardTracker:
+    def __init__(self, bucket: str, key: str, status_prefix: str = "_ingestion_status"):
+        """
+        Track completion of a document that was split into page-range shards.
+        The dispatcher writes <status_prefix>/<key>/manifest.json listing every shard; each
+        shard writes a done marker when it finishes, and whichever shard sees all markers
+        present writes complete.json.
+        """
+        self.bucket = bucket
+        self.key = key
+        self.prefix = f"{status_prefix}/{key}"
+        self.s3 = boto3.client("s3")
+        self._manifest = None
+
+    def manifest(self):
+        """The dispatcher's manifest, or None when the document was not split by it."""
+        if self._manifest is None:
+            try:
+                self._manifest = json.loads(
+                    self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}/manifest.json")["Body"].read()
+                )
+            except self.s3.exceptions.NoSuchKey:
+                return None
+        return self._manifest
+
+    def is_last_shard(self, page_end: int) -> bool:
+        """True for the shard ending at the dispatcher's page count, which only estimated it."""
+        manifest = self.manifest()
+        return manifest is not None and page_end >= max(shard["page_end"] for shard in manifest["shards"])
+
+    def mark_done(self, page_start: int, page_end: int, inserted: int) -> bool:
+        """
+        Record that a shard finished and return True if it was the last one.
+        """
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}/shards/{page_start}-{page_end}.done",
+            Body=json.dumps({"page_start": page_start, "page_end": page_end, "inserted": inserted}),
+            ContentType="application/json",
+        )
+        logger.info(f"Shard {page_start}-{page_end} of s3://{self.bucket}/{self.key} done.")
+
+        manifest = self.manifest()
+        if manifest is None:
+            logger.warning(f"No shard manifest for s3://{self.bucket}/{self.key}; cannot track completion.")
+            return False
+
+        expected = {f"{shard['page_start']}-{shard['page_end']}.done" for shard in manifest["shards"]}
+        paginator = self.s3.get_paginator("list_objects_v2")
+        finished = {
+            obj["Key"].rsplit("/", 1)[-1]
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/shards/")
+            for obj in page.get("Contents", [])
+        }
+
+        remaining = expected - finished
+        if remaining:
+            logger.info(f"{len(expected) - len(remaining)}/{len(expected)} shards finished.")
+            return False
+
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}/complete.json",
+            Body=json.dumps({"page_count": manifest["page_count"], "shards": len(expected)}),
+            ContentType="application/json",
+        )
+        logger.info(f"All {len(expected)} shards of s3://{self.bucket}/{self.key} finished.")
+        return True
@@ -0,0 +1,250 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+from util.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_SENTINEL = object()
+
+class StreamingIngestionPipeline:
+    def __init__(self, model, manager, config: dict, compressor=None, tenant: str = None):
+        """
+        Run render, embed and insert as overlapping stages.
+        Stages are connected by bounded queues, so a slow stage blocks the ones
+        upstream of it and the number of pages held in memory stays constant.
+        Pages are written to the given tenant when the collection is multi-tenant.
+        """
+        self.model = model
+        self.manager = manager
+        self.config = config
+        self.compressor = compressor
+        self.tenant = tenant
+
+        pipeline_config = config.get("pipeline", {})
+        self.queue_size = pipeline_config.get("queue_size", 8)
+        self.embed_chunk_size = pipeline_config.get("embed_chunk_size", 8)
+        # Embeddings of recent pages, for near-duplicates that triage aliased to them
+        self.alias_window = config.get("triage", {}).get("duplicate_window", 64)
+        self._recent_embeddings: "OrderedDict[int, object]" = OrderedDict()
+
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._embedded_pages = 0
+        self._embed_seconds = 0.0
+        # Pages that could not be prepared for insertion and objects Weaviate rejected
+        self.failed_pages: List[int] = []
+        self.failed_objects: list = []
+
+    def run(self, pages: Iterable[Dict]) -> int:
+        """
+        Consume the page iterator, embed and insert every page.
+        A page that fails on its own does not stop the others; check failed afterwards.
+        Returns:
+            Number of pages inserted into Weaviate.
+        """
+        render_queue = queue.Queue(maxsize=self.queue_size)
+        insert_queue = queue.Queue(maxsize=self.queue_size)
+
+        # Stage threads record their metrics against the document being ingested
+        document = metrics.current_document()
+        workers = [
+            threading.Thread(
+                target=self._render_stage, args=(pages, render_queue, document), name="render", daemon=True
+            ),
+            threading.Thread(
+                target=self._embed_stage, args=(render_queue, insert_queue, document), name="embed", daemon=True
+            ),
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+
+        try:
+            inserted = self._insert_stage(insert_queue)
+        except BaseException as e:
+            self._fail(e)
+            raise
+        finally:
+            self._stop.set()
+            for worker in workers:
+                worker.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+        if self.failed:
+            logger.error(
+                f"{self.failed} pages failed: {len(self.failed_pages)} before insertion "
+                f"(pages {self.failed_pages}), {len(self.failed_objects)} rejected by Weaviate."
+            )
+
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"Streaming pipeline inserted {inserted} pages in {elapsed:.1f}s "
+            f"({inserted / elapsed if elapsed else 0.0:.2f} pages/s end to end, "
+            f"{self._embedded_pages / self._embed_seconds if self._embed_seconds else 0.0:.2f} pages/s embedding)."
+        )
+        return inserted
+
+    @property
+    def failed(self) -> int:
+        """Number of pages of the last run that did not make it into Weaviate."""
+        return len(self.failed_pages) + len(self.failed_objects)
+
+    def _fail(self, error: BaseException):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Block until there is room in the queue, giving up if another stage failed."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _SENTINEL
+
+    def _render_stage(self, pages: Iterable[Dict], render_queue: queue.Queue, document: Dict = None):
+        with metrics.stage_thread(document):
+            try:
+                # Pages travel with the time their rendering started, for per-page latency
+                page_start = time.perf_counter()
+                for element in pages:
+                    if not self._put(render_queue, (element, page_start)):
+                        return
+                    page_start = time.perf_counter()
+            except Exception as e:
+                logger.exception("Render stage failed.")
+                self._fail(e)
+                return
+            self._put(render_queue, _SENTINEL)
+
+    def _embed_stage(self, render_queue: queue.Queue, insert_queue: queue.Queue, document: Dict = None):
+        with metrics.stage_thread(document):
+            try:
+                done = False
+                while not done:
+                    chunk = []
+                    while len(chunk) < self.embed_chunk_size:
+                        item = self._get(render_queue)
+                        if item is _SENTINEL:
+                            done = True
+                            break
+                        chunk.append(item)
+
+                    if not chunk:
+                        break
+
+                    # Blank pages and aliased duplicates (see PageTriage) skip the model. A duplicate
+                    # whose original has left the embedding window is embedded like any other page.
+                    to_embed = []
+                    embedded_in_chunk = set()
+                    # Looked up before this chunk's pages can evict them from the window
+                    reused = {}
+                    for element, _ in chunk:
+                        triage = element.get("triage")
+                        if triage == "blank":
+                            continue
+                        if triage == "duplicate":
+                            alias_of = element.get("alias_of")
+                            if alias_of in embedded_in_chunk:
+                                continue
+                            embedding = self._recent_embeddings.get(alias_of)
+                            if embedding is not None:
+                                reused[id(element)] = embedding
+                                continue
+                            logger.debug(f"Embedding of page {alias_of} is gone, embedding its duplicate again.")
+                        to_embed.append(element)
+                        embedded_in_chunk.add(self._page_number(element))
+                    embeddings = iter(())
+                    if to_embed:
+                        embed_start = time.perf_counter()
+                        # Pages go to the model as raw pixels, without an encode/decode round trip
+                        embeddings = iter(self.model.multi_vectorize_images(to_embed))
+                        embed_seconds = time.perf_counter() - embed_start
+                        self._embed_seconds += embed_seconds
+                        self._embedded_pages += len(to_embed)
+                        metrics.observe("embed_batch_seconds", embed_seconds)
+                        metrics.increment("pages_embedded", len(to_embed))
+                        for _ in to_embed:
+                            metrics.observe("embed_page_seconds", embed_seconds / len(to_embed))
+
+                    chunk_embeddings = {}
+                    to_embed_ids = {id(element) for element in to_embed}
+                    for element, page_start in chunk:
+                        if element.get("triage") == "blank":
+                            # Stored without a vector so incremental runs see the page as done
+                            embedding = None
+                        elif id(element) in to_embed_ids:
+                            embedding = next(embeddings)
+                            page_number = self._page_number(element)
+                            chunk_embeddings[page_number] = embedding
+                            self._remember(page_number, embedding)
+                        elif id(element) in reused:
+                            embedding = reused[id(element)]
+                        else:
+                            # Aliased to a page embedded earlier in this chunk
+                            embedding = chunk_embeddings[element.get("alias_of")]
+                        if not self._put(insert_queue, (element, page_start, embedding)):
+                            return
+            except Exception as e:
+                logger.exception("Embed stage failed.")
+                self._fail(e)
+                return
+            self._put(insert_queue, _SENTINEL)
+
+    @staticmethod
+    def _page_number(element) -> int:
+        return getattr(element, "page_number", None) or element.get("page_number")
+
+    def _remember(self, page_number: int, embedding):
+        self._recent_embeddings[page_number] = embedding
+        while len(self._recent_embeddings) > self.alias_window:
+            self._recent_embeddings.popitem(last=False)
+
+    def _insert_stage(self, insert_queue: queue.Queue) -> int:
+        property_names = [prop["name"] for prop in self.config["weaviate"]["collection"]["properties"]]
+
+        with self.manager.batch_writer(tenant=self.tenant) as writer:
+            while True:
+                item = self._get(insert_queue)
+                if item is _SENTINEL:
+                    break
+
+                element, page_start, embedding = item
+                try:
+                    # Hand the vectors to the client as a NumPy array (safe for any device)
+                    if embedding is None:
+                        embedding_array = None
+                    elif self.compressor is not None:
+                        with metrics.timer("compress_page_seconds"):
+                            embedding_array = self.compressor.compress(embedding)
+                    else:
+                        embedding_array = embedding.detach().cpu().float().numpy()
+
+                    # Prepare properties based on config
+                    properties = {name: element.get(name, None) for name in property_names}
+
+                    writer.add(properties=properties, embedding=embedding_array, uuid=element.get("uuid"))
+                    metrics.observe("page_seconds", time.perf_counter() - page_start)
+                    logger.debug(f"Queued page {element.get('page_number')} for insertion.")
+                except Exception as e:
+                    logger.exception(f"Failed to process page {element.get('page_number')}: {e}")
+                    self.failed_pages.append(element.get("page_number"))
+
+        self.failed_objects = writer.failed_objects
+        metrics.increment("pages_inserted", writer.inserted)
+        return writer.inserted
@@ -0,0 +1,156 @@
+import logging
+import math
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator
+import numpy as np
+from PIL import Image
+from util.page import Page
+from util.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class PageTriage:
+    def __init__(self, config: dict):
+        """
+        Decide per page how much embedding compute it deserves, between rendering and embedding.
+        - Blank pages are marked triage=blank: they are stored without a vector and never embedded.
+        - Near-duplicates of a recent page (perceptual hash, confirmed on a thumbnail) are marked
+          triage=duplicate with alias_of and reuse that page's embedding.
+        - Sparse pages are downscaled towards min_pixels so they produce fewer visual tokens;
+          near-blank pages get min_pixels outright.
+        Content density is the share of pixels that differ from the page background on a
+        small grayscale thumbnail.
+        """
+        triage_config = config.get("triage", {})
+        self.blank_density = triage_config.get("blank_density", 0.001)
+        self.near_blank_density = triage_config.get("near_blank_density", 0.01)
+        self.dense_density = triage_config.get("dense_density", 0.08)
+        self.duplicates = triage_config.get("duplicates", True)
+        self.duplicate_hash_distance = triage_config.get("duplicate_hash_distance", 6)
+        self.duplicate_max_difference = triage_config.get("duplicate_max_difference", 2.0)
+        self.duplicate_window = triage_config.get("duplicate_window", 64)
+        self.adaptive_resolution = triage_config.get("adaptive_resolution", True)
+        self.min_pixels = triage_config.get("min_pixels", 128 * 28 * 28)
+        # The processor never uses more than this, whatever the page size
+        self.max_pixels = config["pdf_parser"].get("rasterization", {}).get("max_pixels", 768 * 28 * 28)
+
+        self.report: Dict[str, int] = {}
+
+    @staticmethod
+    def _thumbnail(page: Page) -> np.ndarray:
+        return np.asarray(page.image.resize((128, 128), Image.BILINEAR).convert("L"), dtype=np.float32)
+
+    @staticmethod
+    def _density(thumbnail: np.ndarray) -> float:
+        # The most common gray level is the paper, also for off-white scans
+        histogram = np.bincount(thumbnail.astype(np.uint8).ravel(), minlength=256)
+        background = float(np.argmax(histogram))
+        return float(np.mean(np.abs(thumbnail - background) > 24))
+
+    @staticmethod
+    def _dhash(page: Page) -> int:
+        """256-bit difference hash: sign of horizontal gradients on a 17x16 grayscale thumbnail."""
+        pixels = np.asarray(page.image.resize((17, 16), Image.BILINEAR).convert("L"), dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+        return int("".join("1" if bit else "0" for bit in bits), 2)
+
+    def _visual_tokens(self, width: int, height: int) -> int:
+        return int(min(width * height, self.max_pixels) // (28 * 28))
+
+    def _pixel_budget(self, density: float) -> int:
+        if density <= self.near_blank_density:
+            return self.min_pixels
+        share = min((density - self.near_blank_density) / max(self.dense_density - self.near_blank_density, 1e-9), 1.0)
+        return int(self.min_pixels + share * (self.max_pixels - self.min_pixels))
+
+    def _find_duplicate(self, recent: "OrderedDict[int, tuple]", page_hash: int, thumbnail: np.ndarray):
+        for page_number, (other_hash, other_thumbnail) in reversed(recent.items()):
+            if bin(page_hash ^ other_hash).count("1") > self.duplicate_hash_distance:
+                continue
+            # Similar layouts hash alike; only alias pages whose pixels actually match
+            if float(np.mean(np.abs(thumbnail - other_thumbnail))) <= self.duplicate_max_difference:
+                return page_number
+        return None
+
+    def run(self, pages: Iterable[Page]) -> Iterator[Page]:
+        """Annotate (and, for sparse pages, downscale) pages as they stream through."""
+        self.report = {
+            "pages": 0, "blank": 0, "near_blank": 0, "duplicates": 0, "downscaled": 0,
+            "visual_tokens_before": 0, "visual_tokens_after": 0,
+        }
+        # Hashes of recently embedded pages, the ones a duplicate may alias
+        recent: "OrderedDict[int, tuple]" = OrderedDict()
+
+        for page in pages:
+            with metrics.timer("triage_page_seconds"):
+                page = self._triage(page, recent)
+            yield page
+
+        self._log_report()
+
+    def _triage(self, page: Page, recent: "OrderedDict[int, tuple]") -> Page:
+        report = self.report
+        tokens = self._visual_tokens(page.width, page.height)
+        report["pages"] += 1
+        report["visual_tokens_before"] += tokens
+
+        thumbnail = self._thumbnail(page)
+        density = self._density(thumbnail)
+
+        if density <= self.blank_density:
+            page.metadata["triage"] = "blank"
+            report["blank"] += 1
+            logger.debug(f"Page {page.page_number} is blank (density {density:.4f}), not embedding it.")
+            return page
+
+        if self.duplicates:
+            page_hash = self._dhash(page)
+            original = self._find_duplicate(recent, page_hash, thumbnail)
+            if original is not None:
+                page.metadata["triage"] = "duplicate"
+                page.metadata["alias_of"] = original
+                report["duplicates"] += 1
+                logger.debug(f"Page {page.page_number} duplicates page {original}, reusing its embedding.")
+                return page
+            recent[page.page_number] = (page_hash, thumbnail)
+            while len(recent) > self.duplicate_window:
+                recent.popitem(last=False)
+
+        if density <= self.near_blank_density:
+            page.metadata["triage"] = "near_blank"
+            report["near_blank"] += 1
+
+        if self.adaptive_resolution:
+            budget = self._pixel_budget(density)
+            area = page.width * page.height
+            if area > budget and budget < self.max_pixels:
+                scale = math.sqrt(budget / area)
+                size = (max(int(page.width * scale), 28), max(int(page.height * scale), 28))
+                # The image store already has the page at the rasterization budget; only the embedded copy shrinks
+                page = Page.from_image(
+                    page.page_number,
+                    page.image.resize(size, Image.LANCZOS),
+                    metadata=page.metadata,
+                    encoding=page.encoding,
+                )
+                report["downscaled"] += 1
+
+        report["visual_tokens_after"] += self._visual_tokens(page.width, page.height)
+        return page
+
+    def _log_report(self):
+        report = self.report
+        before = report["visual_tokens_before"]
+        # Blank and duplicate pages cost no embedding compute at all
+        saved = before - report["visual_tokens_after"]
+        report["visual_tokens_saved_pct"] = round(100.0 * saved / before, 1) if before else 0.0
+
+        metrics.increment("triage_pages_blank", report["blank"])
+        metrics.increment("triage_pages_duplicate", report["duplicates"])
+        metrics.increment("triage_pages_downscaled", report["downscaled"])
+        metrics.increment("triage_visual_tokens_saved", saved)
+        logger.info(
+            f"Triage: {report['pages']} pages, {report['blank']} blank, {report['near_blank']} near-blank, "
+            f"{report['duplicates']} duplicates, {report['downscaled']} downscaled; "
+            f"~{saved}/{before} visual tokens saved ({report['visual_tokens_saved_pct']}%)."
+        )
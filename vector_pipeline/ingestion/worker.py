@@ -0,0 +1,106 @@
+import logging
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from ingestion.jobs import DocumentJob, JobQueue
+from ingestion.runner import DocumentIngestor
+
+logger = logging.getLogger(__name__)
+
+class IngestionWorker:
+    def __init__(self, ingestor: DocumentIngestor, job_queue: JobQueue, config: dict):
+        """
+        Consume document jobs from a queue with a single loaded model.
+        Up to concurrency documents are processed at once. While a job is running its
+        queue visibility is extended periodically, and on SIGTERM/SIGINT the worker stops
+        receiving new jobs and drains the ones in flight before returning.
+        """
+        worker_config = config.get("worker", {})
+        self.ingestor = ingestor
+        self.job_queue = job_queue
+        self.concurrency = worker_config.get("concurrency", 1)
+        self.visibility_timeout = worker_config.get("visibility_timeout", 900)
+        self.poll_wait_seconds = worker_config.get("poll_wait_seconds", 10)
+        self.exit_when_idle = worker_config.get("exit_when_idle", False)
+
+        self._stop = threading.Event()
+        self._slot_freed = threading.Event()
+        self._in_flight: Dict[int, DocumentJob] = {}
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self, *_):
+        if not self._stop.is_set():
+            logger.info("Shutdown requested, draining in-flight jobs.")
+        self._stop.set()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        heartbeat = threading.Thread(target=self._heartbeat, name="visibility-heartbeat", daemon=True)
+        heartbeat.start()
+
+        logger.info(f"Worker started with concurrency {self.concurrency}.")
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ingest") as executor:
+            while not self._stop.is_set():
+                free_slots = self.concurrency - self._in_flight_count()
+                if free_slots <= 0:
+                    self._slot_freed.wait(timeout=1)
+                    self._slot_freed.clear()
+                    continue
+
+                jobs = self.job_queue.receive(max_jobs=free_slots, wait_seconds=self.poll_wait_seconds)
+                if not jobs:
+                    if self.exit_when_idle and self._in_flight_count() == 0:
+                        logger.info("Queue is empty, exiting.")
+                        break
+                    continue
+
+                for job in jobs:
+                    with self._lock:
+                        self._in_flight[id(job)] = job
+                    executor.submit(self._process, job)
+
+        logger.info(f"Worker stopped: {self.processed} documents processed, {self.failed} failed.")
+
+    def _in_flight_count(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+    def _process(self, job: DocumentJob):
+        start = time.perf_counter()
+        try:
+            self.ingestor.ingest(job.bucket, job.key, page_start=job.page_start, page_end=job.page_end)
+            self.job_queue.ack(job)
+            with self._lock:
+                self.processed += 1
+            logger.info(f"Finished {job} in {time.perf_counter() - start:.1f}s.")
+        except Exception:
+            logger.exception(f"Failed to process {job}, returning it to the queue.")
+            with self._lock:
+                self.failed += 1
+            try:
+                self.job_queue.nack(job)
+            except Exception:
+                logger.exception(f"Failed to return {job} to the queue.")
+        finally:
+            with self._lock:
+                self._in_flight.pop(id(job), None)
+            self._slot_freed.set()
+
+    def _heartbeat(self):
+        """Extend visibility of running jobs well before it expires, so no other worker picks them up."""
+        interval = max(self.visibility_timeout // 3, 1)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                jobs = list(self._in_flight.values())
+            for job in jobs:
+                try:
+                    self.job_queue.extend_visibility(job, self.visibility_timeout)
+                except Exception:
+                    logger.warning(f"Failed to extend visibility of {job}.")
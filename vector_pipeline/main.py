@@ -1,11 +1,11 @@
 import logging
 import os
 from util.logging_config import setup_logging
-from util.download_pdf import download_pdf_from_s3
-from util.pdf_util import PDFImageConverter
 from util.load_config import load_config
-from parser.colqwen import Colqwen
-from vector_store.weaviate import WeaviateCollectionManager
+from ingestion.runner import DocumentIngestor
+from ingestion.jobs import create_job_queue
+from ingestion.worker import IngestionWorker
+from util.metrics import metrics
 
 if __name__ == "__main__":
     # Setup logging
@@ -15,66 +15,41 @@ if __name__ == "__main__":
 
     # Read env variables from EventBridge
     logger.info("Reading env variables")
+    mode = os.environ.get("PIPELINE_MODE", "single")
     bucket = os.environ.get("S3_BUCKET")
     key = os.environ.get("S3_KEY")
-    logger.info(f"Bucket: {bucket} - key: {key}")
+    # Set by the dispatcher when a large document is split into page-range shards
+    page_start = int(os.environ["PAGE_START"]) if os.environ.get("PAGE_START") else None
+    page_end = int(os.environ["PAGE_END"]) if os.environ.get("PAGE_END") else None
+    logger.info(f"Mode: {mode} - bucket: {bucket} - key: {key} - pages: {page_start}-{page_end}")
 
     try:
         # Load config
         config = load_config("config.yaml")
+        metrics.configure(config)
 
-        # Download PDF
-        pdf_path = download_pdf_from_s3(bucket, key)
+        # Connect to Weaviate once; the model is loaded on the first document
+        ingestor = DocumentIngestor(config)
 
-        # Convert PDF to base64 images with metadata
-        converter = PDFImageConverter(pdf_path, config)
-        base64_images = converter.convert_to_base64_images()
-
-        logger.info(f"Extracted {len(base64_images)} pages from PDF.")
-
-        # Initialize model
-        model = Colqwen(
-            model_name=config["pdf_parser"]["model_specs"]["model_name"], 
-            device_map=config["pdf_parser"]["model_specs"]["device_map"], 
-            attn_implementation=config["pdf_parser"]["model_specs"]["attn_implementation"]
-        )
-
-        # Setup Weaviate
-        manager = WeaviateCollectionManager(config=config)
-        manager.connect(
-            connection_type=config["weaviate"]["connection"]["type"], 
-            host=config["weaviate"]["connection"]["host"],
-        )
-        manager._create_collection_if_not_exists()
-
-        # Process each page/image
-        for element in base64_images:
-            try:
-                base64_img = element.get("base64_image")
-                embedding = model.multi_vectorize_image(base64_img)
-
-                # Convert tensor to list (safe for any device)
-                embedding_list = embedding.detach().cpu().float().numpy().tolist()
-
-                # Prepare properties based on config
-                properties = {
-                    prop["name"]: element.get(prop["name"], None)
-                    for prop in config["weaviate"]["collection"]["properties"]
-                }
-
-                manager.insert_object(properties=properties, embedding=embedding_list)
-                logger.info(f"Inserted page {element.get('page_number')} into Weaviate.")
-            except Exception as e:
-                logger.exception(f"Failed to process page {element.get('page_number')}: {e}")
+        if mode == "worker":
+            # Process jobs from the queue until it is drained or the task is stopped
+            worker = IngestionWorker(ingestor=ingestor, job_queue=create_job_queue(config), config=config)
+            worker.run()
+        else:
+            ingestor.ingest(bucket, key, page_start=page_start, page_end=page_end)
 
     except Exception as pipeline_error:
         logger.exception(f"Pipeline failed: {pipeline_error}")
 
     finally:
         # Ensure the Weaviate client is closed properly
-        if "manager" in locals() and hasattr(manager, "client") and manager.client is not None:
+        if "ingestor" in locals() and ingestor.manager.client is not None:
             try:
-                manager.client.close()
+                ingestor.close()
                 logger.info("Weaviate client connection closed.")
             except Exception as e:
                 logger.warning(f"Failed to close Weaviate client cleanly: {e}")
+
+        # One structured summary per run, also when it failed; written after close so the
+        # peak memory includes the rendering processes, which are reaped on shutdown
+        metrics.write_summary()
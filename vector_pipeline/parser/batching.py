@@ -0,0 +1,46 @@
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+class TokenBudgetBatcher:
+    def __init__(self, max_batch_tokens: int = 8192, max_batch_size: int = 8):
+        """Group items into batches whose padded token count stays within a budget."""
+        if max_batch_tokens <= 0 or max_batch_size <= 0:
+            raise ValueError("max_batch_tokens and max_batch_size must be positive.")
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+
+    def batches(self, token_counts: List[int]) -> List[List[int]]:
+        """
+        Split item indices into batches.
+        Items are sorted by token count so that each batch holds items of similar length,
+        which keeps the padding added by the processor small. A batch costs
+        len(batch) * longest item, and that cost never exceeds max_batch_tokens
+        (an item larger than the budget gets a batch of its own).
+        Returns:
+            List of batches, each a list of indices into token_counts.
+        """
+        order = sorted(range(len(token_counts)), key=lambda i: token_counts[i], reverse=True)
+
+        batches = []
+        current = []
+        current_max = 0
+        for idx in order:
+            tokens = token_counts[idx]
+            padded_max = max(current_max, tokens)
+            if current and (
+                len(current) >= self.max_batch_size
+                or padded_max * (len(current) + 1) > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current = []
+                padded_max = tokens
+            current.append(idx)
+            current_max = padded_max
+
+        if current:
+            batches.append(current)
+
+        logger.debug(f"Grouped {len(token_counts)} items into {len(batches)} batches.")
+        return batches
@@ -1,23 +1,50 @@
 import logging
+import os
+import time
 import torch
 from PIL import Image
 import base64
 from io import BytesIO
+from typing import List, Union
 from colpali_engine.models import ColQwen2, ColQwen2Processor
+from transformers.models.qwen2_vl.image_processing_qwen2_vl import smart_resize
+from parser.batching import TokenBudgetBatcher
+from parser.embedding_cache import EmbeddingCache
+from util.page import Page
 
 logger = logging.getLogger(__name__)
 
 class Colqwen:
-    def __init__(self, model_name, device_map, attn_implementation):
+    def __init__(
+        self,
+        model_name,
+        device_map,
+        attn_implementation,
+        max_batch_tokens=8192,
+        max_batch_size=8,
+        cache_config=None,
+        torch_dtype="bfloat16",
+        cpu_config=None,
+    ):
         """Load the model and processor from huggingface."""
+        cpu_config = cpu_config if cpu_config and cpu_config.get("enabled", False) else None
         logger.info(
             f"Initializing Colqwen with model '{model_name}', device '{device_map}', "
-            f"attention implementation '{attn_implementation}'"
+            f"attention implementation '{attn_implementation}', dtype '{torch_dtype}', "
+            f"max batch tokens {max_batch_tokens}, max batch size {max_batch_size}, "
+            f"CPU mode {'on' if cpu_config else 'off'}"
         )
+        self.batcher = TokenBudgetBatcher(max_batch_tokens=max_batch_tokens, max_batch_size=max_batch_size)
+        self.quantized = False
+
+        # Thread pools must be sized before torch runs any parallel work
+        if cpu_config:
+            self._configure_cpu_threads(cpu_config)
+
         try:
             self.model = ColQwen2.from_pretrained(
                 model_name,
-                torch_dtype=torch.bfloat16,
+                torch_dtype=getattr(torch, torch_dtype),
                 device_map=device_map,
                 attn_implementation=attn_implementation,
             ).eval()
@@ -26,6 +53,9 @@ class Colqwen:
             logger.exception("Failed to load model.")
             raise
 
+        if cpu_config and cpu_config.get("quantize_int8", False):
+            self._quantize_int8()
+
         try:
             self.processor = ColQwen2Processor.from_pretrained(model_name)
             logger.info("Processor loaded successfully.")
@@ -33,6 +63,90 @@ class Colqwen:
             logger.exception("Failed to load processor.")
             raise
 
+        self.model_name = model_name
+        self.cache = self._create_cache(cache_config)
+
+        if cpu_config and cpu_config.get("warmup", False):
+            self._warmup()
+
+    @classmethod
+    def from_config(cls, config: dict, embedding_cache: bool = False) -> "Colqwen":
+        """
+        Build the model from the pdf_parser section of the config.
+        Only ingestion sets embedding_cache; pdf_parser.embedding_cache then configures it.
+        """
+        model_specs = config["pdf_parser"]["model_specs"]
+        batching = config["pdf_parser"].get("batching", {})
+        return cls(
+            model_name=model_specs["model_name"],
+            device_map=model_specs["device_map"],
+            attn_implementation=model_specs["attn_implementation"],
+            max_batch_tokens=batching.get("max_batch_tokens", 8192),
+            max_batch_size=batching.get("max_batch_size", 8),
+            cache_config=config["pdf_parser"].get("embedding_cache") if embedding_cache else None,
+            torch_dtype=model_specs.get("torch_dtype", "bfloat16"),
+            cpu_config=model_specs.get("cpu"),
+        )
+
+    @staticmethod
+    def _configure_cpu_threads(cpu_config):
+        """Size torch's intra-op and inter-op thread pools to the vCPUs available to the task."""
+        available_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        intra_op_threads = cpu_config.get("intra_op_threads", "auto")
+        if intra_op_threads == "auto":
+            intra_op_threads = available_cpus
+        inter_op_threads = cpu_config.get("inter_op_threads", 1)
+
+        torch.set_num_threads(int(intra_op_threads))
+        try:
+            torch.set_num_interop_threads(int(inter_op_threads))
+        except RuntimeError:
+            logger.warning("Inter-op threads were already initialized; keeping the existing setting.")
+        logger.info(
+            f"CPU threads: {torch.get_num_threads()} intra-op, {torch.get_num_interop_threads()} inter-op "
+            f"({available_cpus} vCPUs available)."
+        )
+
+    def _quantize_int8(self):
+        """Replace the model's linear layers with dynamically quantized int8 versions."""
+        try:
+            if self.model.dtype != torch.float32:
+                logger.info(f"Casting model from {self.model.dtype} to float32 for int8 quantization.")
+                self.model = self.model.float()
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.quantized = True
+            logger.info("Applied dynamic int8 quantization to linear layers.")
+        except Exception:
+            logger.exception("Failed to quantize model.")
+            raise
+
+    def _warmup(self):
+        """Run one image and one query through the model so the first real page does not pay for it."""
+        start = time.perf_counter()
+        warmup_page = Image.new("RGB", (448, 448), color="white")
+        with torch.no_grad():
+            self.model(**self.processor.process_images([warmup_page]).to(self.model.device))
+            self.model(**self.processor.process_queries(["warmup"]).to(self.model.device))
+        logger.info(f"Model warm-up finished in {time.perf_counter() - start:.2f}s.")
+
+    def _cache_namespace(self) -> str:
+        """Everything besides the page pixels that changes the embedding."""
+        image_processor = self.processor.image_processor
+        return (
+            f"{self.model_name}|{self.model.dtype}|int8={self.quantized}|min_pixels={image_processor.min_pixels}|"
+            f"max_pixels={image_processor.max_pixels}|patch_size={image_processor.patch_size}|"
+            f"merge_size={image_processor.merge_size}"
+        )
+
+    def _create_cache(self, cache_config):
+        if not cache_config or not cache_config.get("enabled", False):
+            return None
+        return EmbeddingCache(
+            cache_dir=cache_config["path"],
+            max_size_bytes=int(cache_config.get("max_size_gb", 10) * 1024 ** 3),
+            namespace=self._cache_namespace(),
+        )
+
     @staticmethod
     def _base64_to_pil(base64_str: str) -> Image.Image:
         image_data = base64.b64decode(base64_str)
@@ -42,14 +156,82 @@ class Colqwen:
         """Accept base64-encoded image and return multi-vector embedding."""
         try:
             img = self._base64_to_pil(img_base64)
+            if self.cache is not None:
+                cache_key = self.cache.key(img)
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
             image_batch = self.processor.process_images([img]).to(self.model.device)
             with torch.no_grad():
                 image_embedding = self.model(**image_batch)
+
+            if self.cache is not None:
+                self.cache.put(cache_key, image_embedding[0])
             return image_embedding[0]
         except Exception as e:
             logger.exception("Failed to vectorize base64 image.")
             raise
 
+    def _estimate_visual_tokens(self, img: Image.Image) -> int:
+        """Number of visual tokens the processor will produce for the image after resizing."""
+        image_processor = self.processor.image_processor
+        factor = image_processor.patch_size * image_processor.merge_size
+        height, width = smart_resize(
+            img.height,
+            img.width,
+            factor=factor,
+            min_pixels=image_processor.min_pixels,
+            max_pixels=image_processor.max_pixels,
+        )
+        return (height // factor) * (width // factor)
+
+    def multi_vectorize_images(self, pages: List[Union[Page, str, Image.Image]]) -> List[torch.Tensor]:
+        """
+        Accept rendered pages, base64-encoded or PIL images and return one multi-vector embedding per page.
+        Pages are grouped by visual-token count so each forward pass stays within the
+        batcher's token budget. Padding tokens are stripped from the returned embeddings,
+        which are in the same order as the input pages.
+        """
+        try:
+            pages = [self._base64_to_pil(page) if isinstance(page, str) else page for page in pages]
+            # The processor works on PIL images; a Page's image shares its pixel buffer
+            images = [page.image if isinstance(page, Page) else page for page in pages]
+            embeddings = [None] * len(images)
+
+            # Serve pages that were already embedded from the cache
+            cache_keys = [None] * len(images)
+            if self.cache is not None:
+                for idx, page in enumerate(pages):
+                    cache_keys[idx] = self.cache.key(page)
+                    embeddings[idx] = self.cache.get(cache_keys[idx])
+
+            pending = [idx for idx, embedding in enumerate(embeddings) if embedding is None]
+            token_counts = [self._estimate_visual_tokens(images[idx]) for idx in pending]
+
+            for batch in self.batcher.batches(token_counts):
+                batch_indices = [pending[i] for i in batch]
+                image_batch = self.processor.process_images(
+                    [images[idx] for idx in batch_indices]
+                ).to(self.model.device)
+                with torch.no_grad():
+                    batch_embeddings = self.model(**image_batch)
+
+                attention_mask = image_batch["attention_mask"].bool()
+                for row, idx in enumerate(batch_indices):
+                    embeddings[idx] = batch_embeddings[row][attention_mask[row]]
+                    if self.cache is not None:
+                        self.cache.put(cache_keys[idx], embeddings[idx])
+
+                logger.debug(
+                    f"Vectorized batch of {len(batch_indices)} pages "
+                    f"({max(token_counts[i] for i in batch)} max visual tokens)."
+                )
+            return embeddings
+        except Exception as e:
+            logger.exception("Failed to vectorize image batch.")
+            raise
+
     def multi_vectorize_text(self, query):
         """Return the multi-vector embedding of the query text string."""
         logger.debug(f"Processing text query for vectorization: '{query}'")
@@ -64,6 +246,21 @@ class Colqwen:
             logger.exception("Failed to vectorize text.")
             raise
 
+    def multi_vectorize_texts(self, queries: List[str]) -> List[torch.Tensor]:
+        """Return one multi-vector embedding per query, computed in a single forward pass."""
+        logger.debug(f"Processing batch of {len(queries)} text queries for vectorization.")
+        try:
+            query_batch = self.processor.process_queries(queries).to(self.model.device)
+            with torch.no_grad():
+                query_embeddings = self.model(**query_batch)
+
+            attention_mask = query_batch["attention_mask"].bool()
+            logger.info(f"{len(queries)} texts successfully vectorized.")
+            return [query_embeddings[row][attention_mask[row]] for row in range(len(queries))]
+        except Exception as e:
+            logger.exception("Failed to vectorize text batch.")
+            raise
+
     def maxsim(self, query_embedding, image_embedding):
         """Compute the MaxSim between the query and image multi-vectors."""
         logger.debug("Computing MaxSim score between query and image embeddings.")
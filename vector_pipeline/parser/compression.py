@@ -0,0 +1,48 @@
+import logging
+import numpy as np
+import torch
+from scipy.cluster.hierarchy import fcluster, linkage
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCompressor:
+    def __init__(self, pool_factor: int = 1, dtype: str = "float32"):
+        """
+        Shrink page multi-vectors before they are stored.
+        pool_factor > 1 merges similar tokens with hierarchical clustering so that roughly
+        1/pool_factor vectors remain; dtype sets the precision of the returned array.
+        """
+        if pool_factor < 1:
+            raise ValueError("pool_factor must be at least 1.")
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported embedding dtype '{dtype}'.")
+        self.pool_factor = pool_factor
+        self.dtype = np.dtype(dtype)
+        logger.info(f"Embedding compression: pool factor {pool_factor}, dtype {dtype}.")
+
+    def compress(self, embedding: torch.Tensor) -> np.ndarray:
+        """Return the (optionally pooled) multi-vector as a NumPy array of shape (tokens, dim)."""
+        vectors = embedding.detach().cpu().float().numpy()
+        if self.pool_factor > 1:
+            vectors = self.hierarchical_token_pooling(vectors, self.pool_factor)
+        return vectors.astype(self.dtype, copy=False)
+
+    @staticmethod
+    def hierarchical_token_pooling(vectors: np.ndarray, pool_factor: int) -> np.ndarray:
+        """
+        Cluster token vectors with Ward linkage on cosine distance and mean-pool each cluster.
+        Pooled vectors are re-normalised so MaxSim scores keep the same scale.
+        """
+        num_tokens = vectors.shape[0]
+        num_clusters = max(num_tokens // pool_factor, 1)
+        if num_tokens <= 2 or num_clusters >= num_tokens:
+            return vectors
+
+        similarities = vectors @ vectors.T
+        distances = np.clip(1.0 - similarities, 0.0, None)
+        condensed = distances[np.triu_indices(num_tokens, k=1)]
+        labels = fcluster(linkage(condensed, method="ward"), t=num_clusters, criterion="maxclust")
+
+        pooled = np.stack([vectors[labels == label].mean(axis=0) for label in np.unique(labels)])
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.maximum(norms, 1e-12)
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import numpy as np
+import torch
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, max_size_bytes: int, namespace: str):
+        """
+        On-disk cache of page multi-vectors stored as float16 .npy files.
+        Entries are keyed by the rendered page pixels and the namespace (model name and
+        processor settings), so the directory can be shared between tasks on a mounted
+        volume. The least recently used entries are evicted once max_size_bytes is exceeded.
+        Safe to share between the threads of a worker processing several documents.
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        # Guards the counters, the size estimate and eviction
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size_bytes = sum(size for _, _, size in self._entries())
+        logger.info(
+            f"Embedding cache at {cache_dir} holds {self._size_bytes / 1e6:.1f} MB "
+            f"(limit {max_size_bytes / 1e6:.1f} MB)."
+        )
+
+    def key(self, img: Image.Image) -> str:
+        """Accepts a PIL image or a rendered Page, whose pixel buffer is hashed without a copy."""
+        digest = hashlib.sha256()
+        digest.update(self.namespace.encode("utf-8"))
+        digest.update(f"{img.mode}|{img.width}x{img.height}".encode("utf-8"))
+        digest.update(img.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            embedding = np.load(path)
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return torch.from_numpy(embedding)
+
+    def put(self, key: str, embedding: torch.Tensor):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        array = embedding.detach().cpu().to(torch.float16).numpy()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        except Exception:
+            logger.exception(f"Failed to write embedding cache entry {key}.")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        size = os.path.getsize(path)
+        with self._lock:
+            self._size_bytes += size
+            if self._size_bytes > self.max_size_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".npy"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Another task evicted it in the meantime
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is back under 90% of its limit. Called with the lock held."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._size_bytes = sum(size for _, _, size in entries)
+        target = self.max_size_bytes * 0.9
+
+        evicted = 0
+        for path, _, size in entries:
+            if self._size_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size_bytes -= size
+            evicted += 1
+
+        logger.info(f"Evicted {evicted} embedding cache entries.")
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        logger.info(
+            f"Embedding cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.1%} hit rate), {self._size_bytes / 1e6:.1f} MB on disk."
+        )
@@ -1,15 +1,41 @@
+import copy
+import hashlib
 import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Iterator, List, Tuple
 import torch
-import base64
-from io import BytesIO
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoTokenizer, AutoProcessor
-from qwen_vl_utils import process_vision_info
+from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor, TextIteratorStreamer
+from util.page import Page
 
 logger = logging.getLogger(__name__)
 
+# The chat template inserts this system prompt when none is given
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+
 class Qwen:
-    def __init__(self, model_name, device_map, attn_implementation, min_pixels, max_pixels):
-        """Load the model and processor"""
+    def __init__(
+        self,
+        model_name,
+        device_map,
+        attn_implementation,
+        min_pixels,
+        max_pixels,
+        system_prompt=DEFAULT_SYSTEM_PROMPT,
+        vision_cache_size=32,
+        prefix_cache=True,
+    ):
+        """
+        Load the model and processor.
+        Processed vision inputs of recently seen pages are kept in an LRU cache of
+        vision_cache_size entries, and the KV cache of the system prompt is computed
+        once and reused when prefix_cache is set. The reuse only applies to single-request
+        generations: left padding shifts the prefix of each row in a batch away from the
+        positions it was cached at, so batches are prefilled from scratch.
+        """
         logger.info(
             f"Initializing Qwen with model '{model_name}', device '{device_map}', "
             f"attention implementation '{attn_implementation}', "
@@ -22,6 +48,9 @@ class Qwen:
         self.attn_implementation = attn_implementation
         self.min_pixels = min_pixels
         self.max_pixels = max_pixels
+        self.system_prompt = system_prompt
+        self.vision_cache_size = vision_cache_size
+        self.prefix_cache = prefix_cache
 
         try:
             self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
@@ -31,54 +60,272 @@ class Qwen:
                 attn_implementation=self.attn_implementation
             )
             self.processor = AutoProcessor.from_pretrained(
-                self.model_name, 
-                min_pixels=self.min_pixels, 
+                self.model_name,
+                min_pixels=self.min_pixels,
                 max_pixels=self.max_pixels
             )
+            # Batched generation needs every prompt to end at the same position
+            self.processor.tokenizer.padding_side = "left"
             logger.info("Model loaded successfully.")
         except Exception as e:
             logger.exception("Failed to load model.")
             raise
-    
-    def query_images(self, query, images, max_tokens_output):
-        """Generate a textual response to the query (text) based on the information in the supplied list of PIL images."""
-        content = []
-        try:
-            logger.info("Processing images.")
-            for img in images:
-                buffer = BytesIO()
-                img.save(buffer, format="jpeg")
-                img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                content.append({"type": "image", "image": f"data:image;base64,{img_base64}"})
 
-            content.append({"type": "text", "text": query})
-            messages = [{"role": "user", "content": content}]
+        self._vision_cache: "OrderedDict[str, Tuple[torch.Tensor, torch.Tensor]]" = OrderedDict()
+        self._vision_lock = threading.Lock()
+        # Generation mutates model state (rope deltas), so calls never overlap
+        self._generate_lock = threading.Lock()
+        self._prefix_ids = None
+        self._prefix_kv = None
+        self.vision_cache_hits = 0
+        self.vision_cache_misses = 0
+
+    @staticmethod
+    def _image_key(img) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{img.mode}|{img.size[0]}x{img.size[1]}".encode("utf-8"))
+        digest.update(img.tobytes())
+        return digest.hexdigest()
+
+    def _vision_inputs(self, img) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Resized, normalised patches and the patch grid of one image, cached by pixel content."""
+        key = self._image_key(img)
+        with self._vision_lock:
+            cached = self._vision_cache.get(key)
+            if cached is not None:
+                self._vision_cache.move_to_end(key)
+                self.vision_cache_hits += 1
+                return cached
+
+        image = img.image if isinstance(img, Page) else img
+        processed = self.processor.image_processor(images=[image.convert("RGB")], return_tensors="pt")
+        # Stored in the model dtype; it is what generation casts them to anyway
+        entry = (processed["pixel_values"].to(self.model.dtype), processed["image_grid_thw"])
+
+        with self._vision_lock:
+            self.vision_cache_misses += 1
+            self._vision_cache[key] = entry
+            while len(self._vision_cache) > self.vision_cache_size:
+                self._vision_cache.popitem(last=False)
+        return entry
+
+    def _messages(self, query: str, num_images: int) -> List[dict]:
+        content = [{"type": "image"} for _ in range(num_images)]
+        content.append({"type": "text", "text": query})
+        return [
+            {"role": "system", "content": [{"type": "text", "text": self.system_prompt}]},
+            {"role": "user", "content": content},
+        ]
 
+    def _build_inputs(self, requests: List[Tuple[str, List]]) -> dict:
+        """
+        Tokenize a batch of (query, images) requests with left padding.
+        Does what the processor's __call__ does, but with cached vision inputs: every image
+        placeholder is expanded to the number of visual tokens of its patch grid.
+        """
+        image_token = self.processor.image_token
+        merge_length = self.processor.image_processor.merge_size ** 2
+
+        texts, pixel_values, grids = [], [], []
+        for query, images in requests:
             text = self.processor.apply_chat_template(
-                messages, tokenize=False, add_generation_prompt=True
+                self._messages(query, len(images)), tokenize=False, add_generation_prompt=True
             )
+            parts = text.split(image_token)
+            expanded = parts[0]
+            for img, part in zip(images, parts[1:]):
+                values, grid = self._vision_inputs(img)
+                pixel_values.append(values)
+                grids.append(grid)
+                expanded += image_token * int(grid.prod() // merge_length) + part
+            texts.append(expanded)
+
+        inputs = dict(self.processor.tokenizer(texts, padding=True, return_tensors="pt"))
+        if pixel_values:
+            inputs["pixel_values"] = torch.cat(pixel_values)
+            inputs["image_grid_thw"] = torch.cat(grids)
+        return {name: tensor.to(self.model.device) for name, tensor in inputs.items()}
+
+    def _rope_owner(self):
+        # get_rope_index and rope_deltas moved from the generation class to the inner model in newer transformers
+        inner = getattr(self.model, "model", None)
+        return inner if hasattr(inner, "get_rope_index") else self.model
 
-            image_inputs, video_inputs = process_vision_info(messages)
-            inputs = self.processor(
-                text=[text],
-                images=image_inputs,
-                videos=video_inputs,
-                padding=True,
-                return_tensors="pt",
+    def _prefill_prefix(self, inputs: dict):
+        """
+        Run the prompt through the model on top of a copy of the cached system-prompt KV,
+        leaving the last prompt token for generate(). Returns the cache, or None when
+        the prompt does not start with the cached prefix or is part of a padded batch.
+        """
+        if self._prefix_kv is None:
+            prefix_text = self.processor.apply_chat_template(
+                self._messages("", 0)[:1], tokenize=False, add_generation_prompt=False
             )
-            inputs = inputs.to(self.device_map)
-            logger.info("Images processed successfully.")
+            self._prefix_ids = self.processor.tokenizer(prefix_text, return_tensors="pt")["input_ids"].to(self.model.device)
+            with torch.no_grad():
+                self._prefix_kv = self.model(input_ids=self._prefix_ids, use_cache=True).past_key_values
+            logger.info(f"Cached KV of the {self._prefix_ids.shape[1]}-token system prompt.")
+
+        input_ids = inputs["input_ids"]
+        prefix_length = self._prefix_ids.shape[1]
+        if (
+            input_ids.shape[0] != 1
+            or input_ids.shape[1] <= prefix_length + 1
+            or not torch.equal(input_ids[:, :prefix_length], self._prefix_ids)
+        ):
+            return None
+
+        # Multimodal rotary positions of the whole prompt; text before the first image is sequential,
+        # so the cached prefix (computed as plain text) has the same positions
+        rope_owner = self._rope_owner()
+        position_ids, rope_deltas = rope_owner.get_rope_index(
+            input_ids=input_ids,
+            image_grid_thw=inputs.get("image_grid_thw"),
+            attention_mask=inputs["attention_mask"],
+        )
+
+        end = input_ids.shape[1] - 1
+        cache = copy.deepcopy(self._prefix_kv)
+        with torch.no_grad():
+            self.model(
+                input_ids=input_ids[:, prefix_length:end],
+                attention_mask=inputs["attention_mask"][:, :end],
+                pixel_values=inputs.get("pixel_values"),
+                image_grid_thw=inputs.get("image_grid_thw"),
+                position_ids=position_ids[:, :, prefix_length:end],
+                cache_position=torch.arange(prefix_length, end, device=input_ids.device),
+                past_key_values=cache,
+                use_cache=True,
+            )
+        # generate() derives positions of the remaining tokens from these deltas
+        rope_owner.rope_deltas = rope_deltas
+        return cache
+
+    def _generate(self, inputs: dict, max_tokens_output: int, streamer=None) -> torch.Tensor:
+        with self._generate_lock, torch.no_grad():
+            generate_kwargs = dict(inputs)
+            if self.prefix_cache:
+                try:
+                    cache = self._prefill_prefix(inputs)
+                except Exception:
+                    logger.warning("System-prompt KV reuse failed; generating without it from now on.", exc_info=True)
+                    self.prefix_cache = False
+                    cache = None
+                if cache is not None:
+                    # Images are already in the cache; only the last prompt token is left to process
+                    generate_kwargs.pop("pixel_values", None)
+                    generate_kwargs.pop("image_grid_thw", None)
+                    generate_kwargs["past_key_values"] = cache
+
+            return self.model.generate(**generate_kwargs, max_new_tokens=max_tokens_output, streamer=streamer)
+
+    def query_images_batch(self, requests: List[Tuple[str, List]], max_tokens_output) -> List[str]:
+        """Answer several (query, images) requests in one left-padded generate call."""
+        try:
+            logger.info(f"Processing {len(requests)} requests.")
+            inputs = self._build_inputs(requests)
 
             logger.info("Generating output.")
-            # Inference: Generation of the output.
-            generated_ids = self.model.generate(**inputs, max_new_tokens=max_tokens_output)
-            generated_ids_trimmed = [
-                out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-            ]
+            generated_ids = self._generate(inputs, max_tokens_output)
+            # Left padding: every prompt ends at the same position
+            generated_ids_trimmed = generated_ids[:, inputs["input_ids"].shape[1]:]
             logger.info("Output generated successfully.")
             return self.processor.batch_decode(
                 generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-            )[0] 
+            )
         except Exception as e:
             logger.exception("Failed to generate text.")
             raise
+
+    def query_images(self, query, images, max_tokens_output):
+        """Generate a textual response to the query (text) based on the information in the supplied list of PIL images or pages."""
+        return self.query_images_batch([(query, images)], max_tokens_output)[0]
+
+    def stream_query_images(self, query, images, max_tokens_output) -> Iterator[str]:
+        """Like query_images, but yield text as soon as tokens are generated."""
+        inputs = self._build_inputs([(query, images)])
+        streamer = TextIteratorStreamer(
+            self.processor.tokenizer, skip_prompt=True, skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )
+        errors = []
+
+        def run():
+            try:
+                self._generate(inputs, max_tokens_output, streamer=streamer)
+            except Exception as e:
+                logger.exception("Failed to generate text.")
+                errors.append(e)
+                # Unblock the consumer
+                streamer.end()
+
+        thread = threading.Thread(target=run, name="qwen-generate", daemon=True)
+        thread.start()
+        yield from streamer
+        thread.join()
+        if errors:
+            raise errors[0]
+
+
+class GenerationBatcher:
+    def __init__(self, qwen: Qwen, max_batch_size: int = 4, max_wait_ms: float = 20):
+        """
+        Coalesce concurrent query_images calls into one batched generate.
+        A batch is flushed when it is full or max_wait_ms after its first request arrived;
+        requests are only batched with others asking for the same max_tokens_output, the
+        rest wait for a later batch. The system-prompt KV is only reused by batches of one
+        request, so larger batches trade that saving for fewer generate calls.
+        """
+        self.qwen = qwen
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="qwen-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, query, images, max_tokens_output) -> Future:
+        future = Future()
+        self._queue.put((query, images, max_tokens_output, future))
+        return future
+
+    def query_images(self, query, images, max_tokens_output) -> str:
+        return self.submit(query, images, max_tokens_output).result()
+
+    def _run(self):
+        carried = []
+        while True:
+            batch = [carried.pop(0) if carried else self._queue.get()]
+            # Requests set aside by earlier rounds join the batch before new ones are awaited
+            still_carried = []
+            for request in carried:
+                if request[2] == batch[0][2] and len(batch) < self.max_batch_size:
+                    batch.append(request)
+                else:
+                    still_carried.append(request)
+            carried = still_carried
+            # The wait is measured from the first request, however many others trickle in after it
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request[2] == batch[0][2]:
+                    batch.append(request)
+                else:
+                    carried.append(request)
+
+            try:
+                answers = self.qwen.query_images_batch(
+                    [(query, images) for query, images, _, _ in batch], batch[0][2]
+                )
+            except Exception as e:
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (*_, future), answer in zip(batch, answers):
+                future.set_result(answer)
+            logger.debug(f"Generated answers for a batch of {len(batch)} requests.")
@@ -0,0 +1,63 @@
+import logging
+from typing import List, Sequence, Tuple
+import torch
+
+logger = logging.getLogger(__name__)
+
+class MaxSimReranker:
+    def __init__(self, device: str = "cpu", chunk_size: int = 64):
+        """
+        Exact late-interaction (MaxSim) scoring of many queries against many pages at once,
+        over whatever page vectors it is given (pooled ones if the pages were stored pooled).
+        Candidates are scored chunk_size pages at a time to bound the size of the
+        query-token x page-token similarity tensor.
+        """
+        self.device = device
+        self.chunk_size = chunk_size
+
+    def _pad(self, embeddings: Sequence) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Stack variable-length multi-vectors into a (N, max_len, dim) tensor and a (N, max_len) mask."""
+        tensors = [torch.as_tensor(embedding, dtype=torch.float32) for embedding in embeddings]
+        max_len = max(tensor.shape[0] for tensor in tensors)
+        dim = tensors[0].shape[1]
+
+        padded = torch.zeros(len(tensors), max_len, dim, dtype=torch.float32)
+        mask = torch.zeros(len(tensors), max_len, dtype=torch.bool)
+        for idx, tensor in enumerate(tensors):
+            padded[idx, : tensor.shape[0]] = tensor
+            mask[idx, : tensor.shape[0]] = True
+        return padded.to(self.device), mask.to(self.device)
+
+    def score(self, query_embeddings: Sequence, page_embeddings: Sequence) -> torch.Tensor:
+        """
+        Score every query against every page.
+        Returns:
+            Tensor of shape (num_queries, num_pages) with MaxSim scores.
+        """
+        queries, query_mask = self._pad(query_embeddings)
+        scores = torch.empty(len(query_embeddings), len(page_embeddings), device=self.device)
+
+        with torch.no_grad():
+            for start in range(0, len(page_embeddings), self.chunk_size):
+                pages, page_mask = self._pad(page_embeddings[start : start + self.chunk_size])
+
+                # (queries, pages, query tokens, page tokens)
+                similarities = torch.einsum("qid,pjd->qpij", queries, pages)
+                similarities = similarities.masked_fill(~page_mask[None, :, None, :], float("-inf"))
+
+                max_similarities = similarities.max(dim=-1).values
+                max_similarities = max_similarities.masked_fill(~query_mask[:, None, :], 0.0)
+                scores[:, start : start + pages.shape[0]] = max_similarities.sum(dim=-1)
+
+        return scores.cpu()
+
+    def rerank(self, query_embedding, page_embeddings: Sequence, top_k: int = None) -> List[Tuple[int, float]]:
+        """Return (candidate index, score) pairs for one query, best first."""
+        if len(page_embeddings) == 0:
+            return []
+
+        scores = self.score([query_embedding], page_embeddings)[0]
+        top_k = min(top_k or len(page_embeddings), len(page_embeddings))
+        values, indices = torch.topk(scores, k=top_k)
+        logger.debug(f"Reranked {len(page_embeddings)} candidates, top score {values[0].item():.4f}.")
+        return list(zip(indices.tolist(), values.tolist()))
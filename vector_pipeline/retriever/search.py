@@ -0,0 +1,141 @@
+import logging
+from typing import List, Tuple
+from weaviate.classes.query import Filter, MetadataQuery
+from retriever.reranker import MaxSimReranker
+
+logger = logging.getLogger(__name__)
+
+class TwoStageRetriever:
+    def __init__(self, collection, config: dict, reranker: MaxSimReranker = None):
+        """
+        Approximate candidate search in Weaviate followed by MaxSim reranking.
+        Reranking recovers the ordering lost to index quantization or MUVERA encoding,
+        since it scores the stored multi-vectors rather than the index. It cannot undo
+        compression applied before insert: with pool_factor > 1 the stored vectors are
+        pooled, and the rerank is exact MaxSim over the pooled vectors only.
+        """
+        retrieval_config = config.get("retrieval", {})
+        self.collection = collection
+        self.vector_name = config["weaviate"]["collection"]["vectorizer"]["name"]
+        self.candidate_limit = retrieval_config.get("candidate_limit", 50)
+        self.reranker = reranker or MaxSimReranker(
+            device=retrieval_config.get("rerank_device", "cpu"),
+            chunk_size=retrieval_config.get("rerank_chunk_size", 64),
+        )
+
+        keyword_config = retrieval_config.get("keyword_prefilter", {})
+        # Default for callers such as the service; search() prefilters whenever it gets query_text
+        self.keyword_prefilter = keyword_config.get("enabled", False)
+        self.keyword_mode = keyword_config.get("mode", "pages")
+        self.keyword_property = keyword_config.get("property", "page_text")
+        self.keyword_limit = keyword_config.get("limit", 100)
+        if self.keyword_mode not in ("pages", "documents"):
+            raise ValueError(f"Unsupported keyword prefilter mode '{self.keyword_mode}'.")
+
+    def collections_for(self, tenants: List[str] = None) -> list:
+        """The collection, or its tenant-scoped views when searching a multi-tenant collection."""
+        if not tenants:
+            return [self.collection]
+        return [self.collection.with_tenant(tenant) for tenant in tenants]
+
+    def _with_vectors(self, objects: list) -> list:
+        """Drop objects stored without a vector (blank pages), which cannot be MaxSim-scored."""
+        scored = [obj for obj in objects if (obj.vector or {}).get(self.vector_name) is not None]
+        if len(scored) < len(objects):
+            logger.debug(f"Skipped {len(objects) - len(scored)} objects without a '{self.vector_name}' vector.")
+        return scored
+
+    def _keyword_candidates(self, query_text: str, return_properties: List[str], filters=None, tenants: List[str] = None) -> list:
+        """BM25 hits on the page text, with their multi-vectors when only those pages are scored."""
+        properties = list(return_properties or [])
+        if self.keyword_mode == "documents" and "document_id" not in properties:
+            properties.append("document_id")
+        hits = []
+        for collection in self.collections_for(tenants):
+            response = collection.query.bm25(
+                query=query_text,
+                query_properties=[self.keyword_property],
+                limit=self.keyword_limit,
+                filters=filters,
+                include_vector=[self.vector_name] if self.keyword_mode == "pages" else False,
+                return_properties=properties,
+            )
+            hits.extend(response.objects)
+        return hits
+
+    def search(
+        self,
+        query_embedding,
+        limit: int = 3,
+        return_properties: List[str] = None,
+        filters=None,
+        query_text: str = None,
+        tenants: List[str] = None,
+    ) -> List[Tuple[object, float]]:
+        """
+        Return up to limit (object, MaxSim score) pairs, best first.
+        query_embedding is a (tokens, dim) tensor or array, e.g. from Colqwen.multi_vectorize_text.
+        When query_text is given, BM25 hits on the page text narrow the search: in pages mode only
+        the hit pages are MaxSim-scored (no ANN search at all) as long as there are at least limit
+        of them; fewer hits are scored together with the ANN candidates. In documents mode the ANN
+        search is restricted to the hit documents. Queries without keyword hits fall back to the
+        full search.
+        On a multi-tenant collection, tenants lists the tenants to search; candidates of all of
+        them are reranked together, so MaxSim scores stay comparable across tenants.
+        """
+        query_vectors = query_embedding.cpu().float().numpy() if hasattr(query_embedding, "cpu") else query_embedding
+
+        # BM25 hits scored alongside the ANN candidates
+        keyword_pages = []
+        if query_text:
+            try:
+                keyword_hits = self._keyword_candidates(query_text, return_properties, filters, tenants)
+            except Exception:
+                logger.exception("Keyword prefilter failed.")
+                raise
+
+            if self.keyword_mode == "pages":
+                keyword_hits = self._with_vectors(keyword_hits)
+                if len(keyword_hits) >= limit:
+                    logger.info(f"Keyword prefilter: scoring {len(keyword_hits)} BM25 hits.")
+                    return self._rerank(query_vectors, keyword_hits, limit)
+                # Too few hits to fill the results; the ANN candidates make up the rest
+                logger.info(f"Keyword prefilter: {len(keyword_hits)} BM25 hits, adding ANN candidates.")
+                keyword_pages = keyword_hits
+            elif keyword_hits:
+                document_ids = sorted({hit.properties["document_id"] for hit in keyword_hits})
+                logger.info(f"Keyword prefilter: restricting search to {len(document_ids)} documents.")
+                document_filter = Filter.by_property("document_id").contains_any(document_ids)
+                filters = document_filter if filters is None else filters & document_filter
+            else:
+                logger.info("Keyword prefilter found no hits, searching the whole collection.")
+
+        candidates = []
+        try:
+            for collection in self.collections_for(tenants):
+                response = collection.query.near_vector(
+                    near_vector=query_vectors,
+                    target_vector=self.vector_name,
+                    limit=max(self.candidate_limit, limit),
+                    filters=filters,
+                    include_vector=[self.vector_name],
+                    return_properties=return_properties,
+                    return_metadata=MetadataQuery(distance=True),
+                )
+                candidates.extend(response.objects)
+        except Exception:
+            logger.exception("Candidate search failed.")
+            raise
+
+        candidates = self._with_vectors(candidates)
+        logger.info(f"Candidate search returned {len(candidates)} objects.")
+
+        if keyword_pages:
+            seen = {str(hit.uuid) for hit in keyword_pages}
+            candidates = keyword_pages + [candidate for candidate in candidates if str(candidate.uuid) not in seen]
+        return self._rerank(query_vectors, candidates, limit)
+
+    def _rerank(self, query_vectors, objects: list, limit: int) -> List[Tuple[object, float]]:
+        page_embeddings = [obj.vector[self.vector_name] for obj in objects]
+        ranked = self.reranker.rerank(query_vectors, page_embeddings, top_k=limit)
+        return [(objects[idx], score) for idx, score in ranked]
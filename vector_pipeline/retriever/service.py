@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+from weaviate.classes.query import Filter, MetadataQuery
+from util.logging_config import setup_logging
+from util.load_config import load_config
+from parser.colqwen import Colqwen
+from vector_store.weaviate import WeaviateCollectionManager
+from retriever.search import TwoStageRetriever
+
+logger = logging.getLogger(__name__)
+
+class QueryEmbeddingBatcher:
+    def __init__(self, model: Colqwen, max_batch_size: int = 16, max_wait_ms: float = 10, cache_size: int = 1024):
+        """
+        Coalesce concurrent queries into one process_queries forward pass.
+        A batch is flushed when it is full or max_wait_ms after its first query arrived.
+        Embeddings of recent queries are kept in an LRU cache.
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[str, object]" = OrderedDict()
+        self._queue: asyncio.Queue = None
+        self._worker: asyncio.Task = None
+        # The model runs on a single thread so forward passes never overlap
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="colqwen")
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def embed(self, query: str):
+        cached = self._cache.get(query)
+        if cached is not None:
+            self._cache.move_to_end(query)
+            self.cache_hits += 1
+            return cached
+
+        self.cache_misses += 1
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Identical queries in the same batch share one embedding
+            queries = list(dict.fromkeys(query for query, _ in batch))
+            by_query = await self._embed_batch(queries)
+            for query, future in batch:
+                if future.done():
+                    continue
+                if isinstance(by_query[query], Exception):
+                    future.set_exception(by_query[query])
+                else:
+                    future.set_result(by_query[query])
+            logger.debug(f"Embedded micro-batch of {len(queries)} queries ({len(batch)} requests).")
+
+    def _vectorize(self, queries: List[str]) -> list:
+        return [embedding.cpu().float().numpy() for embedding in self.model.multi_vectorize_texts(queries)]
+
+    async def _embed_batch(self, queries: List[str]) -> Dict[str, object]:
+        """
+        Return {query: embedding, or the exception it raised}.
+        A failed batch is retried query by query, so one bad query does not fail the others.
+        """
+        try:
+            embeddings = await asyncio.get_running_loop().run_in_executor(self._executor, self._vectorize, queries)
+        except Exception as e:
+            if len(queries) == 1:
+                logger.exception("Failed to embed query.")
+                return {queries[0]: e}
+            logger.warning(f"Failed to embed a batch of {len(queries)} queries, retrying them one by one.")
+            by_query = {}
+            for query in queries:
+                by_query.update(await self._embed_batch([query]))
+            return by_query
+
+        by_query = dict(zip(queries, embeddings))
+        for query, embedding in by_query.items():
+            self._remember(query, embedding)
+        return by_query
+
+    def _remember(self, query: str, embedding):
+        self._cache[query] = embedding
+        self._cache.move_to_end(query)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+class RetrievalService:
+    def __init__(self, config: dict):
+        """Load the model and connect to Weaviate once, then serve /search requests."""
+        self.config = config
+        service_config = config.get("service", {})
+
+        # Only queries are embedded here, so the page embedding cache (and its volume) is not needed
+        self.model = Colqwen.from_config(config)
+        self.batcher = QueryEmbeddingBatcher(
+            model=self.model,
+            max_batch_size=service_config.get("max_batch_size", 16),
+            max_wait_ms=service_config.get("max_wait_ms", 10),
+            cache_size=service_config.get("query_cache_size", 1024),
+        )
+
+        # A single client keeps its HTTP/gRPC connections open across requests
+        self.manager = WeaviateCollectionManager(config=config)
+        self.manager.connect(
+            connection_type=config["weaviate"]["connection"]["type"],
+            host=config["weaviate"]["connection"]["host"],
+        )
+        self.collection = self.manager.get_collection(config["weaviate"]["collection"]["name"])
+        self.retriever = TwoStageRetriever(self.collection, config)
+        self.vector_name = config["weaviate"]["collection"]["vectorizer"]["name"]
+        self.max_limit = service_config.get("max_limit", 100)
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=service_config.get("search_concurrency", 8), thread_name_prefix="weaviate"
+        )
+
+        # Tenants this service queried and when; idle ones are deactivated (or offloaded) to free memory
+        tenancy = config["weaviate"]["collection"].get("multi_tenancy", {})
+        self.offload_after_seconds = tenancy.get("offload_after_seconds")
+        self.offload_status = tenancy.get("offload_status", "INACTIVE")
+        # Written by searches and read by the offload pass, both on executor threads
+        self._tenant_last_used: Dict[str, float] = {}
+        self._tenant_lock = threading.Lock()
+        self._offload_task: asyncio.Task = None
+
+    def _scope(self, document_ids: Optional[List[str]], customer: Optional[str]) -> Tuple[Optional[List[str]], object]:
+        """
+        Tenants and filter restricting a search to some documents or to one customer.
+        With a tenant per document the tenants alone scope the search; otherwise the
+        filterable document_id index does.
+        """
+        filters = None
+        if document_ids and not (self.manager.multi_tenancy and self.manager.tenant_key == "document"):
+            filters = Filter.by_property("document_id").contains_any(document_ids)
+
+        if not self.manager.multi_tenancy:
+            return None, filters
+        if document_ids:
+            tenants = self.manager.tenants_for(document_ids)
+        elif customer and self.manager.tenant_key == "customer":
+            tenants = [self.manager.tenant_name(customer)]
+        else:
+            expected = "'document_ids' or 'customer'" if self.manager.tenant_key == "customer" else "'document_ids'"
+            raise ValueError(f"The collection has a tenant per {self.manager.tenant_key}; pass {expected}.")
+        return tenants, filters
+
+    def _existing_tenants(self, tenants: List[str]) -> List[str]:
+        """
+        Drop tenants that were never created (documents or customers with nothing ingested)
+        and record the others as used.
+        """
+        existing = [tenant for tenant in tenants if self.manager.tenant_exists(tenant)]
+        if len(existing) < len(tenants):
+            logger.info(f"Skipping {len(tenants) - len(existing)} tenants that do not exist.")
+
+        now = time.monotonic()
+        with self._tenant_lock:
+            for tenant in existing:
+                self._tenant_last_used[tenant] = now
+        return existing
+
+    def _search(
+        self,
+        query_embedding,
+        limit: int,
+        return_properties: List[str],
+        rerank: bool,
+        query_text: str = None,
+        tenants: List[str] = None,
+        filters=None,
+    ) -> List[Dict]:
+        if tenants is not None:
+            tenants = self._existing_tenants(tenants)
+            if not tenants:
+                return []
+
+        if rerank or query_text:
+            results = self.retriever.search(
+                query_embedding,
+                limit=limit,
+                return_properties=return_properties,
+                filters=filters,
+                query_text=query_text,
+                tenants=tenants,
+            )
+            return [
+                {"uuid": str(obj.uuid), "score": score, "properties": obj.properties}
+                for obj, score in results
+            ]
+
+        objects = []
+        for collection in self.retriever.collections_for(tenants):
+            response = collection.query.near_vector(
+                near_vector=query_embedding,
+                target_vector=self.vector_name,
+                limit=limit,
+                filters=filters,
+                return_properties=return_properties,
+                return_metadata=MetadataQuery(distance=True),
+            )
+            objects.extend(response.objects)
+        # Distances of different tenants share one metric, so the merged top-k is exact
+        objects = sorted(objects, key=lambda obj: obj.metadata.distance)[:limit]
+        return [
+            {"uuid": str(obj.uuid), "distance": obj.metadata.distance, "properties": obj.properties}
+            for obj in objects
+        ]
+
+    def _offload_idle_tenants(self):
+        cutoff = time.monotonic() - self.offload_after_seconds
+        with self._tenant_lock:
+            idle = [tenant for tenant, last_used in self._tenant_last_used.items() if last_used < cutoff]
+        if not idle:
+            return
+        self.manager.set_tenant_status(idle, self.offload_status)
+        with self._tenant_lock:
+            for tenant in idle:
+                # A search may have used the tenant meanwhile; auto activation brings it back, keep tracking it
+                if self._tenant_last_used.get(tenant, cutoff) < cutoff:
+                    self._tenant_last_used.pop(tenant)
+
+    async def _offload_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(max(self.offload_after_seconds / 4, 1))
+            try:
+                await loop.run_in_executor(self._search_executor, self._offload_idle_tenants)
+            except Exception:
+                logger.exception("Failed to deactivate idle tenants.")
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except Exception:
+            body = None
+        if not isinstance(body, dict) or not isinstance(body.get("query"), str) or not body["query"].strip():
+            return web.json_response({"error": "Expected a JSON body with a non-empty 'query' string."}, status=400)
+        query = body["query"]
+
+        document_ids = body.get("document_ids")
+        if document_ids is not None and (
+            not isinstance(document_ids, list) or not all(isinstance(document_id, str) for document_id in document_ids)
+        ):
+            return web.json_response({"error": "'document_ids' must be a list of strings."}, status=400)
+        customer = body.get("customer")
+        if customer is not None and not isinstance(customer, str):
+            return web.json_response({"error": "'customer' must be a string."}, status=400)
+
+        limit = body.get("limit", 3)
+        # bool is an int subclass; true/false are not page counts
+        if not isinstance(limit, int) or isinstance(limit, bool) or not 1 <= limit <= self.max_limit:
+            return web.json_response(
+                {"error": f"'limit' must be an integer between 1 and {self.max_limit}."}, status=400
+            )
+        return_properties = body.get("return_properties", ["pdf_title", "page_number", "image_ref"])
+        if not isinstance(return_properties, list) or not all(isinstance(name, str) for name in return_properties):
+            return web.json_response({"error": "'return_properties' must be a list of strings."}, status=400)
+        rerank = bool(body.get("rerank", False))
+        # Keyword-narrowed search; defaults to the configured prefilter setting
+        keyword_prefilter = bool(body.get("keyword_prefilter", self.retriever.keyword_prefilter))
+
+        try:
+            # Document- or customer-scoped search
+            tenants, filters = self._scope(document_ids, customer)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+
+        try:
+            query_embedding = await self.batcher.embed(query)
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._search_executor, self._search, query_embedding, limit, return_properties, rerank,
+                query if keyword_prefilter else None, tenants, filters,
+            )
+        except Exception as e:
+            logger.exception(f"Search failed for query '{query}'.")
+            return web.json_response({"error": str(e)}, status=500)
+
+        return web.json_response({"query": query, "results": results})
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "query_cache_hits": self.batcher.cache_hits,
+            "query_cache_misses": self.batcher.cache_misses,
+        })
+
+    async def _on_startup(self, app: web.Application):
+        self.batcher.start()
+        if self.manager.multi_tenancy and self.offload_after_seconds:
+            self._offload_task = asyncio.create_task(self._offload_loop())
+
+    async def _on_cleanup(self, app: web.Application):
+        if self._offload_task is not None:
+            self._offload_task.cancel()
+        await self.batcher.stop()
+        self._search_executor.shutdown(wait=False)
+        self.manager.close()
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/search", self.handle_search)
+        app.router.add_get("/health", self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+
+if __name__ == "__main__":
+    setup_logging()
+    config = load_config("config.yaml")
+    service_config = config.get("service", {})
+
+    service = RetrievalService(config)
+    web.run_app(
+        service.create_app(),
+        host=service_config.get("host", "0.0.0.0"),
+        port=service_config.get("port", 8000),
+    )
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules import each other from the vector_pipeline directory (python main.py is run from there)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
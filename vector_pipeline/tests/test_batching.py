@@ -0,0 +1,37 @@
+import pytest
+from parser.batching import TokenBudgetBatcher
+
+
+def test_every_item_is_batched_once():
+    token_counts = [300, 50, 1200, 700, 700, 90, 2000, 10]
+    batches = TokenBudgetBatcher(max_batch_tokens=2048, max_batch_size=3).batches(token_counts)
+    assert sorted(idx for batch in batches for idx in batch) == list(range(len(token_counts)))
+
+
+def test_batches_stay_within_budget_and_size():
+    token_counts = [300, 50, 1200, 700, 700, 90, 2000, 10, 640, 640, 640]
+    batcher = TokenBudgetBatcher(max_batch_tokens=2048, max_batch_size=3)
+    for batch in batcher.batches(token_counts):
+        assert len(batch) <= 3
+        assert len(batch) * max(token_counts[idx] for idx in batch) <= 2048
+
+
+def test_similar_lengths_are_packed_together():
+    batches = TokenBudgetBatcher(max_batch_tokens=2000, max_batch_size=8).batches([100, 900, 120, 880])
+    assert batches == [[1, 3], [2, 0]]
+
+
+def test_item_over_budget_gets_its_own_batch():
+    batches = TokenBudgetBatcher(max_batch_tokens=1000, max_batch_size=8).batches([5000, 100, 100])
+    assert batches[0] == [0]
+    assert sorted(batches[1]) == [1, 2]
+
+
+def test_empty_input():
+    assert TokenBudgetBatcher().batches([]) == []
+
+
+@pytest.mark.parametrize("max_batch_tokens, max_batch_size", [(0, 8), (8192, 0)])
+def test_rejects_non_positive_limits(max_batch_tokens, max_batch_size):
+    with pytest.raises(ValueError):
+        TokenBudgetBatcher(max_batch_tokens=max_batch_tokens, max_batch_size=max_batch_size)
@@ -0,0 +1,37 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("scipy")
+
+from parser.compression import EmbeddingCompressor
+
+
+def _embedding(tokens: int, dim: int = 32):
+    vectors = torch.randn(tokens, dim, generator=torch.Generator().manual_seed(0))
+    return vectors / vectors.norm(dim=1, keepdim=True)
+
+
+def test_without_pooling_keeps_every_vector():
+    compressed = EmbeddingCompressor(pool_factor=1, dtype="float16").compress(_embedding(20))
+    assert compressed.shape == (20, 32)
+    assert compressed.dtype == np.float16
+
+
+def test_pooling_shrinks_token_count():
+    compressed = EmbeddingCompressor(pool_factor=3).compress(_embedding(30))
+    assert 1 <= compressed.shape[0] <= 10
+    assert compressed.shape[1] == 32
+    assert compressed.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(compressed, axis=1), 1.0, rtol=1e-5)
+
+
+def test_short_embeddings_are_not_pooled():
+    compressed = EmbeddingCompressor(pool_factor=4).compress(_embedding(2))
+    assert compressed.shape == (2, 32)
+
+
+@pytest.mark.parametrize("pool_factor, dtype", [(0, "float32"), (2, "int8")])
+def test_rejects_invalid_settings(pool_factor, dtype):
+    with pytest.raises(ValueError):
+        EmbeddingCompressor(pool_factor=pool_factor, dtype=dtype)
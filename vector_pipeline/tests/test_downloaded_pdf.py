@@ -0,0 +1,72 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip("boto3")
+
+from util.download_pdf import DownloadedPDF
+
+PART = 1024
+
+
+def _progressive(tmp_path, parts: int = 4) -> DownloadedPDF:
+    return DownloadedPDF(str(tmp_path / "doc.pdf"), size=parts * PART - 10, part_size=PART, complete=False)
+
+
+def _drain(download: DownloadedPDF) -> list:
+    order = []
+    while (part := download._next_part()) is not None:
+        order.append(part)
+        download._part_done(part)
+    return order
+
+
+def test_complete_download_has_nothing_to_fetch(tmp_path):
+    download = DownloadedPDF(str(tmp_path / "doc.pdf"), size=3 * PART, part_size=PART)
+    assert download.complete
+    assert download._next_part() is None
+    download.wait_for_range(0, 3 * PART)
+
+
+def test_tail_is_fetched_first(tmp_path):
+    download = _progressive(tmp_path)
+    assert _drain(download) == [3, 0, 1, 2]
+    assert download.complete
+
+
+def test_parts_are_not_handed_out_twice(tmp_path):
+    download = _progressive(tmp_path)
+    first = download._next_part()
+    second = download._next_part()
+    assert first != second
+    assert first in download._in_flight and second in download._in_flight
+
+
+def test_waited_for_range_jumps_the_queue(tmp_path):
+    download = _progressive(tmp_path)
+    assert download._next_part() == 3
+    download._part_done(3)
+
+    waiter = threading.Thread(target=download.wait_for_range, args=(2 * PART + 5, 2 * PART + 50))
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while not download._urgent and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert download._next_part() == 2
+    download._part_done(2)
+    waiter.join(timeout=5)
+    assert not waiter.is_alive()
+    assert _drain(download) == [0, 1]
+
+
+def test_failure_wakes_waiters(tmp_path):
+    download = _progressive(tmp_path)
+    error = OSError("connection reset")
+    download._fail(error)
+
+    with pytest.raises(OSError):
+        download.wait()
+    with pytest.raises(OSError):
+        download.wait_for_range(0, PART)
+    assert download._next_part() is None
@@ -0,0 +1,68 @@
+import io
+import pytest
+
+for module in ("fitz", "pymupdf4llm", "pdf2image", "PIL", "PyPDF2"):
+    pytest.importorskip(module)
+
+from PyPDF2 import PdfReader
+from util.pdf_util import PDFImageConverter
+
+
+def _pdf(objects) -> bytes:
+    """Minimal PDF from numbered object bodies (object 1 is the catalog), with a valid xref table."""
+    out = io.BytesIO()
+    out.write(b"%PDF-1.7\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def _stream(data: bytes) -> bytes:
+    return b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data)
+
+
+def _document(page_resources: bytes = b"", tree_resources: bytes = b"", alpha: bytes = b"0.5") -> bytes:
+    """One page drawing a rectangle through graphics state /G1; resources on the page or on its parent."""
+    return _pdf([
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 /MediaBox [0 0 612 792] %s >>" % tree_resources,
+        b"<< /Type /Page /Parent 2 0 R /Contents 4 0 R %s >>" % page_resources,
+        _stream(b"/G1 gs 0 0 100 100 re f"),
+        b"<< /Type /ExtGState /ca %s >>" % alpha,
+    ])
+
+
+def _fingerprint(data: bytes) -> str:
+    return PDFImageConverter._page_fingerprint(PdfReader(io.BytesIO(data)).pages[0])
+
+
+def test_fingerprint_is_stable():
+    data = _document(page_resources=b"/Resources << /ExtGState << /G1 5 0 R >> >>")
+    assert _fingerprint(data) == _fingerprint(data)
+
+
+def test_graphics_state_change_changes_the_fingerprint():
+    resources = b"/Resources << /ExtGState << /G1 5 0 R >> >>"
+    assert _fingerprint(_document(page_resources=resources, alpha=b"0.5")) != _fingerprint(
+        _document(page_resources=resources, alpha=b"1.0")
+    )
+
+
+def test_inherited_resources_are_hashed():
+    resources = b"/Resources << /ExtGState << /G1 5 0 R >> >>"
+    assert _fingerprint(_document(tree_resources=resources, alpha=b"0.5")) != _fingerprint(
+        _document(tree_resources=resources, alpha=b"1.0")
+    )
+
+
+def test_inherited_attribute_lookup():
+    node = PdfReader(io.BytesIO(_document())).trailer["/Root"]["/Pages"]["/Kids"][0].get_object()
+    assert [float(x) for x in PDFImageConverter._inherited(node, "/MediaBox")] == [0, 0, 612, 792]
+    assert PDFImageConverter._inherited(node, "/Rotate") is None
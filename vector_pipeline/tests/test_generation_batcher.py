@@ -0,0 +1,54 @@
+import threading
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from retriever.qwen import GenerationBatcher
+
+
+class FakeQwen:
+    """Records every batch; the first one blocks until released."""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def query_images_batch(self, requests, max_tokens_output):
+        self.batches.append(([query for query, _ in requests], max_tokens_output))
+        self.started.set()
+        self.release.wait(timeout=5)
+        return [f"answer to {query}" for query, _ in requests]
+
+
+def test_carried_requests_are_batched_with_compatible_ones():
+    qwen = FakeQwen()
+    batcher = GenerationBatcher(qwen, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit("x", [], 10)]
+    assert qwen.started.wait(timeout=5)
+
+    # Queued while the first batch is generating
+    for query, max_tokens in [("b1", 20), ("a1", 10), ("b2", 20), ("a2", 10)]:
+        futures.append(batcher.submit(query, [], max_tokens))
+    qwen.release.set()
+
+    assert [future.result(timeout=5) for future in futures] == [
+        "answer to x", "answer to b1", "answer to a1", "answer to b2", "answer to a2"
+    ]
+    assert qwen.batches == [(["x"], 10), (["b1", "b2"], 20), (["a1", "a2"], 10)]
+
+
+def test_carried_requests_respect_max_batch_size():
+    qwen = FakeQwen()
+    batcher = GenerationBatcher(qwen, max_batch_size=2, max_wait_ms=50)
+    futures = [batcher.submit("x", [], 10)]
+    assert qwen.started.wait(timeout=5)
+
+    for query, max_tokens in [("b1", 20), ("a1", 10), ("a2", 10), ("a3", 10)]:
+        futures.append(batcher.submit(query, [], max_tokens))
+    qwen.release.set()
+
+    for future in futures:
+        future.result(timeout=5)
+    assert qwen.batches[1:] == [(["b1"], 20), (["a1", "a2"], 10), (["a3"], 10)]
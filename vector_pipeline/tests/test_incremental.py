@@ -0,0 +1,93 @@
+import pytest
+
+pytest.importorskip("weaviate.util")
+
+from ingestion.incremental import IncrementalIngestionPlanner
+
+CONFIG = {"pdf_parser": {"model_specs": {"model_name": "vidore/colqwen2-v1.0"}}}
+
+
+class FakeConverter:
+    document_id = "reports/annual.pdf"
+
+    def __init__(self, page_count: int):
+        self.page_count = page_count
+
+    def get_page_count(self) -> int:
+        return self.page_count
+
+    def compute_document_fingerprint(self) -> str:
+        return "0" * 64
+
+    def compute_page_fingerprints(self, page_numbers):
+        return {page_number: f"page-{page_number}" for page_number in page_numbers}
+
+
+class FakeManager:
+    def __init__(self, existing_pages: dict):
+        self.existing_pages = existing_pages
+        self.deleted = None
+
+    def fetch_document_pages(self, document_id: str, limit: int = 10000) -> dict:
+        return dict(self.existing_pages)
+
+    def tenant_for(self, document_id: str):
+        return None
+
+    def delete_objects(self, uuids, tenant=None) -> int:
+        self.deleted = list(uuids)
+        return len(self.deleted)
+
+
+def _current_uuids(page_count: int) -> dict:
+    return IncrementalIngestionPlanner(FakeConverter(page_count), FakeManager({}), CONFIG).plan().page_uuids
+
+
+@pytest.fixture
+def existing_pages():
+    """Page 1 unchanged; pages 2 and 5 from an older version; page 9 removed since; one object without a page."""
+    return {
+        _current_uuids(6)[1]: 1,
+        "old-page-2": 2,
+        "old-page-5": 5,
+        "old-page-9": 9,
+        "no-page-number": None,
+    }
+
+
+def test_whole_document_removes_every_stale_object(existing_pages):
+    planner = IncrementalIngestionPlanner(FakeConverter(6), FakeManager(existing_pages), CONFIG).plan()
+
+    assert planner.pages_to_ingest == [2, 3, 4, 5, 6]
+    assert planner.stale_uuids == sorted(["old-page-2", "old-page-5", "old-page-9", "no-page-number"])
+
+
+def test_shard_only_removes_stale_objects_in_its_range(existing_pages):
+    planner = IncrementalIngestionPlanner(FakeConverter(6), FakeManager(existing_pages), CONFIG).plan(
+        page_numbers=[1, 2, 3]
+    )
+
+    assert planner.pages_to_ingest == [2, 3]
+    # Page 5 belongs to another shard and page 9 to the last one
+    assert planner.stale_uuids == sorted(["old-page-2", "no-page-number"])
+
+
+def test_last_shard_also_removes_pages_beyond_the_page_count(existing_pages):
+    manager = FakeManager(existing_pages)
+    planner = IncrementalIngestionPlanner(FakeConverter(6), manager, CONFIG).plan(page_numbers=[4, 5, 6])
+
+    assert planner.pages_to_ingest == [4, 5, 6]
+    assert planner.stale_uuids == sorted(["old-page-5", "old-page-9", "no-page-number"])
+
+    planner.delete_stale()
+    assert manager.deleted == planner.stale_uuids
+
+
+def test_model_settings_change_page_uuids():
+    int8_config = {
+        "pdf_parser": {
+            "model_specs": {"model_name": "vidore/colqwen2-v1.0", "cpu": {"enabled": True, "quantize_int8": True}}
+        }
+    }
+    int8_uuids = IncrementalIngestionPlanner(FakeConverter(3), FakeManager({}), int8_config).plan().page_uuids
+    assert set(int8_uuids.values()).isdisjoint(_current_uuids(3).values())
@@ -0,0 +1,104 @@
+import io
+import os
+import sys
+import zlib
+import pytest
+
+pytest.importorskip("boto3")
+
+# The Lambda is packaged from terraform/lambda
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "terraform", "lambda"))
+import lambda_function
+
+
+class FakeS3:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.data)}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(value) for value in Range[len("bytes="):].split("-"))
+        self.ranges.append((start, end))
+        return {"Body": io.BytesIO(self.data[start : end + 1])}
+
+
+@pytest.fixture(autouse=True)
+def shard_settings(monkeypatch):
+    monkeypatch.setenv("SHARD_PAGE_THRESHOLD", "300")
+    monkeypatch.setenv("PAGES_PER_SHARD", "100")
+
+
+@pytest.mark.parametrize("page_count", [None, 0, 1, 300])
+def test_small_documents_are_not_sharded(page_count):
+    assert lambda_function.plan_shards(page_count) is None
+
+
+def test_shards_cover_every_page_once():
+    assert lambda_function.plan_shards(301) == [(1, 100), (101, 200), (201, 300), (301, 301)]
+    shards = lambda_function.plan_shards(1000)
+    assert shards[0] == (1, 100) and shards[-1] == (901, 1000)
+    assert sum(end - start + 1 for start, end in shards) == 1000
+
+
+def test_root_count_wins_over_intermediate_nodes():
+    data = (
+        b"1 0 obj << /Type /Pages /Kids [2 0 R 3 0 R] /Count 250 >> endobj\n"
+        b"2 0 obj << /Count 200 /Type /Pages /Parent 1 0 R >> endobj\n"
+        b"3 0 obj << /Type/Pages /Parent 1 0 R /Count 50 >> endobj\n"
+    )
+    assert lambda_function._find_page_count(data) == 250
+
+
+def test_intermediate_nodes_alone_give_no_count():
+    # Only part of the tree was read: guessing from a subtree would plan too few shards
+    data = b"2 0 obj << /Type /Pages /Parent 1 0 R /Kids [4 0 R] /Count 200 >> endobj\n"
+    assert lambda_function._find_page_count(data) is None
+
+
+def test_root_with_inline_dictionaries():
+    data = (
+        b"1 0 obj << /Type /Pages /Resources << /Font << /F1 5 0 R >> >> /MediaBox [0 0 612 792] "
+        b"/Kids [2 0 R] /Count 640 >> endobj\n"
+        b"2 0 obj << /Type /Pages /Parent 1 0 R /Resources << /Font << /F1 5 0 R >> >> /Count 640 >> endobj\n"
+    )
+    assert lambda_function._find_page_count(data) == 640
+
+
+def test_root_cut_off_by_the_read_range():
+    assert lambda_function._find_page_count(b"/Type /Pages /Kids [2 0 R] /Count 80 >> endobj") is None
+
+
+def test_count_inside_compressed_object_stream():
+    inflated = b"<< /Type /Pages /Kids [4 0 R] /Count 1200 >>"
+    data = (
+        b"7 0 obj << /Type /ObjStm /N 1 /First 5 /Filter /FlateDecode >> stream\n"
+        + zlib.compress(inflated)
+        + b"endstream endobj"
+    )
+    assert lambda_function._find_page_count(data) == 1200
+
+
+def test_no_page_tree():
+    assert lambda_function._find_page_count(b"%PDF-1.7 nothing here") is None
+
+
+def test_linearized_header_needs_one_range():
+    data = b"%PDF-1.7\n1 0 obj << /Linearized 1 /L 123456 /N 2000 /T 9999 >> endobj\n" + b"x" * 1000
+    s3 = FakeS3(data)
+    assert lambda_function.get_page_count(s3, "bucket", "doc.pdf") == 2000
+    assert len(s3.ranges) == 1
+
+
+def test_tail_with_only_intermediate_nodes_scans_for_the_root():
+    root = b"1 0 obj << /Type /Pages /Kids [2 0 R 3 0 R] /Count 900 >> endobj\n"
+    node = b"3 0 obj << /Type /Pages /Parent 1 0 R /Count 400 >> endobj\ntrailer"
+    data = b"%PDF-1.7\n" + root + b"x" * lambda_function.TAIL_BYTES + node
+    assert lambda_function.get_page_count(FakeS3(data), "bucket", "doc.pdf") == 900
+
+
+def test_page_tree_in_the_tail():
+    data = b"%PDF-1.7\n" + b"x" * 5000 + b"1 0 obj << /Type /Pages /Count 42 >> endobj\ntrailer"
+    assert lambda_function.get_page_count(FakeS3(data), "bucket", "doc.pdf") == 42
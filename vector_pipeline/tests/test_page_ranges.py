@@ -0,0 +1,21 @@
+import pytest
+
+# pdf_util imports the rendering libraries at module level
+for module in ("fitz", "pymupdf4llm", "pdf2image", "PIL", "PyPDF2"):
+    pytest.importorskip(module)
+
+from util.pdf_util import PDFImageConverter
+
+
+@pytest.mark.parametrize(
+    "page_numbers, chunk_size, expected",
+    [
+        ([1, 2, 3, 4, 5], 2, [(1, 2), (3, 4), (5, 5)]),
+        ([1, 2, 4, 5, 6, 9], 10, [(1, 2), (4, 6), (9, 9)]),
+        ([3], 4, [(3, 3)]),
+        ([1, 2, 3], 1, [(1, 1), (2, 2), (3, 3)]),
+        ([], 4, []),
+    ],
+)
+def test_page_ranges(page_numbers, chunk_size, expected):
+    assert list(PDFImageConverter._page_ranges(page_numbers, chunk_size)) == expected
@@ -0,0 +1,41 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+
+from retriever.reranker import MaxSimReranker
+
+
+def _naive_maxsim(query: np.ndarray, page: np.ndarray) -> float:
+    return sum(max(float(q @ p) for p in page) for q in query)
+
+
+def _random_multivectors(rng, lengths, dim=16):
+    vectors = [rng.standard_normal((length, dim)).astype(np.float32) for length in lengths]
+    return [v / np.linalg.norm(v, axis=1, keepdims=True) for v in vectors]
+
+
+def test_score_matches_naive_loop():
+    rng = np.random.default_rng(0)
+    queries = _random_multivectors(rng, [3, 7])
+    pages = _random_multivectors(rng, [5, 12, 1, 30, 8])
+
+    # A chunk smaller than the page count exercises chunking and padding
+    scores = MaxSimReranker(chunk_size=2).score(queries, pages).numpy()
+
+    assert scores.shape == (2, 5)
+    for q, query in enumerate(queries):
+        for p, page in enumerate(pages):
+            assert scores[q, p] == pytest.approx(_naive_maxsim(query, page), abs=1e-4)
+
+
+def test_rerank_orders_by_score():
+    rng = np.random.default_rng(1)
+    query = _random_multivectors(rng, [4])[0]
+    pages = _random_multivectors(rng, [6, 6, 6, 6])
+    expected = sorted(range(len(pages)), key=lambda p: _naive_maxsim(query, pages[p]), reverse=True)
+
+    ranked = MaxSimReranker(chunk_size=3).rerank(query, pages, top_k=3)
+
+    assert [idx for idx, _ in ranked] == expected[:3]
+    assert MaxSimReranker().rerank(query, []) == []
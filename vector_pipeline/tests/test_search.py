@@ -0,0 +1,77 @@
+import uuid
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("weaviate.classes.query")
+
+from retriever.search import TwoStageRetriever
+
+VECTOR = "colqwen_vector"
+CONFIG = {
+    "weaviate": {"collection": {"vectorizer": {"name": VECTOR}}},
+    "retrieval": {"candidate_limit": 10, "keyword_prefilter": {"mode": "pages"}},
+}
+
+
+class FakeObject:
+    def __init__(self, name: str, vector):
+        self.uuid = uuid.uuid5(uuid.NAMESPACE_URL, name)
+        self.properties = {"name": name, "document_id": "doc.pdf"}
+        self.vector = {VECTOR: vector} if vector is not None else {}
+
+
+class FakeResponse:
+    def __init__(self, objects):
+        self.objects = objects
+
+
+class FakeQuery:
+    def __init__(self, bm25_hits, ann_hits):
+        self.bm25_hits = bm25_hits
+        self.ann_hits = ann_hits
+        self.near_vector_calls = 0
+
+    def bm25(self, **kwargs):
+        return FakeResponse(self.bm25_hits)
+
+    def near_vector(self, **kwargs):
+        self.near_vector_calls += 1
+        return FakeResponse(self.ann_hits)
+
+
+class FakeCollection:
+    def __init__(self, bm25_hits, ann_hits):
+        self.query = FakeQuery(bm25_hits, ann_hits)
+
+
+def _page(rng, name: str) -> FakeObject:
+    vectors = rng.standard_normal((4, 8)).astype(np.float32)
+    return FakeObject(name, vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+
+
+@pytest.fixture
+def pages():
+    rng = np.random.default_rng(0)
+    return [_page(rng, f"page-{index}") for index in range(6)]
+
+
+def test_enough_keyword_hits_skip_the_ann_search(pages):
+    collection = FakeCollection(bm25_hits=pages[:4], ann_hits=pages[4:])
+    results = TwoStageRetriever(collection, CONFIG).search(pages[0].vector[VECTOR], limit=3, query_text="revenue")
+
+    assert len(results) == 3
+    assert collection.query.near_vector_calls == 0
+    assert {obj.properties["name"] for obj, _ in results} <= {"page-0", "page-1", "page-2", "page-3"}
+
+
+def test_few_keyword_hits_are_merged_with_ann_candidates(pages):
+    # One BM25 hit, also returned by the ANN search, and a blank page without a vector
+    blank = FakeObject("blank", None)
+    collection = FakeCollection(bm25_hits=[pages[0], blank], ann_hits=[pages[0]] + pages[3:])
+    results = TwoStageRetriever(collection, CONFIG).search(pages[4].vector[VECTOR], limit=3, query_text="revenue")
+
+    names = [obj.properties["name"] for obj, _ in results]
+    assert len(names) == 3 and len(set(names)) == 3
+    assert names[0] == "page-4"
+    assert collection.query.near_vector_calls == 1
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("colpali_engine")
+torch = pytest.importorskip("torch")
+
+from retriever.service import QueryEmbeddingBatcher, RetrievalService
+
+
+class FakeModel:
+    """Fails any forward pass that contains the query 'bad'."""
+
+    def __init__(self):
+        self.calls = []
+
+    def multi_vectorize_texts(self, queries):
+        self.calls.append(list(queries))
+        if "bad" in queries:
+            raise ValueError("cannot tokenize")
+        return [torch.full((2, 4), float(len(query))) for query in queries]
+
+
+def test_one_bad_query_does_not_fail_the_batch():
+    async def run():
+        batcher = QueryEmbeddingBatcher(FakeModel(), max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.embed("revenue"), batcher.embed("bad"), batcher.embed("growth"), return_exceptions=True
+            )
+        finally:
+            await batcher.stop()
+
+    revenue, bad, growth = asyncio.run(run())
+    assert revenue.shape == (2, 4) and revenue[0, 0] == len("revenue")
+    assert isinstance(bad, ValueError)
+    assert growth[0, 0] == len("growth")
+
+
+class FakeRequest:
+    def __init__(self, body):
+        self.body = body
+
+    async def json(self):
+        if isinstance(self.body, bytes):
+            raise json.JSONDecodeError("invalid", "", 0)
+        return self.body
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"not json",
+        ["query"],
+        {},
+        {"query": ""},
+        {"query": 42},
+        {"query": "revenue", "limit": "3"},
+        {"query": "revenue", "limit": 0},
+        {"query": "revenue", "document_ids": "doc.pdf"},
+        {"query": "revenue", "document_ids": ["doc.pdf", 7]},
+        {"query": "revenue", "customer": ["acme"]},
+        {"query": "revenue", "return_properties": "page_number"},
+    ],
+)
+def test_invalid_requests_are_rejected(body):
+    service = RetrievalService.__new__(RetrievalService)
+    service.max_limit = 100
+    response = asyncio.run(service.handle_search(FakeRequest(body)))
+    assert response.status == 400
@@ -0,0 +1,42 @@
+import io
+import json
+import pytest
+
+pytest.importorskip("boto3")
+
+from ingestion.shards import ShardTracker
+
+
+class FakeS3:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self, objects: dict):
+        self.objects = objects
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+def _tracker(objects: dict) -> ShardTracker:
+    tracker = ShardTracker.__new__(ShardTracker)
+    tracker.bucket, tracker.key, tracker.prefix = "bucket", "doc.pdf", "_ingestion_status/doc.pdf"
+    tracker.s3 = FakeS3(objects)
+    tracker._manifest = None
+    return tracker
+
+
+def test_last_shard_is_the_one_ending_at_the_planned_page_count():
+    shards = [(1, 100), (101, 200), (201, 250)]
+    manifest = {"page_count": 250, "shards": [{"page_start": start, "page_end": end} for start, end in shards]}
+    tracker = _tracker({"_ingestion_status/doc.pdf/manifest.json": json.dumps(manifest).encode()})
+
+    assert tracker.is_last_shard(250)
+    assert not tracker.is_last_shard(200)
+
+
+def test_without_manifest_no_shard_is_last():
+    assert not _tracker({}).is_last_shard(100)
@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+
+from ingestion.streaming import StreamingIngestionPipeline
+
+CONFIG = {
+    "pipeline": {"queue_size": 4, "embed_chunk_size": 3},
+    "triage": {"duplicate_window": 2},
+    "weaviate": {"collection": {"properties": [{"name": "page_number"}]}},
+}
+
+
+class FakeModel:
+    def __init__(self):
+        self.embedded = []
+
+    def multi_vectorize_images(self, pages):
+        self.embedded.extend(page["page_number"] for page in pages)
+        return [f"embedding-{page['page_number']}" for page in pages]
+
+
+class FakeWriter:
+    def __init__(self):
+        self.added = []
+        self.failed_objects = []
+
+    @property
+    def inserted(self):
+        return len(self.added)
+
+    def add(self, properties, embedding, uuid=None):
+        self.added.append((properties["page_number"], embedding))
+
+
+class FakeManager:
+    def __init__(self):
+        self.writer = FakeWriter()
+
+    @contextmanager
+    def batch_writer(self, tenant=None):
+        yield self.writer
+
+
+class PassThrough:
+    def compress(self, embedding):
+        return embedding
+
+
+def _run(pages):
+    model, manager = FakeModel(), FakeManager()
+    pipeline = StreamingIngestionPipeline(model, manager, CONFIG, compressor=PassThrough())
+    assert pipeline.run(iter(pages)) == len(pages)
+    return model.embedded, dict(manager.writer.added)
+
+
+def test_duplicates_reuse_the_embedding_of_their_original():
+    pages = [
+        {"page_number": 1},
+        {"page_number": 2, "triage": "duplicate", "alias_of": 1},
+        {"page_number": 3, "triage": "blank"},
+        {"page_number": 4},
+        {"page_number": 5, "triage": "duplicate", "alias_of": 4},
+    ]
+    embedded, added = _run(pages)
+    assert embedded == [1, 4]
+    assert added == {1: "embedding-1", 2: "embedding-1", 3: None, 4: "embedding-4", 5: "embedding-4"}
+
+
+def test_duplicate_of_an_evicted_page_is_embedded_again():
+    pages = [{"page_number": number} for number in range(1, 6)]
+    pages.append({"page_number": 6, "triage": "duplicate", "alias_of": 1})
+    embedded, added = _run(pages)
+    assert embedded == [1, 2, 3, 4, 5, 6]
+    assert added[6] == "embedding-6"
@@ -1,26 +1,391 @@
+import glob
+import hashlib
+import io
 import logging
 import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import List, Optional
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from util.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
-def download_pdf_from_s3(bucket: str, key: str) -> str:
-    if not bucket or not key:
-        logger.exception("Missing S3_BUCKET or S3_KEY environment variables")
-        raise
+_MB = 1024 * 1024
 
-    s3 = boto3.client('s3')
 
-    filename = os.path.basename(key)
-    local_path = f"/tmp/{filename}"
+class DownloadedPDF:
+    def __init__(self, path: str, size: int, etag: str = None, part_size: int = 16 * _MB, complete: bool = True):
+        """
+        Local copy of an S3 object in a directory of its own (removed by cleanup()).
+        A progressive download is still being filled in by background range requests;
+        wait_for_range() blocks until the given bytes are on disk and fetches them first.
+        """
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.part_size = part_size
 
-    try:
-        logger.info(f"Downloading s3://{bucket}/{key} to {local_path}")
-        s3.download_file(bucket, key, local_path)
-        logger.info("Download complete.")
-        return local_path
+        self.error: Optional[BaseException] = None
+        self._condition = threading.Condition()
+        self._complete = threading.Event()
+        self._cancelled = False
+        self._threads: List[threading.Thread] = []
 
-    except Exception as e:
-        logger.exception(f"Error downloading file from S3: {e}")
-        raise
+        parts = max((size + part_size - 1) // part_size, 1)
+        self._done = bytearray([1 if complete else 0]) * parts
+        self._remaining = 0 if complete else parts
+        self._in_flight = set()
+        # Tail first (trailer and cross-reference table), then the file in order
+        self._queue = deque([parts - 1] + list(range(parts - 1))) if not complete else deque()
+        self._urgent = deque()
+        if complete:
+            self._complete.set()
+
+    @property
+    def complete(self) -> bool:
+        return self._complete.is_set()
+
+    def wait(self):
+        """Block until the whole object is on disk."""
+        self._complete.wait()
+        if self.error is not None:
+            raise self.error
+
+    def wait_for_range(self, start: int, end: int):
+        """Block until bytes [start, end) are on disk, moving their parts to the front of the queue."""
+        if self.complete:
+            self.wait()
+            return
+        end = min(end, self.size)
+        if end <= start:
+            return
+        parts = range(start // self.part_size, (end - 1) // self.part_size + 1)
+        with self._condition:
+            for part in parts:
+                if not self._done[part] and part not in self._in_flight and part not in self._urgent:
+                    self._urgent.append(part)
+            self._condition.notify_all()
+            while self.error is None and not all(self._done[part] for part in parts):
+                self._condition.wait()
+        if self.error is not None:
+            raise self.error
+
+    def open(self):
+        """Binary file object over the PDF; reads block on bytes that have not arrived yet."""
+        if self.complete:
+            self.wait()
+            return open(self.path, "rb")
+        return io.BufferedReader(_ProgressiveFile(self), buffer_size=64 * 1024)
+
+    def _next_part(self) -> Optional[int]:
+        with self._condition:
+            if self._cancelled or self.error is not None:
+                return None
+            # Parts someone is waiting for, then the regular order; a part may be queued twice
+            for source in (self._urgent, self._queue):
+                while source:
+                    part = source.popleft()
+                    if not self._done[part] and part not in self._in_flight:
+                        self._in_flight.add(part)
+                        return part
+            return None
+
+    def _part_done(self, part: int):
+        with self._condition:
+            self._in_flight.discard(part)
+            self._done[part] = 1
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._complete.set()
+            self._condition.notify_all()
+
+    def _fail(self, error: BaseException):
+        with self._condition:
+            if self.error is None:
+                self.error = error
+            self._complete.set()
+            self._condition.notify_all()
+
+    def cleanup(self):
+        """Stop background fetches and remove the local copy (the cache keeps its own link)."""
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+
+
+class _ProgressiveFile(io.RawIOBase):
+    """Seekable, read-only view of a progressive download."""
+
+    def __init__(self, download: DownloadedPDF):
+        self._download = download
+        self._fd = os.open(download.path, os.O_RDONLY)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._download.size
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        end = min(self._position + len(buffer), self._download.size)
+        if end <= self._position:
+            return 0
+        self._download.wait_for_range(self._position, end)
+        data = os.pread(self._fd, end - self._position, self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
+
+class S3Downloader:
+    def __init__(
+        self,
+        s3=None,
+        max_concurrency: int = 10,
+        multipart_threshold: int = 16 * _MB,
+        multipart_chunksize: int = 16 * _MB,
+        memory_threshold: int = 32 * _MB,
+        memory_dir: str = "/dev/shm",
+        download_dir: str = None,
+        cache_dir: str = None,
+        cache_max_bytes: int = 5 * 1024 * _MB,
+        progressive: bool = False,
+        progressive_min_bytes: int = 64 * _MB,
+    ):
+        """
+        Download PDFs from S3 into a unique local directory per download.
+        - Objects below memory_threshold are fetched in a single request into memory-backed
+          storage (memory_dir, a tmpfs), skipping the multipart machinery and the disk.
+        - Larger objects use boto3's managed transfer with max_concurrency parallel parts.
+        - With progressive set, objects of at least progressive_min_bytes are fetched as
+          parallel byte ranges in the background and download() returns once the tail is in,
+          so rendering can start while later ranges are still arriving.
+        - With a cache_dir, objects are kept (hard-linked) keyed by bucket, key and ETag,
+          so a worker processing an unchanged object again skips the download.
+        """
+        self.s3 = s3 or boto3.client("s3", config=Config(max_pool_connections=max(max_concurrency, 10)))
+        self.max_concurrency = max_concurrency
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+        self.part_size = multipart_chunksize
+        self.memory_threshold = memory_threshold
+        self.memory_dir = memory_dir if memory_dir and os.path.isdir(memory_dir) else None
+        self.download_dir = download_dir
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.progressive = progressive
+        self.progressive_min_bytes = progressive_min_bytes
+        self._cache_lock = threading.Lock()
+
+        if self.download_dir:
+            os.makedirs(self.download_dir, exist_ok=True)
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict, s3=None) -> "S3Downloader":
+        download_config = config.get("download", {})
+        cache_config = download_config.get("cache", {})
+        progressive_config = download_config.get("progressive", {})
+        return cls(
+            s3=s3,
+            max_concurrency=download_config.get("max_concurrency", 10),
+            multipart_threshold=int(download_config.get("multipart_threshold_mb", 16) * _MB),
+            multipart_chunksize=int(download_config.get("multipart_chunksize_mb", 16) * _MB),
+            memory_threshold=int(download_config.get("memory_threshold_mb", 32) * _MB),
+            memory_dir=download_config.get("memory_dir", "/dev/shm"),
+            download_dir=download_config.get("download_dir"),
+            cache_dir=cache_config.get("path") if cache_config.get("enabled", False) else None,
+            cache_max_bytes=int(cache_config.get("max_size_gb", 5) * 1024 * _MB),
+            progressive=progressive_config.get("enabled", False),
+            progressive_min_bytes=int(progressive_config.get("min_size_mb", 64) * _MB),
+        )
+
+    def download(self, bucket: str, key: str) -> DownloadedPDF:
+        if not bucket or not key:
+            raise ValueError("Missing S3 bucket or key.")
+
+        try:
+            head = self.s3.head_object(Bucket=bucket, Key=key)
+            size = head["ContentLength"]
+            etag = head.get("ETag", "").strip('"') or None
+
+            in_memory = size < self.memory_threshold and self.memory_dir is not None
+            # Same directory as the cache when there is one, so cached copies are hard links
+            parent = self.memory_dir if in_memory else (
+                os.path.join(self.cache_dir, "downloads") if self.cache_dir else self.download_dir
+            )
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            # Two keys with the same basename never share a path
+            local_path = os.path.join(tempfile.mkdtemp(prefix="pdf-", dir=parent), os.path.basename(key) or "document.pdf")
+
+            if self._from_cache(bucket, key, etag, local_path):
+                metrics.increment("download_cache_hits")
+                logger.info(f"s3://{bucket}/{key} is unchanged (ETag {etag}), using the cached copy.")
+                return DownloadedPDF(local_path, size, etag)
+
+            if self.progressive and size >= self.progressive_min_bytes:
+                return self._download_progressive(bucket, key, size, etag, local_path)
+
+            logger.info(f"Downloading s3://{bucket}/{key} ({size / _MB:.1f} MB) to {local_path}")
+            with metrics.timer("download_seconds"):
+                if in_memory:
+                    # One request, no multipart bookkeeping; the file lives in RAM
+                    body = self.s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+                    with open(local_path, "wb") as f:
+                        f.write(body)
+                else:
+                    self.s3.download_file(bucket, key, local_path, Config=self.transfer_config)
+            metrics.increment("bytes_downloaded", size)
+            logger.info("Download complete.")
+
+            self._to_cache(bucket, key, etag, local_path)
+            return DownloadedPDF(local_path, size, etag)
+        except Exception as e:
+            logger.exception(f"Error downloading file from S3: {e}")
+            raise
+
+    def _download_progressive(self, bucket: str, key: str, size: int, etag: str, local_path: str) -> DownloadedPDF:
+        with open(local_path, "wb") as f:
+            f.truncate(size)
+        download = DownloadedPDF(local_path, size, etag, part_size=self.part_size, complete=False)
+        fd = os.open(local_path, os.O_WRONLY)
+        start = time.perf_counter()
+        document = metrics.current_document()
+        finished = []
+
+        def fetch():
+            with metrics.stage_thread(document):
+                try:
+                    while True:
+                        part = download._next_part()
+                        if part is None:
+                            break
+                        first = part * self.part_size
+                        last = min(first + self.part_size, size) - 1
+                        get_kwargs = {"IfMatch": etag} if etag else {}
+                        body = self.s3.get_object(
+                            Bucket=bucket, Key=key, Range=f"bytes={first}-{last}", **get_kwargs
+                        )["Body"].read()
+                        os.pwrite(fd, body, first)
+                        metrics.increment("bytes_downloaded", len(body))
+                        download._part_done(part)
+                except Exception as e:
+                    logger.exception(f"Ranged download of s3://{bucket}/{key} failed.")
+                    download._fail(e)
+                finally:
+                    with download._condition:
+                        finished.append(threading.current_thread())
+                        last_thread = len(finished) == len(download._threads)
+                    if last_thread:
+                        os.close(fd)
+                        if download.complete and download.error is None:
+                            metrics.observe("download_seconds", time.perf_counter() - start)
+                            logger.info(f"Download of s3://{bucket}/{key} complete.")
+                            self._to_cache(bucket, key, etag, local_path)
+
+        logger.info(
+            f"Downloading s3://{bucket}/{key} ({size / _MB:.1f} MB) progressively to {local_path} "
+            f"in {self.part_size // _MB} MB ranges."
+        )
+        download._threads = [
+            threading.Thread(target=fetch, name=f"s3-range-{i}", daemon=True) for i in range(self.max_concurrency)
+        ]
+        for thread in download._threads:
+            thread.start()
+
+        # The trailer and cross-reference table at the end are needed to read anything
+        download.wait_for_range(max(size - 1024, 0), size)
+        metrics.observe("download_ready_seconds", time.perf_counter() - start)
+        return download
+
+    @staticmethod
+    def _key_hash(bucket: str, key: str) -> str:
+        return hashlib.sha256(f"{bucket}/{key}".encode("utf-8")).hexdigest()[:32]
+
+    def _cache_path(self, bucket: str, key: str, etag: str) -> str:
+        # Multipart ETags keep their "-<parts>" suffix, so only the key hash prefix is fixed-length
+        return os.path.join(self.cache_dir, f"{self._key_hash(bucket, key)}-{re.sub(r'[^A-Za-z0-9-]', '', etag)}.pdf")
+
+    @staticmethod
+    def _link_or_copy(source: str, destination: str):
+        try:
+            os.link(source, destination)
+        except OSError:
+            # Different filesystems, e.g. tmpfs and disk
+            shutil.copyfile(source, destination)
+
+    def _from_cache(self, bucket: str, key: str, etag: str, local_path: str) -> bool:
+        if not self.cache_dir or not etag:
+            return False
+        cache_path = self._cache_path(bucket, key, etag)
+        with self._cache_lock:
+            if not os.path.exists(cache_path):
+                return False
+            # A link of its own, so eviction never pulls the file from under a running ingestion
+            self._link_or_copy(cache_path, local_path)
+            os.utime(cache_path)
+        return True
+
+    def _to_cache(self, bucket: str, key: str, etag: str, local_path: str):
+        if not self.cache_dir or not etag:
+            return
+        cache_path = self._cache_path(bucket, key, etag)
+        try:
+            with self._cache_lock:
+                # Older versions of the same key are never read again
+                for stale in glob.glob(os.path.join(self.cache_dir, f"{self._key_hash(bucket, key)}-*.pdf")):
+                    os.remove(stale)
+                self._link_or_copy(local_path, cache_path)
+                self._evict()
+        except OSError:
+            logger.warning(f"Could not cache s3://{bucket}/{key}.", exc_info=True)
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".pdf") and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        # Least recently used first
+        for _, size, path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logger.info(f"Evicted {path} from the download cache.")
 
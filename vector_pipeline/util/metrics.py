@@ -0,0 +1,302 @@
+import cProfile
+import fnmatch
+import json
+import logging
+import os
+import resource
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+class Histogram:
+    def __init__(self, max_samples: int = 10000):
+        """Running count/sum/min/max plus a bounded sample for percentiles."""
+        self.max_samples = max_samples
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._samples: List[float] = []
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._samples) < self.max_samples:
+            self._samples.append(value)
+        else:
+            # Keep every other sample once full, so percentiles still cover the whole run
+            self._samples = self._samples[::2]
+            self._samples.append(value)
+
+    def percentile(self, q: float) -> float:
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "min": self.min,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class StatsdExporter:
+    def __init__(self, host: str = "localhost", port: int = 8125, prefix: str = "vector_pipeline"):
+        """Fire-and-forget StatsD over UDP; losing a datagram only loses a sample."""
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        logger.info(f"Exporting metrics to StatsD at {host}:{port}")
+
+    def _send(self, line: str):
+        try:
+            self.socket.sendto(f"{self.prefix}.{line}".encode("utf-8"), self.address)
+        except OSError:
+            logger.debug("Failed to send StatsD metric.")
+
+    def increment(self, name: str, value: float):
+        self._send(f"{name}:{value}|c")
+
+    def observe(self, name: str, value: float):
+        # Durations are recorded in seconds; StatsD timers are in milliseconds
+        if name.endswith("_seconds"):
+            self._send(f"{name[:-len('_seconds')]}:{value * 1000:.3f}|ms")
+        else:
+            self._send(f"{name}:{value}|h")
+
+    def gauge(self, name: str, value: float):
+        self._send(f"{name}:{value}|g")
+
+
+class PrometheusExporter:
+    def __init__(self, port: int = 9100, prefix: str = "vector_pipeline"):
+        """Serve metrics on /metrics for Prometheus to scrape. Requires prometheus_client."""
+        try:
+            import prometheus_client
+        except ImportError:
+            logger.exception("The Prometheus exporter requires the prometheus_client package.")
+            raise
+        self.prometheus_client = prometheus_client
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+        prometheus_client.start_http_server(port)
+        logger.info(f"Serving Prometheus metrics on port {port}")
+
+    def _metric(self, kind: str, name: str):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = getattr(self.prometheus_client, kind)(f"{self.prefix}_{name}", name)
+            return self._metrics[name]
+
+    def increment(self, name: str, value: float):
+        self._metric("Counter", f"{name}_total").inc(value)
+
+    def observe(self, name: str, value: float):
+        self._metric("Histogram", name).observe(value)
+
+    def gauge(self, name: str, value: float):
+        self._metric("Gauge", name).set(value)
+
+
+class MetricsRecorder:
+    def __init__(self):
+        """
+        Thread-safe counters, gauges and histograms for the ingestion stages.
+        Durations are histograms named *_seconds. Every document gets its own summary
+        and the run summary aggregates all of them.
+        """
+        self.exporter = None
+        self.summary_path = None
+        self.profile_pattern = None
+        self.profile_dir = "/tmp/profiles"
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def configure(self, config: dict):
+        """Set up exporters, the summary file and profiling from the metrics section of the config."""
+        metrics_config = config.get("metrics", {})
+        self.summary_path = metrics_config.get("summary_path")
+
+        exporter = metrics_config.get("exporter", "none")
+        if exporter == "statsd":
+            statsd = metrics_config.get("statsd", {})
+            self.exporter = StatsdExporter(
+                host=statsd.get("host", "localhost"),
+                port=statsd.get("port", 8125),
+                prefix=statsd.get("prefix", "vector_pipeline"),
+            )
+        elif exporter == "prometheus":
+            prometheus = metrics_config.get("prometheus", {})
+            self.exporter = PrometheusExporter(
+                port=prometheus.get("port", 9100),
+                prefix=prometheus.get("prefix", "vector_pipeline"),
+            )
+        elif exporter != "none":
+            raise ValueError(f"Unsupported metrics exporter '{exporter}'.")
+
+        # PROFILE_DOCUMENTS enables profiling for one run without touching the config
+        profile_config = metrics_config.get("profile", {})
+        self.profile_pattern = os.environ.get("PROFILE_DOCUMENTS") or (
+            profile_config.get("documents") if profile_config.get("enabled", False) else None
+        )
+        self.profile_dir = profile_config.get("output_dir", self.profile_dir)
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.counters: Dict[str, float] = {}
+            self.gauges: Dict[str, float] = {}
+            self.histograms: Dict[str, Histogram] = {}
+            self.documents: List[Dict] = []
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            document = self.current_document()
+            if document is not None:
+                document["counters"][name] = document["counters"].get(name, 0) + value
+        if self.exporter is not None:
+            self.exporter.increment(name, value)
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+            document = self.current_document()
+            if document is not None:
+                document["histograms"].setdefault(name, Histogram()).observe(value)
+        if self.exporter is not None:
+            self.exporter.observe(name, value)
+
+    def gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+        if self.exporter is not None:
+            self.exporter.gauge(name, value)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def current_document(self):
+        return getattr(self._local, "document", None)
+
+    @contextmanager
+    def document(self, document_id: str):
+        """
+        Record metrics of one document, profiling it when it matches the profiling pattern.
+        Threads doing work for the document should run inside stage_thread(record).
+        """
+        record = {"document_id": document_id, "counters": {}, "histograms": {}, "profile_path": None}
+        if self.profile_pattern and fnmatch.fnmatch(document_id, self.profile_pattern):
+            os.makedirs(self.profile_dir, exist_ok=True)
+            record["profile_path"] = os.path.join(self.profile_dir, document_id.replace("/", "_"))
+            logger.info(f"Profiling {document_id} (pid {os.getpid()}) into {record['profile_path']}.*.prof")
+
+        start = time.perf_counter()
+        try:
+            with self.stage_thread(record):
+                yield record
+            record["status"] = "succeeded"
+        except BaseException:
+            record["status"] = "failed"
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self.observe("document_seconds", record["seconds"])
+            summary = self._document_summary(record)
+            with self._lock:
+                self.documents.append(summary)
+            logger.info(f"Document metrics: {json.dumps(summary)}")
+
+    @contextmanager
+    def stage_thread(self, record: Dict):
+        """
+        Attribute metrics recorded on the current thread to the document and, when the
+        document is being profiled, run the thread under its own cProfile (cProfile only
+        sees the thread that enabled it). Stats go to <profile_path>.<thread name>.prof.
+        """
+        previous = self.current_document()
+        self._local.document = record
+        profiler = None
+        if record and record.get("profile_path"):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                output_path = f"{record['profile_path']}.{threading.current_thread().name}.prof"
+                profiler.dump_stats(output_path)
+                logger.info(f"Profile written to {output_path}")
+            self._local.document = previous
+
+    @staticmethod
+    def _document_summary(record: Dict) -> Dict:
+        pages = record["counters"].get("pages_inserted", 0)
+        return {
+            "document_id": record["document_id"],
+            "status": record["status"],
+            "seconds": round(record["seconds"], 3),
+            "pages_per_second": pages / record["seconds"] if record["seconds"] else 0.0,
+            "counters": dict(record["counters"]),
+            "histograms": {name: h.summary() for name, h in record["histograms"].items()},
+        }
+
+    @staticmethod
+    def peak_rss_bytes() -> Dict[str, int]:
+        # ru_maxrss is in kilobytes on Linux; children covers rendering processes that have exited
+        return {
+            "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+        }
+
+    def summary(self) -> Dict:
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            pages = self.counters.get("pages_inserted", 0)
+            return {
+                "started_at": self.started_at,
+                "seconds": round(elapsed, 3),
+                "pages_per_second": pages / elapsed if elapsed else 0.0,
+                "peak_rss_bytes": self.peak_rss_bytes(),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: h.summary() for name, h in self.histograms.items()},
+                "documents": list(self.documents),
+            }
+
+    def write_summary(self) -> Dict:
+        """Log the run summary as JSON and write it to summary_path when configured."""
+        summary = self.summary()
+        self.gauge("peak_rss_bytes", summary["peak_rss_bytes"]["self"])
+        logger.info(f"Run metrics: {json.dumps(summary)}")
+        if self.summary_path:
+            os.makedirs(os.path.dirname(self.summary_path) or ".", exist_ok=True)
+            with open(self.summary_path, "w") as f:
+                json.dump(summary, f, indent=2)
+            logger.info(f"Metrics summary written to {self.summary_path}")
+        return summary
+
+
+# Shared by every stage of the process, like the module loggers
+metrics = MetricsRecorder()
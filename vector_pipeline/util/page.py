@@ -0,0 +1,118 @@
+import base64
+import logging
+from io import BytesIO
+from typing import Dict, Tuple
+from PIL import Image
+from util.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class PageEncoding:
+    __slots__ = ("format", "quality")
+
+    FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+
+    def __init__(self, format: str = "png", quality: int = 90):
+        """Output format for encoded page images: png (lossless), jpeg or webp with quality."""
+        format = format.lower().replace("jpg", "jpeg")
+        if format not in self.FORMATS:
+            raise ValueError(f"Unsupported page image format '{format}'.")
+        self.format = format
+        self.quality = quality
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PageEncoding":
+        encoding = config.get("pdf_parser", {}).get("image_encoding", {})
+        return cls(format=encoding.get("format", "png"), quality=encoding.get("quality", 90))
+
+    @property
+    def extension(self) -> str:
+        return self.format
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
+
+    def encode(self, image: Image.Image) -> bytes:
+        buffer = BytesIO()
+        if self.format == "png":
+            image.save(buffer, format="PNG")
+        else:
+            image.save(buffer, format=self.FORMATS[self.format], quality=self.quality)
+        return buffer.getvalue()
+
+
+class Page:
+    __slots__ = ("page_number", "size", "mode", "pixels", "metadata", "encoding", "_image", "_encoded")
+
+    def __init__(
+        self,
+        page_number: int,
+        size: Tuple[int, int],
+        pixels: bytes,
+        mode: str = "RGB",
+        metadata: Dict = None,
+        encoding: PageEncoding = None,
+    ):
+        """
+        A rendered page: its raw pixel buffer plus the properties stored with it.
+        The embedder reads the pixels directly; the page is encoded at most once,
+        and only when storage or the LLM asks for it.
+        """
+        self.page_number = page_number
+        self.size = size
+        self.mode = mode
+        self.pixels = pixels
+        self.metadata = metadata if metadata is not None else {}
+        self.encoding = encoding or PageEncoding()
+        self._image = None
+        self._encoded = None
+
+    @classmethod
+    def from_image(cls, page_number: int, image: Image.Image, **kwargs) -> "Page":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        page = cls(page_number, image.size, None, mode=image.mode, **kwargs)
+        # Keep the decoded image; the buffer is only materialized if something asks for it
+        page._image = image
+        return page
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    @property
+    def image(self) -> Image.Image:
+        """PIL view of the page; shares the pixel buffer instead of copying it."""
+        if self._image is None:
+            self._image = Image.frombuffer(self.mode, self.size, self.pixels, "raw", self.mode, 0, 1)
+        return self._image
+
+    def tobytes(self) -> bytes:
+        if self.pixels is None:
+            self.pixels = self._image.tobytes()
+        return self.pixels
+
+    def encode(self) -> bytes:
+        """The page in the configured image format, encoded on first use."""
+        if self._encoded is None:
+            with metrics.timer("encode_page_seconds"):
+                self._encoded = self.encoding.encode(self.image)
+            logger.debug(f"Encoded page {self.page_number} as {self.encoding.format} ({len(self._encoded)} bytes).")
+        return self._encoded
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.encode()).decode("utf-8")
+
+    def to_data_uri(self) -> str:
+        return f"data:{self.encoding.mime_type};base64,{self.to_base64()}"
+
+    def get(self, name: str, default=None):
+        return self.metadata.get(name, default)
+
+    def __repr__(self):
+        return f"Page({self.page_number}, {self.size[0]}x{self.size[1]})"
@@ -1,72 +1,499 @@
 import base64
+import hashlib
 import logging
+import math
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
-from typing import List, Dict
-from pdf2image import convert_from_path
+from typing import List, Dict, Iterator, Iterable, Tuple
+import fitz
+import pymupdf4llm
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from util.page import Page, PageEncoding
+from util.metrics import metrics
 import os
 
 logger = logging.getLogger(__name__)
 
+# Links from a page to other pages, which rendering it does not need
+_PAGE_LINK_KEYS = {"/Parent", "/P", "/Dest", "/A", "/PA", "/Next", "/Prev", "/First", "/Last"}
+# Page attributes a page can inherit from its ancestors in the page tree
+_INHERITABLE_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+# Catalog entries the renderer reads when it opens the document (layers, form fields)
+_RENDER_CATALOG_KEYS = ("/OCProperties", "/AcroForm")
+
+def _target_zoom(width_pt: float, height_pt: float, max_pixels: int, max_dpi: int) -> float:
+    """Zoom factor (relative to 72 dpi) at which the page fills max_pixels without exceeding max_dpi."""
+    zoom = math.sqrt(max_pixels / max(width_pt * height_pt, 1.0))
+    return min(zoom, max_dpi / 72)
+
+
+def _render_range_pymupdf(pdf_path: str, first_page: int, last_page: int, max_pixels: int, max_dpi: int):
+    """Render a page range in a worker process; returns picklable (page_number, size, RGB bytes) tuples."""
+    rendered = []
+    with fitz.open(pdf_path) as doc:
+        for page_number in range(first_page, last_page + 1):
+            page = doc[page_number - 1]
+            zoom = _target_zoom(page.rect.width, page.rect.height, max_pixels, max_dpi)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False, colorspace=fitz.csRGB)
+            rendered.append((page_number, (pixmap.width, pixmap.height), pixmap.samples))
+    return rendered
+
+
+class PageRasterizer:
+    def __init__(self, backend: str = "pymupdf", workers: int = None, max_pixels: int = 768 * 28 * 28, max_dpi: int = 300):
+        """
+        Render PDF pages directly at the pixel budget the embedding processor uses.
+        The pymupdf backend renders page ranges in a process pool that is reused across
+        documents; the poppler backend uses pdf2image with poppler's own thread_count.
+        """
+        if backend not in ("pymupdf", "poppler"):
+            raise ValueError(f"Unsupported rasterization backend '{backend}'.")
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pixels = max_pixels
+        self.max_dpi = max_dpi
+        self._executor = None
+        logger.info(
+            f"Rasterizing with {backend} on {self.workers} workers, "
+            f"budget {max_pixels} pixels per page (max {max_dpi} dpi)."
+        )
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PageRasterizer":
+        rasterization = config.get("pdf_parser", {}).get("rasterization", {})
+        workers = rasterization.get("workers", "auto")
+        return cls(
+            backend=rasterization.get("backend", "pymupdf"),
+            workers=None if workers == "auto" else int(workers),
+            max_pixels=rasterization.get("max_pixels", 768 * 28 * 28),
+            max_dpi=rasterization.get("max_dpi", 300),
+        )
+
+    def render(self, pdf_path: str, page_ranges: Iterable[Tuple[int, int]]) -> Iterator[Page]:
+        """Yield rendered pages in page order for each (first, last) range."""
+        if self.backend == "pymupdf":
+            yield from self._render_pymupdf(pdf_path, page_ranges)
+        else:
+            yield from self._render_poppler(pdf_path, page_ranges)
+
+    def _render_pymupdf(self, pdf_path: str, page_ranges: Iterable[Tuple[int, int]]):
+        if self._executor is None:
+            # spawn keeps torch's threads out of the rendering processes
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+        # Bound the number of rendered ranges waiting to be consumed
+        pending = deque()
+        ranges = iter(page_ranges)
+        while True:
+            while len(pending) < self.workers * 2:
+                page_range = next(ranges, None)
+                if page_range is None:
+                    break
+                pending.append(self._executor.submit(
+                    _render_range_pymupdf, pdf_path, page_range[0], page_range[1], self.max_pixels, self.max_dpi
+                ))
+            if not pending:
+                return
+
+            for page_number, size, samples in pending.popleft().result():
+                # The raw pixmap samples become the page buffer as is, without a PIL copy
+                yield Page(page_number, size, samples)
+
+    def _render_poppler(self, pdf_path: str, page_ranges: Iterable[Tuple[int, int]]):
+        reader = PdfReader(pdf_path)
+        for first_page, last_page in page_ranges:
+            # One dpi per range, chosen so its largest page stays within the budget
+            largest_area = max(
+                float(reader.pages[n - 1].mediabox.width) * float(reader.pages[n - 1].mediabox.height)
+                for n in range(first_page, last_page + 1)
+            )
+            dpi = 72 * math.sqrt(self.max_pixels / max(largest_area, 1.0))
+            images = convert_from_path(
+                pdf_path,
+                dpi=min(dpi, self.max_dpi),
+                first_page=first_page,
+                last_page=last_page,
+                thread_count=self.workers,
+            )
+            for page_number, image in enumerate(images, start=first_page):
+                yield Page.from_image(page_number, image)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
 class PDFImageConverter:
-    def __init__(self, pdf_path: str, config: dict):
+    def __init__(
+        self,
+        pdf_path: str,
+        config: dict,
+        image_store=None,
+        document_id: str = None,
+        rasterizer: PageRasterizer = None,
+        download=None,
+    ):
+        """
+        download is the DownloadedPDF behind pdf_path when it may still be arriving: pages
+        are then rendered as soon as the objects they need are on disk (pymupdf backend),
+        while anything that reads the whole file waits for the download to finish.
+        Without a rasterizer the converter creates its own and shuts its process pool down on
+        close() (or when used as a context manager); a passed-in rasterizer stays open.
+        """
         self.pdf_path = pdf_path
+        self.download = download
         self.config = config
-        self.pdf_title = self._extract_pdf_title(pdf_path)
+        self.image_store = image_store
+        self._owns_rasterizer = rasterizer is None
+        self.rasterizer = rasterizer or PageRasterizer.from_config(config)
+        self.encoding = PageEncoding.from_config(config)
+        self.thumbnail_size = config.get("image_store", {}).get("thumbnail_size", 256)
+        text_layer = config["pdf_parser"].get("text_layer", {})
+        self.text_format = text_layer.get("format", "text")
+        self.text_max_chars = text_layer.get("max_chars", 20000)
+        with metrics.timer("title_extraction_seconds"):
+            self.pdf_title = self._extract_pdf_title(pdf_path, source=self._progressive_source())
+        self.document_id = document_id or self.pdf_title
         logger.info(f"Initialized PDFImageConverter with PDF: {pdf_path}")
 
+    def close(self):
+        if self._owns_rasterizer:
+            self.rasterizer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
     def convert_to_base64_images(self) -> List[Dict[str, str]]:
         """
-        Convert all PDF pages to base64-encoded PNG images.
+        Convert all PDF pages to base64-encoded images.
         Returns:
             List of dictionaries with keys based on config, plus base64_image.
         """
-        logger.info(f"Converting PDF to images: {self.pdf_path}")
+        base64_images = list(self.iter_base64_images())
+        logger.info(f"Successfully encoded {len(base64_images)} images to base64.")
+        return base64_images
+
+    def _wait_for_download(self):
+        if self.download is not None and not self.download.complete:
+            with metrics.timer("download_wait_seconds"):
+                self.download.wait()
+
+    def _progressive_source(self):
+        """File object over the partial download, or None once pdf_path can be read as a whole."""
+        if self.download is None or self.download.complete:
+            return None
+        if self.rasterizer.backend != "pymupdf":
+            # pdf2image reads the whole document up front
+            self._wait_for_download()
+            return None
+        return self.download.open()
+
+    def get_page_count(self) -> int:
         try:
-            images = convert_from_path(self.pdf_path)
-            logger.info(f"Converted {len(images)} pages to PIL images.")
+            source = self._progressive_source()
+            if source is not None:
+                # The page tree root has the count; no need to wait for the rest of the file
+                with source:
+                    return int(PdfReader(source).trailer["/Root"]["/Pages"]["/Count"])
+            return int(pdfinfo_from_path(self.pdf_path)["Pages"])
         except Exception:
-            logger.exception("Failed to convert PDF to images.")
+            logger.exception("Failed to read PDF page count.")
             raise
 
+    @staticmethod
+    def _page_object(reader: PdfReader, index: int):
+        """Walk the page tree down to one page, touching only the nodes on the way (unlike reader.pages)."""
+        node = reader.trailer["/Root"]["/Pages"].get_object()
+        while "/Kids" in node:
+            for kid in node["/Kids"]:
+                kid = kid.get_object()
+                count = kid.get("/Count", 1) if "/Kids" in kid else 1
+                if index < count:
+                    node = kid
+                    break
+                index -= count
+            else:
+                raise IndexError("Page index out of range.")
+        return node
+
+    def _fetch_pages(self, reader: PdfReader, first_page: int, last_page: int):
+        """Read every object the pages draw on, so their bytes are on disk before the rasterizer opens the file."""
+        roots = []
+        for page_number in range(first_page, last_page + 1):
+            node = self._page_object(reader, page_number - 1)
+            roots.append(node)
+            # Attributes inherited from the page tree are read from the ancestors themselves
+            parent = node.get("/Parent")
+            while parent is not None:
+                parent = parent.get_object()
+                roots.extend(parent[key] for key in _INHERITABLE_PAGE_KEYS if key in parent)
+                parent = parent.get("/Parent")
+        self._fetch_objects(roots)
+
+    def _fetch_catalog(self, reader: PdfReader):
+        """Read the document-level objects the renderer needs before any page."""
+        catalog = reader.trailer["/Root"].get_object()
+        self._fetch_objects([catalog[key] for key in _RENDER_CATALOG_KEYS if key in catalog])
+
+    @staticmethod
+    def _fetch_objects(roots: list):
+        """Resolve roots and everything they reference, skipping links to other pages."""
+        seen = set()
+        stack = list(roots)
+        while stack:
+            obj = stack.pop()
+            if isinstance(obj, IndirectObject):
+                if obj.idnum in seen:
+                    continue
+                seen.add(obj.idnum)
+                obj = obj.get_object()
+            if isinstance(obj, dict):
+                stack.extend(value for key, value in obj.items() if key not in _PAGE_LINK_KEYS)
+            elif isinstance(obj, list):
+                stack.extend(obj)
+
+    def _available_ranges(self, page_ranges: Iterable[Tuple[int, int]]) -> Iterator[Tuple[int, int]]:
+        """Hand out page ranges once their bytes have been downloaded; the rasterizer consumes these lazily."""
+        source = self._progressive_source()
+        if source is None:
+            yield from page_ranges
+            return
+
+        with source:
+            reader = PdfReader(source)
+            if not self.download.complete:
+                with metrics.timer("download_wait_seconds"):
+                    self._fetch_catalog(reader)
+            for first_page, last_page in page_ranges:
+                if not self.download.complete:
+                    with metrics.timer("download_wait_seconds"):
+                        self._fetch_pages(reader, first_page, last_page)
+                yield first_page, last_page
+
+    def compute_document_fingerprint(self) -> str:
+        self._wait_for_download()
+        digest = hashlib.sha256()
+        with open(self.pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def compute_page_fingerprints(self, page_numbers: Iterable[int] = None) -> Dict[int, str]:
+        """
+        Hash what determines each page's rendering without rasterising it:
+        page geometry and rotation, the content stream and every resource it can draw with
+        (XObjects, fonts, graphics states, colour spaces, patterns, shadings, ...), recursively.
+        Attributes inherited from the page tree count as the page's own.
+        Returns:
+            {page_number: fingerprint} for the requested 1-based pages (all pages when omitted).
+        """
+        self._wait_for_download()
         try:
-            # Extract property names from config
-            property_names = [p["name"] for p in self.config["weaviate"]["collection"]["properties"]]
+            reader = PdfReader(self.pdf_path)
+            if page_numbers is None:
+                page_numbers = range(1, len(reader.pages) + 1)
+            fingerprints = {
+                page_number: self._page_fingerprint(reader.pages[page_number - 1])
+                for page_number in page_numbers
+            }
+            logger.info(f"Computed fingerprints for {len(fingerprints)} pages.")
+            return fingerprints
+        except Exception:
+            logger.exception("Failed to compute page fingerprints.")
+            raise
 
-            base64_images = []
-            for idx, image in enumerate(images):
-                item = {}
+    def iter_pages(
+        self,
+        chunk_size: int = 4,
+        page_numbers: Iterable[int] = None,
+        page_metadata: Dict[int, Dict] = None,
+    ) -> Iterator[Page]:
+        """
+        Lazily render PDF pages in page-range chunks and yield them one at a time.
+        Pages carry their raw pixels; they are only encoded if the image store needs them.
+        Args:
+            page_numbers: 1-based pages to render; all pages when omitted.
+            page_metadata: Extra fields merged into the metadata of each page, keyed by page number.
+        Yields:
+            Pages whose metadata holds the properties named in the config.
+        """
+        if page_numbers is None:
+            page_numbers = range(1, self.get_page_count() + 1)
+        page_numbers = sorted(set(page_numbers))
+        page_metadata = page_metadata or {}
+        logger.info(f"Streaming {len(page_numbers)} pages from {self.pdf_path} in chunks of {chunk_size}.")
+
+        # Extract property names from config
+        property_names = [p["name"] for p in self.config["weaviate"]["collection"]["properties"]]
+        # The text layer is extracted only when the collection has a property for it;
+        # opened at the first page, once the objects it needs are on disk
+        extract_text = "page_text" in property_names
+        text_doc = None
+        page_ranges = self._available_ranges(self._page_ranges(page_numbers, chunk_size))
+
+        try:
+            render_start = time.perf_counter()
+            for page in self.rasterizer.render(self.pdf_path, page_ranges):
+                # Time spent waiting for this page from the rasterizer
+                metrics.observe("render_page_seconds", time.perf_counter() - render_start)
+                metrics.increment("pages_rendered")
+                logger.debug(f"Rendered page {page.page_number} at {page.width}x{page.height}.")
+                page.encoding = self.encoding
+                page.metadata.update(page_metadata.get(page.page_number, {}))
                 if "pdf_title" in property_names:
-                    item["pdf_title"] = self.pdf_title
+                    page.metadata["pdf_title"] = self.pdf_title
+                if "document_id" in property_names:
+                    page.metadata["document_id"] = self.document_id
                 if "page_number" in property_names:
-                    item["page_number"] = idx + 1
-
-                # Always include the base64 image
-                item["base64_image"] = self._pil_to_base64(image, page_number=idx + 1)
+                    page.metadata["page_number"] = page.page_number
+                if extract_text:
+                    if text_doc is None:
+                        text_doc = fitz.open(self.pdf_path)
+                    with metrics.timer("text_extraction_seconds"):
+                        page.metadata["page_text"] = self._extract_page_text(text_doc, page.page_number)
 
-                base64_images.append(item)
+                # Keep the full image in the page image store; Weaviate only gets a reference
+                if self.image_store is not None:
+                    if "image_ref" in property_names:
+                        encoded = page.encode()
+                        with metrics.timer("image_store_write_seconds"):
+                            page.metadata["image_ref"] = self.image_store.put(encoded, extension=self.encoding.extension)
+                        metrics.increment("image_store_bytes_written", len(encoded))
+                    if "thumbnail" in property_names:
+                        page.metadata["thumbnail"] = self._thumbnail_base64(page.image, self.thumbnail_size)
 
-            logger.info(f"Successfully encoded {len(base64_images)} images to base64.")
-            return base64_images
+                yield page
+                render_start = time.perf_counter()
         except Exception:
-            logger.exception("Failed to encode images to base64.")
+            logger.exception(f"Failed to render pages of {self.pdf_path}.")
             raise
+        finally:
+            if text_doc is not None:
+                text_doc.close()
+
+    def iter_base64_images(
+        self,
+        chunk_size: int = 4,
+        page_numbers: Iterable[int] = None,
+        page_metadata: Dict[int, Dict] = None,
+    ) -> Iterator[Dict[str, str]]:
+        """
+        Like iter_pages, but yield dictionaries with keys based on config, plus base64_image
+        in the configured image format.
+        """
+        for page in self.iter_pages(chunk_size=chunk_size, page_numbers=page_numbers, page_metadata=page_metadata):
+            item = dict(page.metadata)
+            item["base64_image"] = page.to_base64()
+            yield item
+
+    def _extract_page_text(self, text_doc, page_number: int) -> str:
+        """Text layer of one page, as plain text or markdown (pymupdf4llm); empty for scanned pages."""
+        if self.text_format == "markdown":
+            text = pymupdf4llm.to_markdown(text_doc, pages=[page_number - 1], show_progress=False)
+        else:
+            text = " ".join(text_doc[page_number - 1].get_text("text").split())
+        return text[: self.text_max_chars]
+
+    @staticmethod
+    def _page_ranges(page_numbers: List[int], chunk_size: int) -> Iterator[Tuple[int, int]]:
+        """Group sorted page numbers into contiguous (first, last) ranges of at most chunk_size pages."""
+        first_page = None
+        last_page = None
+        for page_number in page_numbers:
+            if first_page is not None and page_number == last_page + 1 and page_number - first_page < chunk_size:
+                last_page = page_number
+                continue
+            if first_page is not None:
+                yield first_page, last_page
+            first_page = last_page = page_number
+        if first_page is not None:
+            yield first_page, last_page
+
+    @staticmethod
+    def _page_fingerprint(page) -> str:
+        digest = hashlib.sha256()
+        seen = set()
+        for key in _INHERITABLE_PAGE_KEYS:
+            digest.update(key.encode("utf-8"))
+            PDFImageConverter._hash_pdf_object(digest, PDFImageConverter._inherited(page, key), seen)
+
+        # /Contents is one stream or an array of streams
+        PDFImageConverter._hash_pdf_object(digest, page.get("/Contents"), seen)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _inherited(page, key: str):
+        """A page attribute, looked up through the /Parent chain when the page does not set it."""
+        node = page
+        while node is not None:
+            node = node.get_object()
+            if key in node:
+                return node[key]
+            node = node.get("/Parent")
+        return None
+
+    @staticmethod
+    def _hash_pdf_object(digest, value, seen: set):
+        """
+        Feed a PDF object and everything it references into digest, in a deterministic order.
+        Streams contribute their dictionary and data, so a Form XObject pulls in its own
+        /Resources and a font its embedded program. Shared objects are hashed once.
+        """
+        if isinstance(value, IndirectObject):
+            reference = (value.idnum, value.generation)
+            digest.update(repr(reference).encode("utf-8"))
+            if reference in seen:
+                return
+            seen.add(reference)
+            value = value.get_object()
+
+        if isinstance(value, DictionaryObject):
+            for key in sorted(value):
+                if key in _PAGE_LINK_KEYS:
+                    continue
+                digest.update(key.encode("utf-8"))
+                PDFImageConverter._hash_pdf_object(digest, value[key], seen)
+            if isinstance(value, StreamObject):
+                try:
+                    digest.update(value.get_data())
+                except NotImplementedError:
+                    # Filter PyPDF2 cannot decode; the dictionary (length, size) still changes with the data
+                    pass
+        elif isinstance(value, ArrayObject):
+            for item in value:
+                PDFImageConverter._hash_pdf_object(digest, item, seen)
+        elif value is not None:
+            digest.update(repr(value).encode("utf-8"))
 
     @staticmethod
-    def _pil_to_base64(image: Image.Image, page_number: int = None) -> str:
+    def _thumbnail_base64(image: Image.Image, max_size: int) -> str:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((max_size, max_size))
         buffer = BytesIO()
-        image.save(buffer, format="PNG")
-        base64_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        if page_number is not None:
-            logger.debug(f"Converted page {page_number} to base64.")
-        return base64_str
+        thumbnail.convert("RGB").save(buffer, format="JPEG", quality=70)
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
 
     @staticmethod
-    def _extract_pdf_title(pdf_path: str) -> str:
+    def _extract_pdf_title(pdf_path: str, source=None) -> str:
         try:
-            reader = PdfReader(pdf_path)
-            title = reader.metadata.get("/Title", "").strip()
+            if source is not None:
+                with source:
+                    title = PdfReader(source).metadata.get("/Title", "").strip()
+            else:
+                title = PdfReader(pdf_path).metadata.get("/Title", "").strip()
             if title.lower() not in {"", "untitled", "unknown"}:
                 return title
         except Exception:
@@ -1,9 +1,15 @@
+import hashlib
 import logging
-from typing import List
+import re
+import time
+from typing import Dict, Iterable, List, Optional
 import weaviate
 import weaviate.classes.config as wc
 from weaviate.util import generate_uuid5
 from weaviate.classes.config import Configure
+from weaviate.classes.query import Filter
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+from util.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +18,15 @@ class WeaviateCollectionManager:
         self.client = None
         self.config = config
 
+        # Tenant per document or per customer (the leading segments of the S3 key)
+        tenancy = config["weaviate"]["collection"].get("multi_tenancy", {})
+        self.multi_tenancy = tenancy.get("enabled", False)
+        self.tenant_key = tenancy.get("tenant_key", "document")
+        self.customer_key_depth = tenancy.get("customer_key_depth", 1)
+        if self.tenant_key not in ("document", "customer"):
+            raise ValueError(f"Unsupported tenant key '{self.tenant_key}'.")
+        self._known_tenants = set()
+
     def connect(self, connection_type, host: str = "http://localhost:8080", port="8080", api_key: str = None):
         try:
             if connection_type == 'local':
@@ -51,46 +66,172 @@ class WeaviateCollectionManager:
         vectorizer = self.config["weaviate"]["collection"].get("vectorizer", {})
 
         properties = [
-            wc.Property(name=prop["name"], data_type=getattr(wc.DataType, prop["type"]))
+            wc.Property(
+                name=prop["name"],
+                data_type=getattr(wc.DataType, prop["type"]),
+                tokenization=getattr(wc.Tokenization, prop["tokenization"]) if "tokenization" in prop else None,
+                # Unset flags keep Weaviate's defaults; disabling unused indexes saves memory
+                index_filterable=prop.get("filterable"),
+                index_searchable=prop.get("searchable"),
+                index_range_filters=prop.get("range_filters"),
+            )
             for prop in props
         ]
 
+        multi_tenancy_config = None
+        if self.multi_tenancy:
+            tenancy = self.config["weaviate"]["collection"]["multi_tenancy"]
+            multi_tenancy_config = Configure.multi_tenancy(
+                enabled=True,
+                auto_tenant_creation=tenancy.get("auto_tenant_creation", True),
+                auto_tenant_activation=tenancy.get("auto_tenant_activation", True),
+            )
+
         vectorizer_config = []
         if vectorizer.get("type") == "none":
-            mv_enabled = vectorizer.get("multi_vector", False)
             vectorizer_config = [
                 Configure.NamedVectors.none(
                     name=vectorizer["name"],
-                    vector_index_config=Configure.VectorIndex.hnsw(
-                        multi_vector=Configure.VectorIndex.MultiVector.multi_vector() if mv_enabled else None
-                    )
+                    vector_index_config=self._vector_index_config(vectorizer),
                 )
             ]
 
         self.client.collections.create(
             name=collection_name,
             properties=properties,
-            vectorizer_config=vectorizer_config
+            vectorizer_config=vectorizer_config,
+            multi_tenancy_config=multi_tenancy_config,
+        )
+
+        logging.info(
+            f"Collection '{collection_name}' created successfully"
+            f"{f' with a tenant per {self.tenant_key}' if self.multi_tenancy else ''}."
         )
 
-        logging.info(f"Collection '{collection_name}' created successfully.")
+    @staticmethod
+    def _vector_index_config(vectorizer: dict):
+        """
+        Build the HNSW index config from the vectorizer section of the config.
+        Optional keys: hnsw (index parameters), multi_vector_encoding (e.g. MUVERA)
+        and quantizer (pq, bq or sq with their parameters).
+        """
+        multi_vector = None
+        if vectorizer.get("multi_vector", False):
+            encoding = None
+            encoding_config = dict(vectorizer.get("multi_vector_encoding") or {})
+            encoding_type = encoding_config.pop("type", None)
+            if encoding_type == "muvera":
+                encoding = Configure.VectorIndex.MultiVector.Encoding.muvera(**encoding_config)
+            elif encoding_type is not None:
+                raise ValueError(f"Unsupported multi-vector encoding '{encoding_type}'.")
+            multi_vector = Configure.VectorIndex.MultiVector.multi_vector(encoding=encoding)
+
+        quantizer = None
+        quantizer_config = dict(vectorizer.get("quantizer") or {})
+        quantizer_type = quantizer_config.pop("type", None)
+        if quantizer_type in ("pq", "bq", "sq"):
+            quantizer = getattr(Configure.VectorIndex.Quantizer, quantizer_type)(**quantizer_config)
+        elif quantizer_type is not None:
+            raise ValueError(f"Unsupported quantizer '{quantizer_type}'.")
+
+        logger.info(
+            f"Vector index: multi-vector encoding {vectorizer.get('multi_vector_encoding', {}).get('type', 'none')}, "
+            f"quantizer {quantizer_type or 'none'}."
+        )
+        return Configure.VectorIndex.hnsw(
+            multi_vector=multi_vector,
+            quantizer=quantizer,
+            **vectorizer.get("hnsw", {}),
+        )
 
-    def get_collection(self, collection_name: str = None):
+    @staticmethod
+    def tenant_name(key: str) -> str:
+        """Weaviate tenant names are [A-Za-z0-9_-]{1,64}; keep a readable prefix and make it unique with a hash."""
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        readable = re.sub(r"[^A-Za-z0-9_-]+", "_", key).strip("_")[:47]
+        return f"{readable}-{digest}" if readable else digest
+
+    def tenant_for(self, document_id: str) -> Optional[str]:
+        """Tenant holding the document's pages, or None when multi-tenancy is disabled."""
+        if not self.multi_tenancy or document_id is None:
+            return None
+        if self.tenant_key == "customer":
+            segments = document_id.split("/")
+            # Keys without a customer prefix all share one tenant
+            key = "/".join(segments[:self.customer_key_depth]) if len(segments) > self.customer_key_depth else "default"
+            return self.tenant_name(key)
+        return self.tenant_name(document_id)
+
+    def tenants_for(self, document_ids: Iterable[str]) -> List[str]:
+        return list(dict.fromkeys(self.tenant_for(document_id) for document_id in document_ids))
+
+    def get_collection(self, collection_name: str = None, tenant: str = None):
         if self.client is None:
             raise RuntimeError("Client not connected")
 
         try:
             if collection_name is None:
-                collection_name = self.config["collection"]["name"]
+                collection_name = self.config["weaviate"]["collection"]["name"]
 
             collection = self.client.collections.get(collection_name)
-            logger.info(f"Retrieved collection '{collection_name}'.")
+            if tenant is not None:
+                collection = collection.with_tenant(tenant)
+            logger.info(f"Retrieved collection '{collection_name}'{f' for tenant {tenant}' if tenant else ''}.")
             return collection
         except Exception as e:
             logger.exception(f"Failed to retrieve collection '{collection_name}'.")
             raise
 
-    def insert_object(self, properties: dict, embedding: list = None):
+    def _collection(self, tenant: str = None):
+        collection = self.client.collections.get(self.config["weaviate"]["collection"]["name"])
+        return collection.with_tenant(tenant) if tenant is not None else collection
+
+    def tenant_exists(self, tenant: str) -> bool:
+        if tenant in self._known_tenants:
+            return True
+        exists = self._collection().tenants.exists(tenant)
+        if exists:
+            self._known_tenants.add(tenant)
+        return exists
+
+    def ensure_tenant(self, tenant: str):
+        """Create the tenant unless it exists; auto tenant creation only covers inserts."""
+        if tenant is None or self.tenant_exists(tenant):
+            return
+        try:
+            self._collection().tenants.create([Tenant(name=tenant)])
+            self._known_tenants.add(tenant)
+            logger.info(f"Created tenant '{tenant}'.")
+        except Exception:
+            # Another worker may have created it in the meantime
+            if not self._collection().tenants.exists(tenant):
+                logger.exception(f"Failed to create tenant '{tenant}'.")
+                raise
+            self._known_tenants.add(tenant)
+
+    def set_tenant_status(self, tenants: List[str], status: str = "INACTIVE") -> int:
+        """
+        Change the activity status of tenants: ACTIVE, INACTIVE (kept on disk, out of memory)
+        or OFFLOADED (moved to cloud storage; needs an offload module on the Weaviate side).
+        Inactive tenants are reactivated on access when auto tenant activation is enabled.
+        """
+        if self.client is None:
+            raise RuntimeError("Client not connected")
+        if not tenants:
+            return 0
+
+        activity_status = getattr(TenantActivityStatus, status.upper())
+        try:
+            self._collection().tenants.update(
+                [Tenant(name=tenant, activity_status=activity_status) for tenant in tenants]
+            )
+            logger.info(f"Set {len(tenants)} tenants to {status.upper()}.")
+            return len(tenants)
+        except Exception:
+            logger.exception(f"Failed to set tenants to {status.upper()}.")
+            raise
+
+    def insert_object(self, properties: dict, embedding: list = None, tenant: str = None):
         if self.client is None:
             raise RuntimeError("Client not connected")
 
@@ -99,7 +240,8 @@ class WeaviateCollectionManager:
             vectorizer = self.config["weaviate"]["collection"].get("vectorizer", {})
             vector_name = vectorizer.get("name") if vectorizer.get("type") == "none" else None
 
-            collection = self.client.collections.get(collection_name)
+            tenant = tenant or self.tenant_for(properties.get("document_id"))
+            collection = self._collection(tenant)
 
             insert_kwargs = {
                 "properties": properties,
@@ -107,7 +249,7 @@ class WeaviateCollectionManager:
 
             insert_kwargs["uuid"] = generate_uuid5(properties)
 
-            if embedding and vector_name:
+            if embedding is not None and vector_name:
                 insert_kwargs["vector"] = {
                     vector_name: embedding
                 }
@@ -116,11 +258,176 @@ class WeaviateCollectionManager:
             logger.info(f"Inserted object with UUID {insert_kwargs['uuid']} into collection '{collection_name}'.")
         except Exception:
             logger.exception("Failed to insert object into Weaviate.")
-            self.close()
             raise
 
+    def fetch_document_pages(self, document_id: str, limit: int = 10000) -> Dict[str, int]:
+        """Return {uuid: page_number} for every object stored for the document, in a single query."""
+        if self.client is None:
+            raise RuntimeError("Client not connected")
+
+        try:
+            tenant = self.tenant_for(document_id)
+            if tenant is not None and not self.tenant_exists(tenant):
+                # Querying a tenant that was never written to is an error, not an empty result
+                logger.info(f"No tenant yet for document '{document_id}'.")
+                return {}
+
+            response = self._collection(tenant).query.fetch_objects(
+                filters=Filter.by_property("document_id").equal(document_id),
+                return_properties=["page_number"],
+                limit=limit,
+            )
+            pages = {str(obj.uuid): obj.properties.get("page_number") for obj in response.objects}
+            logger.info(f"Found {len(pages)} existing objects for document '{document_id}'.")
+            return pages
+        except Exception:
+            logger.exception(f"Failed to fetch existing objects for document '{document_id}'.")
+            raise
+
+    def delete_objects(self, uuids: List[str], tenant: str = None) -> int:
+        if self.client is None:
+            raise RuntimeError("Client not connected")
+        if not uuids:
+            return 0
+
+        collection_name = self.config["weaviate"]["collection"]["name"]
+        try:
+            collection = self._collection(tenant)
+            result = collection.data.delete_many(where=Filter.by_id().contains_any(list(uuids)))
+            logger.info(f"Deleted {result.successful} objects from collection '{collection_name}'.")
+            return result.successful
+        except Exception:
+            logger.exception("Failed to delete objects from Weaviate.")
+            raise
+
+    def batch_writer(self, tenant: str = None) -> "WeaviateBatchWriter":
+        """
+        Return a context manager that streams objects into the collection via the batch API.
+        Batch mode, size, concurrency and retries are read from weaviate.batch in the config.
+        With multi-tenancy, every object goes to the given tenant.
+        """
+        if self.client is None:
+            raise RuntimeError("Client not connected")
+
+        vectorizer = self.config["weaviate"]["collection"].get("vectorizer", {})
+        vector_name = vectorizer.get("name") if vectorizer.get("type") == "none" else None
+        self.ensure_tenant(tenant)
+
+        return WeaviateBatchWriter(
+            collection=self._collection(tenant),
+            vector_name=vector_name,
+            batch_config=self.config["weaviate"].get("batch", {}),
+        )
+
     def close(self):
         if self.client:
             self.client.close()
             self.client = None
             logging.info("Weaviate connection closed.")
+
+
+class WeaviateBatchWriter:
+    def __init__(self, collection, vector_name: str = None, batch_config: dict = None):
+        """Buffer objects into client-side batches and retry the ones Weaviate rejects."""
+        batch_config = batch_config or {}
+        self.collection = collection
+        self.vector_name = vector_name
+        self.mode = batch_config.get("mode", "fixed_size")
+        self.batch_size = batch_config.get("batch_size", 64)
+        self.concurrent_requests = batch_config.get("concurrent_requests", 2)
+        self.max_retries = batch_config.get("max_retries", 3)
+        self.retry_backoff_seconds = batch_config.get("retry_backoff_seconds", 1.0)
+
+        self.added = 0
+        self.failed_objects = []
+        self._context = None
+        self._batch = None
+
+    def _open_batch(self):
+        if self.mode == "dynamic":
+            return self.collection.batch.dynamic()
+        if self.mode == "fixed_size":
+            return self.collection.batch.fixed_size(
+                batch_size=self.batch_size,
+                concurrent_requests=self.concurrent_requests,
+            )
+        raise ValueError(f"Unsupported batch mode '{self.mode}'.")
+
+    def __enter__(self):
+        self._context = self._open_batch()
+        self._batch = self._context.__enter__()
+        logger.info(
+            f"Opened {self.mode} batch on collection '{self.collection.name}' "
+            f"(batch size {self.batch_size}, concurrency {self.concurrent_requests})."
+        )
+        return self
+
+    def add(self, properties: dict, embedding=None, uuid: str = None) -> str:
+        """
+        Queue an object for insertion and return its UUID.
+        The embedding may be a NumPy array; the client serialises it directly.
+        """
+        if self._batch is None:
+            raise RuntimeError("Batch writer is not open")
+
+        uuid = uuid or generate_uuid5(properties)
+        vector = {self.vector_name: embedding} if embedding is not None and self.vector_name else None
+        self._batch.add_object(properties=properties, uuid=uuid, vector=vector)
+        self.added += 1
+        metrics.increment("weaviate_bytes_written", self._payload_bytes(properties, embedding))
+        return uuid
+
+    @staticmethod
+    def _payload_bytes(properties: dict, embedding) -> int:
+        """Approximate size of the object on the wire: vector bytes plus property values."""
+        size = getattr(embedding, "nbytes", 0)
+        for value in properties.values():
+            if isinstance(value, str):
+                size += len(value.encode("utf-8"))
+            elif value is not None:
+                size += 8
+        return size
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Leaving the context waits for the batches still in flight
+        with metrics.timer("weaviate_flush_seconds"):
+            self._context.__exit__(exc_type, exc_value, traceback)
+        self._batch = None
+
+        failed = list(self.collection.batch.failed_objects)
+        for attempt in range(1, self.max_retries + 1):
+            if not failed:
+                break
+
+            delay = self.retry_backoff_seconds * (2 ** (attempt - 1))
+            logger.warning(
+                f"{len(failed)} objects failed, retrying in {delay:.1f}s "
+                f"(attempt {attempt}/{self.max_retries})."
+            )
+            time.sleep(delay)
+
+            with self._open_batch() as batch:
+                for error in failed:
+                    batch.add_object(
+                        properties=error.object_.properties,
+                        uuid=error.object_.uuid,
+                        vector=error.object_.vector,
+                    )
+            failed = list(self.collection.batch.failed_objects)
+
+        self.failed_objects = failed
+        metrics.increment("weaviate_objects_failed", len(failed))
+        self.log_summary()
+        return False
+
+    @property
+    def inserted(self) -> int:
+        return self.added - len(self.failed_objects)
+
+    def log_summary(self):
+        logger.info(
+            f"Batch insert finished: {self.inserted}/{self.added} objects written "
+            f"to collection '{self.collection.name}'."
+        )
+        for error in self.failed_objects:
+            logger.error(f"Failed to insert object {error.original_uuid}: {error.message}")